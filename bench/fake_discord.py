@@ -0,0 +1,337 @@
+""" <summary>
+In-process stand-in for Discord: an aiohttp server that answers the REST
+routes the cogs use (with a configurable round trip), and a "gateway" that
+feeds raw event payloads straight into discord.py's parsers, so listeners,
+views and caches run exactly as in production.
+</summary> """
+
+import asyncio
+import itertools
+import json
+import re
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+import discord
+from aiohttp import web
+
+from utils.metrics import route_of
+
+BOT_ID = 900000000000000001
+APP_ID = BOT_ID
+OWNER_ID = 900000000000000002
+
+# channel types
+TEXT, VOICE, CATEGORY = 0, 2, 4
+
+Listener = Callable[[str, str, Any], None]
+
+_ids = itertools.count(1000000000000000000)
+
+
+def next_id() -> int:
+    return next(_ids)
+
+
+# ---------- payloads ----------
+def user(user_id: int, name: Optional[str] = None, bot: bool = False) -> Dict[str, Any]:
+    return {
+        "id": str(user_id),
+        "username": name or f"user{user_id % 100000}",
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": None,
+        "bot": bot,
+    }
+
+
+def member(user_id: int, name: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "user": user(user_id, name, bot=user_id == BOT_ID),
+        "roles": [],
+        "joined_at": "2024-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def channel(channel_id: int, guild_id: int, type: int = TEXT, name: str = "channel",
+            parent_id: Optional[int] = None, overwrites: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    return {
+        "id": str(channel_id),
+        "guild_id": str(guild_id),
+        "type": type,
+        "name": name,
+        "position": 0,
+        "parent_id": str(parent_id) if parent_id else None,
+        "permission_overwrites": overwrites or [],
+        "nsfw": False,
+        "bitrate": 64000,
+        "user_limit": 0,
+        "rate_limit_per_user": 0,
+    }
+
+
+def guild(guild_id: int, channels: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "id": str(guild_id),
+        "name": f"guild{guild_id % 1000}",
+        "owner_id": str(OWNER_ID),
+        "roles": [{
+            "id": str(guild_id), "name": "@everyone", "permissions": "104324673", "position": 0,
+            "color": 0, "hoist": False, "managed": False, "mentionable": False, "flags": 0,
+        }],
+        "channels": channels,
+        "members": [member(BOT_ID, "bench-bot")],
+        "voice_states": [],
+        "member_count": 1,
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "premium_tier": 0,
+        "unavailable": False,
+    }
+
+
+def message(message_id: int, channel_id: int, content: str = "", embeds: Optional[List[Any]] = None,
+            components: Optional[List[Any]] = None, flags: int = 0) -> Dict[str, Any]:
+    return {
+        "id": str(message_id),
+        "channel_id": str(channel_id),
+        "author": user(BOT_ID, "bench-bot", bot=True),
+        "content": content,
+        "timestamp": "2024-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": embeds or [],
+        "components": components or [],
+        "pinned": False,
+        "type": 0,
+        "flags": flags,
+    }
+
+
+# ---------- REST ----------
+class FakeDiscord:
+    """
+    Answers after `rtt` seconds like a remote API would. Every request is
+    counted by route, and listeners see (method, path, json body) so a
+    scenario can time the effect of the event it injected. Side effects that
+    Discord would announce over the gateway (new channel, member moved) are
+    echoed through `gateway`.
+    """
+
+    def __init__(self, rtt: float = 0.0):
+        self.rtt = rtt
+        self.calls: Counter = Counter()
+        self.listeners: List[Listener] = []
+        self.gateway: Optional["FakeGateway"] = None
+        self.channels: Dict[int, Dict[str, Any]] = {}  # created through the API
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_route("*", "/api/v10/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+        self.url = f"http://127.0.0.1:{port}"
+        # every discord.py REST call goes here instead of discord.com
+        discord.http.Route.BASE = f"{self.url}/api/v10"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        path = "/" + request.match_info["path"]
+        body: Any = None
+        if request.can_read_body:
+            if request.content_type == "application/json":
+                body = await request.json()
+            else:
+                # multipart (files) — the cogs only send JSON
+                await request.read()
+        self.calls[f"{request.method} {route_of(path)}"] += 1
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        for listener in self.listeners:
+            listener(request.method, path, body)
+        result = self._route(request.method, path, request.query, body or {})
+        if result is None:
+            return web.Response(status=204)
+        # discord.py parses JSON only for exactly "application/json", without a charset
+        return web.Response(body=json.dumps(result).encode(), headers={"Content-Type": "application/json"})
+
+    def _route(self, method: str, path: str, query: Any, body: Dict[str, Any]) -> Optional[Any]:
+        parts = path.strip("/").split("/")
+        if path == "/users/@me":
+            return user(BOT_ID, "bench-bot", bot=True)
+        if path == "/oauth2/applications/@me":
+            return {
+                "id": str(APP_ID), "name": "bench", "description": "", "icon": None, "bot_public": False,
+                "bot_require_code_grant": False, "owner": user(OWNER_ID, "owner"), "verify_key": "0",
+                "flags": 0, "interactions_endpoint_url": None,
+            }
+
+        # /channels/{id}/messages[/{id}]
+        if len(parts) >= 3 and parts[0] == "channels" and parts[2] == "messages":
+            channel_id = int(parts[1])
+            if method == "POST":
+                return message(next_id(), channel_id, body.get("content") or "", body.get("embeds"))
+            if method == "PATCH":
+                return message(int(parts[3]), channel_id, body.get("content") or "", body.get("embeds"))
+            return None
+
+        # /guilds/{id}/channels: a new room
+        if len(parts) == 3 and parts[0] == "guilds" and parts[2] == "channels" and method == "POST":
+            data = channel(next_id(), int(parts[1]), body.get("type", TEXT), body.get("name", "channel"),
+                           int(body["parent_id"]) if body.get("parent_id") else None,
+                           body.get("permission_overwrites"))
+            self.channels[int(data["id"])] = data
+            self._echo("CHANNEL_CREATE", data)
+            return data
+
+        # /channels/{id}: edit / delete a channel
+        if len(parts) == 2 and parts[0] == "channels":
+            channel_id = int(parts[1])
+            data = self.channels.get(channel_id) or channel(channel_id, 0)
+            if method == "PATCH":
+                data = dict(data, **{k: v for k, v in body.items() if k in ("name", "permission_overwrites", "parent_id")})
+                self.channels[channel_id] = data
+                self._echo("CHANNEL_UPDATE", data)
+            elif method == "DELETE":
+                self.channels.pop(channel_id, None)
+                self._echo("CHANNEL_DELETE", data)
+            return data
+
+        # /guilds/{id}/members/{id}: move to a voice channel
+        if len(parts) == 4 and parts[0] == "guilds" and parts[2] == "members" and method == "PATCH":
+            guild_id, user_id = int(parts[1]), int(parts[3])
+            if "channel_id" in body:
+                self._echo("VOICE_STATE_UPDATE", voice_state(guild_id, user_id, body["channel_id"]))
+            return member(user_id)
+
+        # /interactions/{id}/{token}/callback
+        if len(parts) == 4 and parts[0] == "interactions" and parts[3] == "callback":
+            kind = body.get("type")
+            response: Dict[str, Any] = {"interaction": {
+                "id": parts[1], "type": 3, "response_message_id": None,
+                "response_message_loading": kind == 5, "response_message_ephemeral": True,
+            }}
+            if kind in (4, 7):
+                data = body.get("data") or {}
+                msg = message(next_id(), 0, data.get("content") or "", data.get("embeds"), data.get("components"), 64)
+                response["interaction"]["response_message_id"] = msg["id"]
+                response["resource"] = {"type": kind, "message": msg}
+            return response
+
+        # /webhooks/{app}/{token}[/messages/{id}]: interaction followups
+        if parts[0] == "webhooks":
+            if len(parts) == 3 and method == "POST":
+                return message(next_id(), 0, body.get("content") or "", body.get("embeds"), flags=body.get("flags", 0))
+            if len(parts) == 5 and method == "PATCH":
+                return message(int(parts[4]), 0, body.get("content") or "", body.get("embeds"))
+            return None
+
+        self.calls["unhandled"] += 1
+        return {}
+
+    def _echo(self, event: str, data: Dict[str, Any]) -> None:
+        if self.gateway is not None:
+            # Discord announces the change shortly after the REST response
+            asyncio.get_running_loop().call_later(self.rtt / 2, self.gateway.dispatch, event, data)
+
+
+def voice_state(guild_id: int, user_id: int, channel_id: Optional[Any]) -> Dict[str, Any]:
+    return {
+        "guild_id": str(guild_id),
+        "channel_id": str(channel_id) if channel_id else None,
+        "user_id": str(user_id),
+        "member": member(user_id),
+        "session_id": "bench",
+        "deaf": False,
+        "mute": False,
+        "self_deaf": False,
+        "self_mute": False,
+        "self_video": False,
+        "suppress": False,
+        "request_to_speak_timestamp": None,
+    }
+
+
+# ---------- gateway ----------
+class FakeGateway:
+    """Events go through ConnectionState's parsers — the same path as a websocket message."""
+
+    def __init__(self, client: discord.Client):
+        self.client = client
+        self.state = client._connection
+        self.events: Counter = Counter()
+
+    def dispatch(self, event: str, data: Dict[str, Any]) -> None:
+        self.events[event] += 1
+        self.state.parsers[event](data)
+
+    def guild_create(self, data: Dict[str, Any]) -> None:
+        self.dispatch("GUILD_CREATE", data)
+
+    def voice_state(self, guild_id: int, user_id: int, channel_id: Optional[int]) -> None:
+        self.dispatch("VOICE_STATE_UPDATE", voice_state(guild_id, user_id, channel_id))
+
+    def member_join(self, guild_id: int, user_id: int) -> None:
+        self.dispatch("GUILD_MEMBER_ADD", dict(member(user_id), guild_id=str(guild_id)))
+
+    def component(self, guild_id: int, channel_id: int, user_id: int, custom_id: str, component_type: int,
+                  values: Optional[List[str]] = None, components: Optional[List[Any]] = None) -> int:
+        """Interaction on a component of an ephemeral message; returns the interaction ID."""
+        interaction_id = next_id()
+        data: Dict[str, Any] = {"custom_id": custom_id, "component_type": component_type}
+        if values is not None:
+            data["values"] = values
+        self.dispatch("INTERACTION_CREATE", {
+            "id": str(interaction_id),
+            "application_id": str(APP_ID),
+            "type": 3,
+            "token": token_of(interaction_id),
+            "version": 1,
+            "guild_id": str(guild_id),
+            "channel_id": str(channel_id),
+            "channel": {"id": str(channel_id), "type": TEXT, "guild_id": str(guild_id), "name": "channel"},
+            "member": dict(member(user_id), permissions="104324673"),
+            "data": data,
+            "message": message(next_id(), channel_id, components=components, flags=64),
+            "app_permissions": "104324673",
+            "locale": "ru",
+            "guild_locale": "ru",
+            "entitlements": [],
+            "authorizing_integration_owners": {"0": str(guild_id)},
+            "context": 0,
+            "attachment_size_limit": 10485760,
+        })
+        return interaction_id
+
+
+def token_of(interaction_id: int) -> str:
+    # longer than 32 characters, like a real one, so route_of hides it
+    return f"bench-interaction-token-{interaction_id}"
+
+
+def interaction_id_of(path: str) -> Optional[int]:
+    """Interaction of a callback or followup (webhook) request, from its token."""
+    match = re.search(r"/bench-interaction-token-(\d+)(?:/|$)", path)
+    return int(match.group(1)) if match else None
+
+
+def now() -> float:
+    return time.perf_counter()
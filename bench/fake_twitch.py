@@ -0,0 +1,188 @@
+""" <summary>
+In-process stand-in for Twitch: the Helix endpoints the Twitch cog polls
+(streams, users), the OAuth token/validate endpoints used by twitchAPI and
+an EventSub WebSocket (welcome, keepalive, notification, session_reconnect)
+with its subscription endpoint. Which streamers are live, and when events
+and reconnects are sent, is controlled by the scenario.
+</summary> """
+
+import asyncio
+import itertools
+import random
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
+
+from aiohttp import web
+
+
+class FakeTwitch:
+    def __init__(self, streamer_ids: List[str], rtt: float = 0.0, seed: int = 0):
+        self.streamer_ids = streamer_ids
+        self.rtt = rtt
+        self.live: Set[str] = set()
+        self.calls: Counter = Counter()
+        self._rng = random.Random(seed)
+        self._stream_ids: Dict[str, str] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+        # EventSub: open connections, oldest first; the newest one gets the messages
+        self.keepalive = 10
+        self.subscriptions: Dict[str, Dict[str, Any]] = {}
+        self._sockets: List[web.WebSocketResponse] = []
+        self._session_ids: Dict[web.WebSocketResponse, str] = {}
+        self._ids = itertools.count(1)
+
+    # ---------- scenario control ----------
+    def flap(self, fraction: float) -> int:
+        """Toggle live/offline for a random `fraction` of streamers; returns how many changed."""
+        changed = self._rng.sample(self.streamer_ids, int(len(self.streamer_ids) * fraction))
+        for user_id in changed:
+            if user_id in self.live:
+                self.live.discard(user_id)
+            else:
+                self.live.add(user_id)
+                self._stream_ids[user_id] = str(self._rng.getrandbits(40))
+        return len(changed)
+
+    async def notify(self, event_type: str, event: Dict[str, Any]) -> bool:
+        """One EventSub notification on the current connection; False if there is none to send it on."""
+        return await self._send_ws("notification", {
+            "subscription": {"id": str(next(self._ids)), "type": event_type, "status": "enabled"},
+            "event": event,
+        })
+
+    async def reconnect(self) -> bool:
+        """session_reconnect: the client must connect to the URL and close this connection itself."""
+        session_id = self._session_ids[self._sockets[-1]] if self._sockets else None
+        return await self._send_ws("session_reconnect", {
+            "session": {"id": session_id, "status": "reconnecting",
+                        "reconnect_url": f"{self.eventsub_url}?reconnect={session_id}"},
+        })
+
+    # ---------- server ----------
+    @property
+    def eventsub_url(self) -> str:
+        return self.url.replace("http://", "ws://", 1) + "/eventsub"
+
+    @property
+    def helix_url(self) -> str:
+        return f"{self.url}/helix/"
+
+    @property
+    def auth_url(self) -> str:
+        return f"{self.url}/oauth2/"
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/helix/streams", self._streams)
+        app.router.add_get("/helix/users", self._users)
+        app.router.add_post("/oauth2/token", self._token)
+        app.router.add_get("/oauth2/validate", self._validate)
+        app.router.add_get("/eventsub", self._eventsub)
+        app.router.add_post("/helix/eventsub/subscriptions", self._subscribe)
+        app.router.add_delete("/helix/eventsub/subscriptions", self._unsubscribe)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]  # type: ignore[union-attr]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _reply(self, name: str, payload: Any) -> web.Response:
+        self.calls[name] += 1
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+        headers = {"Ratelimit-Limit": "800", "Ratelimit-Remaining": "799"}
+        return web.json_response(payload, headers=headers)
+
+    async def _streams(self, request: web.Request) -> web.Response:
+        ids = request.query.getall("user_id", [])
+        data = [self._stream(user_id) for user_id in ids if user_id in self.live]
+        return await self._reply("GET /helix/streams", {"data": data, "pagination": {}})
+
+    async def _users(self, request: web.Request) -> web.Response:
+        ids = request.query.getall("id", [])
+        logins = request.query.getall("login", [])
+        data = [self._user(user_id) for user_id in ids]
+        data += [self._user(login[len("streamer"):]) for login in logins if login.startswith("streamer")]
+        return await self._reply("GET /helix/users", {"data": data})
+
+    async def _token(self, request: web.Request) -> web.Response:
+        return await self._reply("POST /oauth2/token", {"access_token": "bench", "expires_in": 3600, "token_type": "bearer"})
+
+    async def _validate(self, request: web.Request) -> web.Response:
+        return await self._reply("GET /oauth2/validate", {"client_id": "bench", "scopes": [], "expires_in": 3600})
+
+    async def _subscribe(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        sub = {"id": str(next(self._ids)), "status": "enabled", "type": body["type"],
+               "condition": body["condition"], "transport": body["transport"]}
+        self.subscriptions[sub["id"]] = sub
+        return await self._reply("POST /helix/eventsub/subscriptions", {"data": [sub]})
+
+    async def _unsubscribe(self, request: web.Request) -> web.Response:
+        self.subscriptions.pop(request.query.get("id", ""), None)
+        return await self._reply("DELETE /helix/eventsub/subscriptions", {})
+
+    async def _eventsub(self, request: web.Request) -> web.WebSocketResponse:
+        self.calls["WS /eventsub"] += 1
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        # a reconnect keeps the session (and its subscriptions)
+        session_id = request.query.get("reconnect") or f"session{next(self._ids)}"
+        self._session_ids[ws] = session_id
+        self._sockets.append(ws)
+        keepalive = asyncio.create_task(self._keepalive(ws))
+        try:
+            await self._send_ws("session_welcome", {"session": {
+                "id": session_id, "status": "connected",
+                "keepalive_timeout_seconds": self.keepalive, "reconnect_url": None,
+            }}, ws)
+            async for _ in ws:  # the client never sends anything; this waits for the close
+                pass
+        finally:
+            keepalive.cancel()
+            self._sockets.remove(ws)
+            del self._session_ids[ws]
+        return ws
+
+    async def _keepalive(self, ws: web.WebSocketResponse) -> None:
+        while True:
+            await asyncio.sleep(self.keepalive / 2)
+            await self._send_ws("session_keepalive", {}, ws)
+
+    async def _send_ws(self, kind: str, payload: Dict[str, Any], ws: Optional[web.WebSocketResponse] = None) -> bool:
+        ws = ws or (self._sockets[-1] if self._sockets else None)
+        if ws is None or ws.closed:
+            return False
+        metadata = {"message_id": str(next(self._ids)), "message_type": kind}
+        try:
+            await ws.send_json({"metadata": metadata, "payload": payload})
+        except ConnectionError:
+            return False
+        return True
+
+    def _user(self, user_id: str) -> Dict[str, Any]:
+        return {
+            "id": user_id,
+            "login": f"streamer{user_id}",
+            "display_name": f"Streamer{user_id}",
+            "profile_image_url": f"https://example.invalid/{user_id}.png",
+        }
+
+    def _stream(self, user_id: str) -> Dict[str, Any]:
+        return {
+            "id": self._stream_ids[user_id],
+            "user_id": user_id,
+            "user_login": f"streamer{user_id}",
+            "user_name": f"Streamer{user_id}",
+            "game_name": "Just Chatting",
+            "title": f"Stream of {user_id}",
+            "viewer_count": self._rng.randint(1, 5000),
+            "type": "live",
+        }
@@ -0,0 +1,53 @@
+""" <summary>
+Memory of N cached profiles: the old dict representation (lists of game and
+server names) against utils.profile_model.Profile (slots + bitmasks).
+
+    python bench/profile_memory.py [count]
+</summary> """
+
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.profile_model import DEFAULT_GAMES, DEFAULT_SERVERS, GENDERS, Profile  # noqa: E402
+
+
+def random_dict(rng: random.Random) -> dict:
+    # как строки приходят из JSON/SQLite: каждый профиль держит свои копии
+    return {
+        "gender": rng.choice(GENDERS),
+        "age": rng.randint(12, 99) if rng.random() < 0.7 else None,
+        "games": [str(g).encode().decode() for g in rng.sample(DEFAULT_GAMES, rng.randint(0, 4))],
+        "servers": [str(s).encode().decode() for s in rng.sample(DEFAULT_SERVERS, rng.randint(0, 2))],
+    }
+
+
+def measure(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    data = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del data
+    return size
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    dicts = [random_dict(random.Random(i)) for i in range(count)]
+
+    dict_bytes = measure(lambda: {uid: random_dict(random.Random(uid)) for uid in range(count)})
+    model_bytes = measure(lambda: {uid: Profile.from_dict(dicts[uid]) for uid in range(count)})
+
+    print(f"profiles: {count}")
+    print(f"dict:    {dict_bytes / 2**20:8.1f} MiB  {dict_bytes / count:6.0f} B/profile")
+    print(f"Profile: {model_bytes / 2**20:8.1f} MiB  {model_bytes / count:6.0f} B/profile")
+    print(f"ratio:   {dict_bytes / model_bytes:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
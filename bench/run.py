@@ -0,0 +1,420 @@
+""" <summary>
+Offline load test of the bot's hot paths: the real cogs run against the
+in-process fakes in bench/fake_discord.py and bench/fake_twitch.py, with no
+network. Reports p50/p99 latency of each scenario, the HTTP calls it caused
+and event-loop lag.
+
+    python bench/run.py                       # all scenarios, default sizes
+    python bench/run.py twitch voice --rtt 0.05 --streamers 2000
+    python bench/run.py --json result.json    # machine-readable, for comparing runs
+
+Scenarios:
+    twitch   N streamers flapping live/offline, one _poll() per tick (tick duration)
+    joins    M members joining at once (join -> welcome message posted)
+    profile  K concurrent profile select edits (click -> status followup sent)
+    voice    V members entering the "create room" channel at once (join -> moved to a room)
+    eventsub E EventSub notifications with R session_reconnect handovers in between
+             (sent -> callback; "done" below "ops" means notifications were lost)
+</summary> """
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import discord  # noqa: E402
+from discord.ext import commands  # noqa: E402
+
+from bench import fake_discord as fd  # noqa: E402
+from bench.fake_twitch import FakeTwitch  # noqa: E402
+from utils import metrics, storage  # noqa: E402
+from utils.cog_manifest import gateway_config, load_cogs, missing_requirements  # noqa: E402
+from utils.loop_monitor import LoopLagMonitor  # noqa: E402
+
+SCENARIOS = ("twitch", "joins", "profile", "voice", "eventsub")
+COGS = {
+    "twitch": "cogs.twitch_monitor",
+    "joins": "cogs.welcome",
+    "profile": "cogs.profile",
+    "voice": "cogs.voice_manager",
+    "eventsub": "cogs.twitch_monitor",  # its EventSubClient, driven directly
+}
+
+# guild layout of the simulated gateway
+MAIN_GUILD = 100000000000000001
+WELCOME_CHANNEL = 100000000000000002
+HUB_CHANNEL = 100000000000000003
+VOICE_CATEGORY = 100000000000000004
+STREAM_GUILDS_BASE = 200000000000000000
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class Bench:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.discord = fd.FakeDiscord(rtt=args.rtt)
+        self.streamer_ids = [str(1000 + i) for i in range(args.streamers)]
+        self.twitch = FakeTwitch(self.streamer_ids, rtt=args.rtt, seed=args.seed)
+        self.monitor = LoopLagMonitor(interval=0.005, report_every=float("inf"))
+        self.bot: commands.Bot = None  # type: ignore[assignment]
+        self.gateway: fd.FakeGateway = None  # type: ignore[assignment]
+        self.results: List[Dict[str, Any]] = []
+
+    # ---------- setup ----------
+    def _stream_guilds(self) -> Dict[int, Dict[str, Any]]:
+        """streamers.json of the twitch scenario: each streamer watched by 1-3 guilds."""
+        guilds = {STREAM_GUILDS_BASE + i * 2: STREAM_GUILDS_BASE + i * 2 + 1 for i in range(self.args.guilds)}
+        watchlists = {str(g): {"channel_id": c, "streamer_ids": []} for g, c in guilds.items()}
+        for user_id in self.streamer_ids:
+            for guild_id in self.rng.sample(list(guilds), min(len(guilds), self.rng.randint(1, 3))):
+                watchlists[str(guild_id)]["streamer_ids"].append(user_id)
+        return watchlists
+
+    async def setup(self, scenarios: List[str]) -> List[str]:
+        await self.discord.start()
+        await self.twitch.start()
+
+        # cogs read their configuration at import time
+        os.environ.update({
+            "WELCOME_CHANNEL_ID": str(WELCOME_CHANNEL),
+            "VOICE_CHANNEL_ID": str(HUB_CHANNEL),
+            "VOICE_POOL_SIZE": str(self.args.pool),
+            "VOICE_ROOM_GRACE": str(self.args.grace),
+            "TWITCH_MODE": "poll",
+            "TWITCH_CLIENT_ID": "bench",
+            "TWITCH_CLIENT_SECRET": "bench",
+            "TWITCH_HELIX_URL": self.twitch.helix_url,
+            "TWITCH_AUTH_URL": self.twitch.auth_url,
+        })
+        os.environ.pop("MODERATOR_CHANNEL_ID", None)
+        os.makedirs("data", exist_ok=True)
+        if "twitch" in scenarios:
+            with open("data/streamers.json", "w", encoding="utf-8") as f:
+                json.dump(self._stream_guilds(), f)
+
+        names = []
+        for scenario in scenarios:
+            missing = missing_requirements(COGS[scenario])
+            if missing:
+                print(f"[Bench] {scenario}: пропущен, нет пакетов {', '.join(missing)}")
+            else:
+                names.append(scenario)
+
+        cogs = list(dict.fromkeys(COGS[name] for name in names))
+        intents, member_cache = gateway_config(cogs)
+        self.bot = commands.Bot(
+            command_prefix="!",
+            intents=intents,
+            member_cache_flags=member_cache,
+            chunk_guilds_at_startup=False,
+            http_trace=metrics.http_trace("discord"),
+            application_id=fd.APP_ID,
+        )
+        await self.bot.login("bench")
+        self.gateway = fd.FakeGateway(self.bot)
+        self.discord.gateway = self.gateway
+        results = await load_cogs(self.bot, cogs)
+        names = [name for name in names if results[COGS[name]][1] is None]
+
+        self.gateway.guild_create(fd.guild(MAIN_GUILD, [
+            fd.channel(WELCOME_CHANNEL, MAIN_GUILD, fd.TEXT, "welcome"),
+            fd.channel(VOICE_CATEGORY, MAIN_GUILD, fd.CATEGORY, "voice"),
+            fd.channel(HUB_CHANNEL, MAIN_GUILD, fd.VOICE, "create room", parent_id=VOICE_CATEGORY),
+        ]))
+        self.monitor.start()
+        return names
+
+    async def close(self) -> None:
+        self.monitor.stop()
+        if self.bot is not None:
+            await self.bot.close()  # cog_unload: final flushes
+        await self.discord.stop()
+        await self.twitch.stop()
+
+    # ---------- measurement ----------
+    async def measure(self, name: str, ops: int, run: Callable[[], Awaitable[List[float]]]) -> None:
+        discord_before = Counter(self.discord.calls)
+        twitch_before = Counter(self.twitch.calls)
+        lookups_before = dict(metrics.CACHE_LOOKUPS.values)
+        skipped_before = dict(metrics.EMBED_SENDS_SKIPPED.values)
+        self.monitor.reset()
+        started = time.perf_counter()
+        latencies = await run()
+        elapsed = time.perf_counter() - started
+        lag = self.monitor.snapshot()
+        discord_calls = Counter(self.discord.calls)
+        discord_calls.subtract(discord_before)
+        twitch_calls = Counter(self.twitch.calls)
+        twitch_calls.subtract(twitch_before)
+        lookups: Dict[str, Counter] = {}
+        for (cache, result), value in metrics.CACHE_LOOKUPS.values.items():
+            count = value - lookups_before.get((cache, result), 0)
+            if count:
+                lookups.setdefault(cache, Counter())[result] += int(count)
+        skipped = {embed: int(value - skipped_before.get((embed,), 0))
+                   for (embed,), value in metrics.EMBED_SENDS_SKIPPED.values.items()
+                   if value - skipped_before.get((embed,), 0)}
+        self.results.append({
+            "scenario": name,
+            "ops": ops,
+            "completed": len(latencies),
+            "elapsed_s": elapsed,
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": max(latencies, default=0.0) * 1000,
+            "discord_calls": dict(+discord_calls),
+            "twitch_calls": dict(+twitch_calls),
+            "cache_hit_rate": {cache: counts["hit"] / sum(counts.values()) for cache, counts in lookups.items()},
+            "embed_sends_skipped": skipped,
+            "loop_lag_p99_ms": lag["p99"] * 1000,
+            "loop_lag_max_ms": lag["max"] * 1000,
+        })
+
+    async def effects(self, inject: Callable[[int], Any], matches: Callable[[str, str, Any], Any],
+                      keys: List[Any]) -> List[float]:
+        """Inject one event per key, return the time until the fake API saw each key's effect.
+        `matches` maps a request to the key it completes, or a list of keys."""
+        loop = asyncio.get_running_loop()
+        started: Dict[Any, float] = {}
+        done: Dict[Any, asyncio.Future] = {key: loop.create_future() for key in keys}
+
+        def listener(method: str, path: str, body: Any) -> None:
+            key = matches(method, path, body)
+            # one request may complete several keys (a welcome mentioning many members)
+            for key in key if isinstance(key, list) else [key]:
+                future = done.get(key)
+                if future is not None and not future.done():
+                    future.set_result(time.perf_counter())
+
+        self.discord.listeners.append(listener)
+        try:
+            for key in keys:
+                started[key] = time.perf_counter()
+                inject(key)
+            finished, _ = await asyncio.wait(done.values(), timeout=self.args.timeout)
+        finally:
+            self.discord.listeners.remove(listener)
+        return [done[key].result() - started[key] for key in keys if done[key] in finished]
+
+    # ---------- scenarios ----------
+    async def run_twitch(self) -> None:
+        cog = self.bot.get_cog("TwitchCog")
+        await cog.twitch.authenticate_app([])
+        self.twitch.flap(0.3)  # часть стримеров уже в эфире к первому тику
+
+        async def ticks() -> List[float]:
+            durations = []
+            for _ in range(self.args.ticks):
+                self.twitch.flap(self.args.flap)
+                started = time.perf_counter()
+                await cog._poll()
+                durations.append(time.perf_counter() - started)
+            return durations
+
+        await self.measure("twitch", self.args.ticks, ticks)
+
+    async def run_joins(self) -> None:
+        user_ids = [300000000000000000 + i for i in range(self.args.members)]
+
+        def matches(method: str, path: str, body: Any) -> Any:
+            if method == "POST" and path == f"/channels/{WELCOME_CHANNEL}/messages":
+                content = (body or {}).get("content") or ""
+                return [int(user_id) for user_id in re.findall(r"<@(\d+)>", content)]
+            return None
+
+        await self.measure("joins", len(user_ids), lambda: self.effects(
+            lambda uid: self.gateway.member_join(MAIN_GUILD, uid), matches, user_ids,
+        ))
+
+    async def run_profile(self) -> None:
+        from cogs.profile import profile_edit_view
+        from utils.profile_model import DEFAULT_GAMES
+
+        users = [400000000000000000 + i for i in range(max(1, min(self.args.edits, self.args.edit_users)))]
+        components = {uid: profile_edit_view(uid).to_components() for uid in users}
+        select = discord.ComponentType.select.value
+        owners: Dict[int, int] = {}
+
+        def inject(n: int) -> None:
+            uid = users[n % len(users)]
+            interaction_id = self.gateway.component(
+                MAIN_GUILD, WELCOME_CHANNEL, uid, f"profile:games:{uid}", select,
+                values=self.rng.sample(DEFAULT_GAMES, self.rng.randint(0, 4)), components=components[uid],
+            )
+            owners[interaction_id] = n
+
+        def matches(method: str, path: str, body: Any) -> Any:
+            # the edit is done when its status followup reaches the webhook
+            if not path.startswith("/webhooks/"):
+                return None
+            interaction_id = fd.interaction_id_of(path)
+            return owners.get(interaction_id) if interaction_id is not None else None
+
+        edits = list(range(self.args.edits))
+        await self.measure("profile", len(edits), lambda: self.effects(inject, matches, edits))
+
+    async def run_voice(self) -> None:
+        cog = self.bot.get_cog("VoiceManager")
+        user_ids = [500000000000000000 + i for i in range(self.args.voice)]
+
+        def matches(method: str, path: str, body: Any) -> Any:
+            if method == "PATCH" and path.startswith(f"/guilds/{MAIN_GUILD}/members/") and "channel_id" in (body or {}):
+                return int(path.rsplit("/", 1)[1])
+            return None
+
+        async def storm() -> List[float]:
+            latencies = await self.effects(
+                lambda uid: self.gateway.voice_state(MAIN_GUILD, uid, HUB_CHANNEL), matches, user_ids,
+            )
+            # все уходят: комнаты освобождаются после grace (в пул или удаляются)
+            guild = self.bot.get_guild(MAIN_GUILD)
+            for uid in user_ids:
+                if guild.get_member(uid) is not None:
+                    self.gateway.voice_state(MAIN_GUILD, uid, None)
+            state = cog.rooms.guilds.get(MAIN_GUILD)
+            deadline = time.perf_counter() + self.args.grace + self.args.timeout
+            while state is not None and (state.rooms or state.releases or not state.queue.empty()):
+                if time.perf_counter() > deadline:
+                    break
+                await asyncio.sleep(0.05)
+            return latencies
+
+        await self.measure("voice", len(user_ids), storm)
+
+    async def run_eventsub(self) -> None:
+        from utils.eventsub import EventSubClient
+
+        loop = asyncio.get_running_loop()
+        received: Dict[int, asyncio.Future] = {n: loop.create_future() for n in range(self.args.events)}
+
+        async def token() -> str:
+            return "bench"
+
+        async def on_event(event_type: str, event: Dict[str, Any]) -> None:
+            future = received.get(event.get("seq"))
+            if future is not None and not future.done():
+                future.set_result(time.perf_counter())
+
+        client = EventSubClient("bench", token, on_event, ws_url=self.twitch.eventsub_url,
+                                subscription_url=self.twitch.helix_url + "eventsub/subscriptions")
+        client.start(self.streamer_ids)
+        deadline = time.perf_counter() + self.args.timeout
+        while len(self.twitch.subscriptions) < len(self.streamer_ids) * 3 and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+
+        async def stream() -> List[float]:
+            sent: Dict[int, float] = {}
+            every = max(1, self.args.events // (self.args.reconnects + 1))
+            for n in range(self.args.events):
+                if n and n % every == 0 and n // every <= self.args.reconnects:
+                    await self.twitch.reconnect()
+                sent[n] = time.perf_counter()
+                await self.twitch.notify("stream.online", {"broadcaster_user_id": self.rng.choice(self.streamer_ids),
+                                                           "seq": n})
+                await asyncio.sleep(0.001)
+            # a lost notification never arrives: wait briefly, not the full --timeout
+            await asyncio.wait(received.values(), timeout=min(self.args.timeout, 2))
+            return [received[n].result() - sent[n] for n in sent if received[n].done()]
+
+        try:
+            await self.measure("eventsub", self.args.events, stream)
+        finally:
+            await client.stop()
+
+    # ---------- report ----------
+    def report(self) -> None:
+        header = f"{'scenario':<9} {'ops':>6} {'done':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} " \
+                 f"{'discord':>8} {'twitch':>7} {'lag p99':>8} {'lag max':>8}"
+        print(header)
+        print("-" * len(header))
+        for r in self.results:
+            print(
+                f"{r['scenario']:<9} {r['ops']:>6} {r['completed']:>6} {r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f} "
+                f"{r['max_ms']:>9.1f} {sum(r['discord_calls'].values()):>8} {sum(r['twitch_calls'].values()):>7} "
+                f"{r['loop_lag_p99_ms']:>8.1f} {r['loop_lag_max_ms']:>8.1f}"
+            )
+        if self.args.verbose:
+            for r in self.results:
+                print(f"\n{r['scenario']}:")
+                for route, count in sorted({**r["discord_calls"], **r["twitch_calls"]}.items(), key=lambda x: -x[1]):
+                    print(f"  {count:>7}  {route}")
+                for cache, rate in sorted(r["cache_hit_rate"].items()):
+                    print(f"  {rate:>7.1%}  hit rate of {cache}")
+                for embed, count in sorted(r["embed_sends_skipped"].items()):
+                    print(f"  {count:>7}  {embed} embed sends skipped (unchanged)")
+
+
+async def main(args: argparse.Namespace) -> int:
+    scenarios = args.scenarios or list(SCENARIOS)
+    bench = Bench(args)
+    try:
+        runnable = await bench.setup(scenarios)
+        for name in scenarios:
+            if name in runnable:
+                await getattr(bench, f"run_{name}")()
+    finally:
+        await bench.close()
+    bench.report()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": bench.results}, f, indent=2)
+    return 0
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the bot's cogs")
+    parser.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--rtt", type=float, default=0.02, help="simulated API round trip, seconds")
+    parser.add_argument("--streamers", type=int, default=500)
+    parser.add_argument("--guilds", type=int, default=50, help="guilds watching the streamers")
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--flap", type=float, default=0.1, help="share of streamers toggling per tick")
+    parser.add_argument("--members", type=int, default=1000, help="members joining at once")
+    parser.add_argument("--edits", type=int, default=500, help="concurrent profile edits")
+    parser.add_argument("--edit-users", type=int, default=100, help="members the edits are spread over")
+    parser.add_argument("--voice", type=int, default=200, help="members entering the room hub at once")
+    parser.add_argument("--pool", type=int, default=2, help="VOICE_POOL_SIZE")
+    parser.add_argument("--grace", type=float, default=0.5, help="VOICE_ROOM_GRACE, seconds")
+    parser.add_argument("--events", type=int, default=2000, help="EventSub notifications sent")
+    parser.add_argument("--reconnects", type=int, default=5, help="session_reconnect handovers during them")
+    parser.add_argument("--timeout", type=float, default=60, help="give up waiting for effects after N seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="HTTP calls by route")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    # коги пишут в ./data — бенчмарк работает во временном каталоге, не трогая данные бота
+    with tempfile.TemporaryDirectory(prefix="bot-bench-") as workdir:
+        os.chdir(workdir)
+        try:
+            code = asyncio.run(main(args))
+        finally:
+            storage.shutdown()
+            os.chdir(ROOT)
+    sys.exit(code)
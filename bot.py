@@ -1,34 +1,195 @@
+import argparse
+import asyncio
+import functools
 import os
+import signal
+import sys
+import time
 from dotenv import load_dotenv
 import discord
+from discord import app_commands
 from discord.ext import commands
 
+from utils import metrics, storage
+from utils.cog_manifest import enabled_cogs, gateway_config, load_cogs
+from utils.loop_monitor import LoopLagMonitor
+from utils.memory import memory_report, rss_bytes
+from utils.sharding import LeaderLock, format_shard_ids, parse_shard_ids
+from utils.startup import StartupTimer, sync_commands
+
+timer = StartupTimer()
+
 load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
+# период отчёта о задержках event loop в секундах (0 — выключено)
+LOOP_MONITOR_REPORT = float(os.getenv("LOOP_MONITOR_REPORT", 0))
+# minimal — интенты и кеш участников только под включённые коги, без чанкинга на старте;
+# full — как раньше: members + message_content, все участники всех гильдий в памяти
+MEMORY_PROFILE = os.getenv("MEMORY_PROFILE", "minimal").strip().lower()
+# Prometheus-метрики на http://METRICS_HOST:METRICS_PORT/metrics (0 — выключено)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+# все процессы бота держат его (shared) до выхода; datatool.py берёт его эксклюзивно
+BOT_LOCK_FILE = "data/bot.lock"
+
+parser = argparse.ArgumentParser(description="Ayanami Discord bot")
+# без аргументов процесс сам берёт рекомендованное Discord число шардов и запускает все
+parser.add_argument("--shard-count", type=int, default=int(os.getenv("SHARD_COUNT", 0)) or None,
+                    help="total shards across all processes")
+parser.add_argument("--shards", default=os.getenv("SHARD_IDS") or None,
+                    help='shard IDs run by this process, e.g. "0-3" or "0,2,4"')
+# команды синхронизируются, только если их описание изменилось с прошлого запуска
+parser.add_argument("--force-sync", action="store_true", help="sync app commands even if unchanged")
+parser.add_argument("--dev-guild", type=int, default=int(os.getenv("DEV_GUILD_ID", 0)) or None,
+                    help="sync commands to this guild only (instant, for development)")
+args = parser.parse_args()
+
+shard_ids = parse_shard_ids(args.shards) if args.shards else None
+if shard_ids and not args.shard_count:
+    parser.error("--shards requires --shard-count")
+
+# до загрузки когов: профили и списки не должны меняться под импортом datatool.py
+process_lock = LeaderLock(BOT_LOCK_FILE, shared=True)
+if not process_lock.acquire():
+    sys.exit(f"[Bot] {BOT_LOCK_FILE} занят: идёт обслуживание данных (datatool.py)")
+
+cogs = enabled_cogs()
+if MEMORY_PROFILE == "full":
+    intents = discord.Intents.default()
+    intents.guilds = True
+    intents.members = True
+    intents.voice_states = True
+    intents.message_content = True
+    member_cache = discord.MemberCacheFlags.from_intents(intents)
+    chunk_at_startup = True
+else:
+    # нужные участники приходят с событиями и interaction; полный список участников
+    # запрашивается по требованию через guild.chunk(cache=False) и в кеше не остаётся
+    # (сейчас — только разовое заполнение /find в ProfileCog.backfill_guild)
+    intents, member_cache = gateway_config(cogs)
+    chunk_at_startup = False
+
+def observe_command(interaction: discord.Interaction, command, status: str):
+    started = interaction.extras.get("started")
+    if started is not None and command is not None:
+        metrics.APP_COMMAND_SECONDS.observe(time.perf_counter() - started, command=command.qualified_name, status=status)
+
+class InstrumentedTree(app_commands.CommandTree):
+    """Times every app command: start in interaction_check, end on completion or error."""
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["started"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        observe_command(interaction, interaction.command, "error")
+        metrics.ERRORS.inc(source="app_command")
+        await super().on_error(interaction, error)
 
-intents = discord.Intents.default()
-intents.guilds = True
-intents.members = True
-intents.voice_states = True
-intents.message_content = True
+def timed_listener(func, event: str):
+    @functools.wraps(func)
+    async def listener(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            await func(*args, **kwargs)
+        finally:
+            metrics.LISTENER_SECONDS.observe(time.perf_counter() - started, event=event)
+    return listener
 
-class MyBot(commands.Bot):
+class MyBot(commands.AutoShardedBot):
+
+    cog_init_time = 0.0
+    _closing = None  # close() по сигналу, запускается один раз
+
+    def __init__(self, *args, **kwargs):
+        # (event, listener) -> обёртка с замером, чтобы remove_listener её нашёл
+        self._timed_listeners = {}
+        super().__init__(*args, **kwargs)
+
+    def add_listener(self, func, /, name=discord.utils.MISSING):
+        # сюда приходят слушатели когов (add_cog) и @bot.listen()
+        name = func.__name__ if name is discord.utils.MISSING else name
+        wrapper = self._timed_listeners[(name, func)] = timed_listener(func, name)
+        super().add_listener(wrapper, name)
+
+    def remove_listener(self, func, /, name=discord.utils.MISSING):
+        name = func.__name__ if name is discord.utils.MISSING else name
+        super().remove_listener(self._timed_listeners.pop((name, func), func), name)
+
+    async def on_error(self, event_method, /, *args, **kwargs):
+        metrics.ERRORS.inc(source=event_method)
+        await super().on_error(event_method, *args, **kwargs)
+
+    async def add_cog(self, cog, **kwargs):
+        # время cog_load и регистрации; остальное в load_extension — импорт модуля
+        started = time.perf_counter()
+        await super().add_cog(cog, **kwargs)
+        self.cog_init_time += time.perf_counter() - started
+
+    def _stop_on_signal(self):
+        # docker stop, systemd, launcher.py: закрываемся как по Ctrl+C — close() выгружает
+        # коги, и cog_unload дописывает отложенные записи (профили, посты Twitch, комнаты)
+        if self._closing is None:
+            self._closing = asyncio.create_task(self.close())
 
     async def setup_hook(self):
-        # Загружаем одиночные файлы
-        for filename in os.listdir("./cogs"):
-            if filename.endswith(".py"):
-                await self.load_extension(f"cogs.{filename[:-3]}")
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(sig, self._stop_on_signal)
+            except NotImplementedError:  # Windows: Ctrl+C остаётся KeyboardInterrupt
+                pass
+        self.dev_guild_id = args.dev_guild
+        timer.mark("login")
+        if LOOP_MONITOR_REPORT > 0 or METRICS_PORT:
+            self.loop_monitor = LoopLagMonitor(report_every=LOOP_MONITOR_REPORT, on_sample=metrics.LOOP_LAG.observe)
+            self.loop_monitor.start()
+        if METRICS_PORT:
+            # процессы по шардам на одной машине: порт + первый шард процесса
+            port = METRICS_PORT + (self.shard_ids[0] if self.shard_ids else 0)
+            self.metrics_server = metrics.MetricsServer(METRICS_HOST, port)
+            await self.metrics_server.start()
+
+        # Коги из манифеста (utils/cog_manifest.py), параллельно; сломанный ког не роняет запуск
+        results = await load_cogs(self, cogs)
+        for name, (seconds, _) in results.items():
+            if seconds is not None:
+                timer.cogs[name.split(".")[-1]] = seconds
 
-        # Загружаем модули
-        # await self.load_extension("cogs.ttv_monitor")
+        # загрузки перекрываются, поэтому cog_init — суммарное время cog_load, а cogs — общее
+        timer.mark("cogs")
+        timer.add("cog_init", self.cog_init_time)
 
-        await self.tree.sync()
+        # команды глобальные: синхронизирует один процесс — тот, что держит шард 0
+        if self.shard_ids is None or 0 in self.shard_ids:
+            synced = await sync_commands(self.tree, self.application_id, args.dev_guild, args.force_sync)
+            timer.mark("sync" if synced else "sync(skipped)")
 
-bot = MyBot(command_prefix="!", intents=intents)
+bot = MyBot(
+    # без message_content префикс "!" виден только в ЛС — упоминание работает везде
+    command_prefix=commands.when_mentioned_or("!"),
+    tree_cls=InstrumentedTree,
+    # счётчики запросов к Discord API и 429 по маршрутам
+    http_trace=metrics.http_trace("discord"),
+    intents=intents,
+    member_cache_flags=member_cache,
+    chunk_guilds_at_startup=chunk_at_startup,
+    shard_count=args.shard_count,
+    shard_ids=shard_ids,
+)
+rss_before_connect = rss_bytes()
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    observe_command(interaction, command, "ok")
 
 @bot.event
 async def on_ready():
-    print(f"Bot ready! {bot.user} (id {bot.user.id})")
+    shards = format_shard_ids(sorted(bot.shards)) if bot.shards else "-"
+    print(f"Bot ready! {bot.user} (id {bot.user.id}), shards {shards}/{bot.shard_count}")
+    if not timer.reported:
+        timer.mark("gateway_ready")
+        timer.report()
+        print(memory_report(bot, MEMORY_PROFILE, rss_before_connect))
 
-bot.run(TOKEN)
\ No newline at end of file
+bot.run(TOKEN)
+storage.shutdown()
@@ -0,0 +1,79 @@
+""" <summary>
+Owner-only maintenance: reload, load and unload single cogs without
+restarting the gateway connection.
+</summary> """
+
+import time
+from discord.ext import commands
+
+from utils.cog_manifest import COGS, load_cog, missing_requirements, qualify
+from utils.startup import sync_commands
+
+class Admin(commands.Cog):
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def cog_check(self, ctx: commands.Context) -> bool:
+        return await self.bot.is_owner(ctx.author)
+
+    async def _sync(self, ctx: commands.Context):
+        # команды кога могли измениться; без изменений sync пропускается по хешу
+        try:
+            if await sync_commands(self.bot.tree, self.bot.application_id, getattr(self.bot, "dev_guild_id", None)):
+                await ctx.send("🔄 Slash-команды синхронизированы.")
+        except Exception as e:
+            await ctx.send(f"⚠️ Sync не удался: {e}")
+
+    @commands.command(name="reload")
+    async def reload(self, ctx: commands.Context, cog: str):
+        name = qualify(cog)
+        if name not in self.bot.extensions:
+            return await ctx.send(f"⚠️ `{name}` не загружен (`!load {cog}`).")
+        started = time.perf_counter()
+        try:
+            # при ошибке discord.py оставляет загруженной старую версию
+            await self.bot.reload_extension(name)
+        except Exception as e:
+            cause = e.__cause__ or e
+            return await ctx.send(f"❌ `{name}`: {type(cause).__name__}: {cause}")
+        await ctx.send(f"✅ `{name}` перезагружен за {time.perf_counter() - started:.2f}s.")
+        await self._sync(ctx)
+
+    @commands.command(name="load")
+    async def load(self, ctx: commands.Context, cog: str):
+        name = qualify(cog)
+        if name not in COGS:
+            return await ctx.send(f"⚠️ `{name}` нет в манифесте.")
+        if name in self.bot.extensions:
+            return await ctx.send(f"⚠️ `{name}` уже загружен.")
+        seconds, error = await load_cog(self.bot, name)
+        if error is not None:
+            return await ctx.send(f"❌ `{name}`: {error}")
+        await ctx.send(f"✅ `{name}` загружен за {seconds:.2f}s.")
+        await self._sync(ctx)
+
+    @commands.command(name="unload")
+    async def unload(self, ctx: commands.Context, cog: str):
+        name = qualify(cog)
+        if name == __name__:
+            return await ctx.send("⚠️ Admin нельзя выгрузить — им же загружают обратно.")
+        if name not in self.bot.extensions:
+            return await ctx.send(f"⚠️ `{name}` не загружен.")
+        await self.bot.unload_extension(name)
+        await ctx.send(f"🗑️ `{name}` выгружен.")
+        await self._sync(ctx)
+
+    @commands.command(name="cogs")
+    async def cogs(self, ctx: commands.Context):
+        lines = []
+        for name in COGS:
+            if name in self.bot.extensions:
+                lines.append(f"🟢 {name}")
+            else:
+                missing = missing_requirements(name)
+                lines.append(f"⚫ {name}" + (f" (нет {', '.join(missing)})" if missing else ""))
+        await ctx.send("\n".join(lines))
+
+async def setup(bot):
+    await bot.add_cog(Admin(bot))
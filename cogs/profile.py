@@ -1,35 +1,39 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import json
-import sqlite3
 import os
-from typing import Dict, Any, Optional
+import re
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
-# пути к файлам
+from utils import metrics
+from utils.profile_model import DEFAULT_GAMES, DEFAULT_SERVERS, GENDERS, MAX_AGE, MIN_AGE, ROLE_NAME_MAX, Profile
+from utils.embed_cache import EmbedCache, RenderedEmbed
+from utils.profile_repo import ProfileRepository
+from utils.ttl_cache import TTLCache
+
+# пути к файлам (JSON — устаревший формат, импортируется в БД один раз)
 JSON_PATH = "./data/profiles.json"
 DB_PATH = "./data/profiles.db"
 
-DEFAULT_GAMES = [
-    "Genshin Impact",
-    "League of Legends",
-    "Apex Legends",
-    "CS2",
-    "Valorant",
-    "Fortnite",
-    "Minecraft",
-    "GTA Online",
-    "Warframe",
-    "Overwatch 2"
-]
-
-DEFAULT_SERVERS = [
-    "Europe",
-    "North America",
-    "Asia",
-    "CIS",
-    "South America"
-]
+# write-behind: как часто и какими пачками сбрасывать изменения на диск
+FLUSH_INTERVAL = float(os.getenv("PROFILE_FLUSH_INTERVAL", 5))
+FLUSH_BATCH = int(os.getenv("PROFILE_FLUSH_BATCH", 200))
+# сколько профилей держать в памяти (LRU)
+CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 5000))
+# как часто проверять изменения профилей из других процессов (только при запуске по шардам)
+SYNC_INTERVAL = float(os.getenv("PROFILE_SYNC_INTERVAL", 2))
+
+# сколько статус-сообщений помнить; токен interaction живёт 15 минут,
+# запись удаляется за TOKEN_MARGIN секунд до этого
+STATUS_CACHE_SIZE = int(os.getenv("PROFILE_STATUS_CACHE_SIZE", 10000))
+TOKEN_MARGIN = 30
+# сколько ждать отправки модального окна (брошенное окно освобождается)
+MODAL_TIMEOUT = 600
+# для скольких участников держать готовый embed профиля (последнюю версию)
+EMBED_CACHE_SIZE = int(os.getenv("PROFILE_EMBED_CACHE_SIZE", 2000))
+# /find: сколько участников на странице
+FIND_PAGE_SIZE = 10
 
 # ID канала модераторов (из окружения). Преобразуем в int если возможно.
 _mod_env = os.getenv("MODERATOR_CHANNEL_ID")
@@ -40,96 +44,24 @@ except (TypeError, ValueError):
 
 # ----------------------------------------
 
-# ------------- Helpers: JSON / SQLite -------------
-def ensure_files_and_db():
-    # Ensure data directory exists
-    data_dir = os.path.dirname(JSON_PATH)
-    if data_dir and not os.path.exists(data_dir):
-        os.makedirs(data_dir, exist_ok=True)
-
-    # ensure json file exists
-    if not os.path.exists(JSON_PATH):
-        with open(JSON_PATH, "w", encoding="utf-8") as f:
-            json.dump({}, f, ensure_ascii=False, indent=2)
-
-    # ensure sqlite and table
-    db_dir = os.path.dirname(DB_PATH)
-    if db_dir and not os.path.exists(db_dir):
-        os.makedirs(db_dir, exist_ok=True)
-
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS profiles (
-            id INTEGER PRIMARY KEY,
-            gender TEXT,
-            age INTEGER,
-            games TEXT,
-            servers TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-
-def load_profiles() -> Dict[str, Any]:
-    # Use JSON_PATH consistently and handle empty file
-    if not os.path.exists(JSON_PATH) or os.stat(JSON_PATH).st_size == 0:
-        return {}
-    with open(JSON_PATH, "r", encoding="utf-8") as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            # If file is corrupted, return empty and overwrite later
-            return {}
-
-
-def save_profiles(data: Dict[str, Any]) -> None:
-    # Ensure parent dir exists (safety)
-    data_dir = os.path.dirname(JSON_PATH)
-    if data_dir and not os.path.exists(data_dir):
-        os.makedirs(data_dir, exist_ok=True)
-
-    with open(JSON_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+# ------------- Embed generator -------------
+GENDER_EMOJI = {"Мужской": "♂️", "Женский": "♀️", "Не указан": "❓"}
 
 
-def upsert_profile_db(user_id: int, profile: Dict[str, Any]) -> None:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    # Using INSERT ... ON CONFLICT to update existing
-    cur.execute(
-        """
-        INSERT INTO profiles (id, gender, age, games, servers)
-        VALUES (?, ?, ?, ?, ?)
-        ON CONFLICT(id) DO UPDATE SET
-            gender=excluded.gender,
-            age=excluded.age,
-            games=excluded.games,
-            servers=excluded.servers
-        """,
-        (
-            user_id,
-            profile.get("gender"),
-            profile.get("age"),
-            json.dumps(profile.get("games", []), ensure_ascii=False),
-            json.dumps(profile.get("servers", []), ensure_ascii=False),
-        ),
-    )
-    conn.commit()
-    conn.close()
+def profile_embed_version(member: discord.abc.User, profile: Profile) -> Tuple:
+    """Everything make_profile_embed shows: the same version renders the same embed."""
+    return (member.display_name, getattr(member, "joined_at", None),
+            profile.gender, profile.age, profile.games, profile.servers)
 
 
-# ------------- Embed generator -------------
-def make_profile_embed(member: discord.Member, profile: Dict[str, Any]) -> discord.Embed:
+def make_profile_embed(member: discord.Member, profile: Profile) -> discord.Embed:
     emb = discord.Embed(title=f"Профиль — {member.display_name}", color=discord.Color.blurple())
-    gender = profile.get("gender") or "Не указан"
-    age = str(profile.get("age")) if profile.get("age") is not None else "Не указан"
-    games = profile.get("games") or []
-    servers = profile.get("servers") or []
+    gender = profile.gender_label or "Не указан"
+    age = str(profile.age) if profile.age is not None else "Не указан"
+    games = profile.game_names()
+    servers = profile.server_names()
 
-    emoji_gender = {"Мужской": "♂️", "Женский": "♀️", "Не указан": "❓"}
-    emb.add_field(name="Пол", value=f"{emoji_gender.get(gender, '')} {gender}", inline=False)
+    emb.add_field(name="Пол", value=f"{GENDER_EMOJI.get(gender, '')} {gender}", inline=False)
     emb.add_field(name="Возраст", value=age, inline=False)
     emb.add_field(name="Игры", value=", ".join(games) if games else "Не выбраны", inline=False)
     emb.add_field(name="Серверы", value=", ".join(servers) if servers else "Не выбраны", inline=False)
@@ -146,24 +78,87 @@ def make_profile_embed(member: discord.Member, profile: Dict[str, Any]) -> disco
 
 
 # ---------------- UI components ----------------
-# We will store a reference to the View in 'view_ref' inside Select/Button classes
-# so we don't attempt to set the read-only .parent property.
+# The editor is stateless: every component is a DynamicItem whose custom_id
+# carries the owner's ID ("profile:games:<owner>"). The item classes are
+# registered once in cog_load; a click rebuilds the item from its custom_id,
+# so no View object is kept per /profile call and old messages keep working
+# after a restart.
+
+def profile_cog(interaction: discord.Interaction) -> "ProfileCog":
+    return interaction.client.get_cog("ProfileCog")  # type: ignore
+
+
+def profile_repo(interaction: discord.Interaction) -> ProfileRepository:
+    return profile_cog(interaction).repo
+
+
+def render_profile_embed(interaction: discord.Interaction, member: discord.abc.User, profile: Profile,
+                         version: Optional[Tuple] = None) -> RenderedEmbed:
+    version = version or profile_embed_version(member, profile)
+    return profile_cog(interaction).embeds.render(member.id, version, lambda: make_profile_embed(member, profile))
+
+
+def profile_edit_view(owner_id: int) -> discord.ui.View:
+    view = discord.ui.View(timeout=None)
+    view.add_item(GenderSelect(owner_id))
+    view.add_item(GamesSelect(owner_id))
+    view.add_item(ServersSelect(owner_id))
+    # Buttons row: change age (modal), request custom role modal
+    view.add_item(ChangeAgeButton(owner_id))
+    view.add_item(CustomRoleButton(owner_id))
+    # only renders components: a finished view is not put into the view store
+    # (and never times out there, which would unregister the dynamic items)
+    view.stop()
+    return view
+
+
+async def apply_profile_change(interaction: discord.Interaction, owner_id: int, change: Callable[[Profile], None],
+                               fallback: str, status: str) -> None:
+    repo = profile_repo(interaction)
+    profile = await repo.get_or_create(owner_id)
+    before, shown = profile.to_row(owner_id), profile_embed_version(interaction.user, profile)
+    change(profile)
+    if profile.to_row(owner_id) != before:
+        # only marks the profile dirty; the repository writes it out in batches
+        repo.save(owner_id, profile)
+
+    version = profile_embed_version(interaction.user, profile)
+    if version == shown:
+        # the embed would not change (e.g. the same selection again): the editor
+        # message already shows it — acknowledge without an edit
+        metrics.EMBED_SENDS_SKIPPED.inc(embed="profile")
+        try:
+            await interaction.response.defer()
+        except Exception:
+            pass
+    else:
+        # Update main embed (original message)
+        rendered = render_profile_embed(interaction, interaction.user, profile, version)
+        try:
+            await interaction.response.edit_message(embed=rendered.embed, view=profile_edit_view(owner_id))
+        except Exception:
+            # fallback if edit_message not allowed
+            try:
+                await interaction.response.send_message(fallback, ephemeral=True)
+            except Exception:
+                pass
+
+    if interaction.guild_id is not None:
+        # редактор мог быть открыт до появления /find — профиль всё равно попадает в поиск
+        await repo.add_member(interaction.guild_id, owner_id)
+
+    # update status message (followup)
+    await update_status_followup(interaction, status)
 
-class ProfileEditView(discord.ui.View):
-    def __init__(self, owner_id: int, profiles_ref: Dict[str, Any], bot: commands.Bot):
-        super().__init__(timeout=None)
-        self.owner_id = owner_id
-        self.profiles_ref = profiles_ref  # reference to loaded JSON data
-        self.bot = bot
 
-        # Add selects/buttons
-        self.add_item(GenderSelect(view_ref=self, row=0))
-        self.add_item(GamesSelect(view_ref=self, row=1))
-        self.add_item(ServersSelect(view_ref=self, row=2))
+class OwnerItem(ABC):
+    """Shared part of the editor items: owner from the custom_id, owner-only access."""
 
-        # Buttons row: change age (modal), request custom role modal
-        self.add_item(ChangeAgeButton(view_ref=self, row=3))
-        self.add_item(CustomRoleButton(view_ref=self, row=3))
+    owner_id: int
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Item, match: re.Match, /):
+        return cls(int(match["owner"]))
 
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
         # Only profile owner allowed to interact
@@ -172,115 +167,105 @@ class ProfileEditView(discord.ui.View):
             return False
         return True
 
-    # Helpers to get and save profile easily
-    def get_profile(self) -> Dict[str, Any]:
-        uid = str(self.owner_id)
-        return self.profiles_ref.setdefault(uid, {"gender": None, "age": None, "games": [], "servers": []})
+    async def callback(self, interaction: discord.Interaction):
+        try:
+            await self.handle(interaction)
+        except Exception:
+            metrics.ERRORS.inc(source="profile_view")
+            raise  # traceback в лог discord.py
 
-    def save_and_persist(self):
-        uid = str(self.owner_id)
-        save_profiles(self.profiles_ref)
-        upsert_profile_db(int(uid), self.profiles_ref[uid])
+    @abstractmethod
+    async def handle(self, interaction: discord.Interaction):
+        """The item's action; errors are counted by callback()."""
 
 
 # ---- Gender Select ----
-class GenderSelect(discord.ui.Select):
-    def __init__(self, view_ref: ProfileEditView, row: int = 0):
-        self.view_ref = view_ref
-        options = [
-            discord.SelectOption(label="Мужской"),
-            discord.SelectOption(label="Женский"),
-            discord.SelectOption(label="Не указан"),
-        ]
-        super().__init__(placeholder="Выберите пол", options=options, row=row, min_values=1, max_values=1)
-
-    async def callback(self, interaction: discord.Interaction):
-        profile = self.view_ref.get_profile()
+class GenderSelect(OwnerItem, discord.ui.DynamicItem[discord.ui.Select], template=r"profile:gender:(?P<owner>[0-9]+)"):
+    def __init__(self, owner_id: int):
+        self.owner_id = owner_id
+        super().__init__(discord.ui.Select(
+            custom_id=f"profile:gender:{owner_id}",
+            placeholder="Выберите пол",
+            options=[discord.SelectOption(label=label) for label in GENDERS[1:]],
+            min_values=1,
+            max_values=1,
+            row=0,
+        ))
+
+    async def handle(self, interaction: discord.Interaction):
         # single select => first value
-        profile["gender"] = self.values[0]
-        self.view_ref.save_and_persist()
-
-        # Update main embed (original message)
-        embed = make_profile_embed(interaction.user, profile)
-        try:
-            await interaction.response.edit_message(embed=embed, view=self.view_ref)
-        except Exception:
-            # fallback if edit_message not allowed
-            await interaction.response.send_message("Пол обновлён.", ephemeral=True)
-
-        # update status message (followup)
-        await update_status_followup(interaction, f"Пол обновлён: **{self.values[0]}**")
+        gender = self.item.values[0]
+        await apply_profile_change(
+            interaction, self.owner_id, lambda profile: profile.set_gender(gender),
+            "Пол обновлён.", f"Пол обновлён: **{gender}**",
+        )
 
 
 # ---- Games Select (multi) ----
-class GamesSelect(discord.ui.Select):
-    def __init__(self, view_ref: ProfileEditView, row: int = 1):
-        self.view_ref = view_ref
-        options = [discord.SelectOption(label=g) for g in DEFAULT_GAMES]
-        super().__init__(
+class GamesSelect(OwnerItem, discord.ui.DynamicItem[discord.ui.Select], template=r"profile:games:(?P<owner>[0-9]+)"):
+    def __init__(self, owner_id: int):
+        self.owner_id = owner_id
+        super().__init__(discord.ui.Select(
+            custom_id=f"profile:games:{owner_id}",
             placeholder="Выберите игры (можно несколько)",
-            options=options,
+            options=[discord.SelectOption(label=g) for g in DEFAULT_GAMES],
             min_values=0,
-            max_values=len(options),
-            row=row
+            max_values=len(DEFAULT_GAMES),
+            row=1,
+        ))
+
+    async def handle(self, interaction: discord.Interaction):
+        games = self.item.values
+        await apply_profile_change(
+            interaction, self.owner_id, lambda profile: profile.set_games(games),
+            "Игры сохранены.", "Игровые роли обновлены",
         )
 
-    async def callback(self, interaction: discord.Interaction):
-        profile = self.view_ref.get_profile()
-        profile["games"] = self.values
-        self.view_ref.save_and_persist()
-
-        embed = make_profile_embed(interaction.user, profile)
-        try:
-            await interaction.response.edit_message(embed=embed, view=self.view_ref)
-        except Exception:
-            await interaction.response.send_message("Игры сохранены.", ephemeral=True)
-        await update_status_followup(interaction, "Игровые роли обновлены")
-
 
 # ---- Servers Select (multi) ----
-class ServersSelect(discord.ui.Select):
-    def __init__(self, view_ref: ProfileEditView, row: int = 2):
-        self.view_ref = view_ref
-        options = [discord.SelectOption(label=s) for s in DEFAULT_SERVERS]
-        super().__init__(
+class ServersSelect(OwnerItem, discord.ui.DynamicItem[discord.ui.Select], template=r"profile:servers:(?P<owner>[0-9]+)"):
+    def __init__(self, owner_id: int):
+        self.owner_id = owner_id
+        super().__init__(discord.ui.Select(
+            custom_id=f"profile:servers:{owner_id}",
             placeholder="Выберите серверы (можно несколько)",
-            options=options,
+            options=[discord.SelectOption(label=s) for s in DEFAULT_SERVERS],
             min_values=0,
-            max_values=len(options),
-            row=row
+            max_values=len(DEFAULT_SERVERS),
+            row=2,
+        ))
+
+    async def handle(self, interaction: discord.Interaction):
+        servers = self.item.values
+        await apply_profile_change(
+            interaction, self.owner_id, lambda profile: profile.set_servers(servers),
+            "Серверы сохранены.", "Серверы обновлены",
         )
 
-    async def callback(self, interaction: discord.Interaction):
-        profile = self.view_ref.get_profile()
-        profile["servers"] = self.values
-        self.view_ref.save_and_persist()
-
-        embed = make_profile_embed(interaction.user, profile)
-        try:
-            await interaction.response.edit_message(embed=embed, view=self.view_ref)
-        except Exception:
-            await interaction.response.send_message("Серверы сохранены.", ephemeral=True)
-        await update_status_followup(interaction, "Серверы обновлены")
-
 
 # ---- Change Age Button -> opens modal ----
-class ChangeAgeButton(discord.ui.Button):
-    def __init__(self, view_ref: ProfileEditView, row: int = 3):
-        super().__init__(label="Изменить возраст", style=discord.ButtonStyle.primary, row=row)
-        self.view_ref = view_ref
+class ChangeAgeButton(OwnerItem, discord.ui.DynamicItem[discord.ui.Button], template=r"profile:age:(?P<owner>[0-9]+)"):
+    def __init__(self, owner_id: int):
+        self.owner_id = owner_id
+        super().__init__(discord.ui.Button(
+            custom_id=f"profile:age:{owner_id}",
+            label="Изменить возраст",
+            style=discord.ButtonStyle.primary,
+            row=3,
+        ))
 
-    async def callback(self, interaction: discord.Interaction):
-        await interaction.response.send_modal(ChangeAgeModal(view_ref=self.view_ref))
+    async def handle(self, interaction: discord.Interaction):
+        await interaction.response.send_modal(ChangeAgeModal(owner_id=self.owner_id))
 
 
 class ChangeAgeModal(discord.ui.Modal, title="Смена возраста"):
     # single text input for age
-    age = discord.ui.TextInput(label="Возраст", style=discord.TextStyle.short, placeholder="Введите возраст (12–99)", max_length=3)
+    age = discord.ui.TextInput(label="Возраст", style=discord.TextStyle.short, placeholder=f"Введите возраст ({MIN_AGE}–{MAX_AGE})", max_length=3)
 
-    def __init__(self, view_ref: ProfileEditView):
-        super().__init__()
-        self.view_ref = view_ref
+    def __init__(self, owner_id: int):
+        # an abandoned modal must not stay in the view store forever
+        super().__init__(timeout=MODAL_TIMEOUT)
+        self.owner_id = owner_id
 
     async def on_submit(self, interaction: discord.Interaction):
         age_raw = self.age.value.strip()
@@ -290,60 +275,53 @@ class ChangeAgeModal(discord.ui.Modal, title="Смена возраста"):
             await interaction.response.send_message("Возраст должен быть числом.", ephemeral=True)
             return
 
-        if not (12 <= age_int <= 99):
-            await interaction.response.send_message("Возраст должен быть в диапазоне 12–99.", ephemeral=True)
+        if not (MIN_AGE <= age_int <= MAX_AGE):
+            await interaction.response.send_message(f"Возраст должен быть в диапазоне {MIN_AGE}–{MAX_AGE}.", ephemeral=True)
             return
 
-        profile = self.view_ref.get_profile()
-        profile["age"] = age_int
-        self.view_ref.save_and_persist()
-
-        embed = make_profile_embed(interaction.user, profile)
-
-        # Try to update the original message that contains the view; if cannot — send ephemeral confirmation
-        try:
-            await interaction.response.edit_message(embed=embed, view=self.view_ref)
-        except Exception:
-            # If editing original message is not possible, respond ephemerally
-            try:
-                await interaction.response.send_message("Возраст обновлён.", ephemeral=True)
-            except Exception:
-                pass
+        def change(profile: Profile) -> None:
+            profile.age = age_int
 
-        await update_status_followup(interaction, f"Возраст обновлён: **{age_int}**")
+        await apply_profile_change(interaction, self.owner_id, change, "Возраст обновлён.", f"Возраст обновлён: **{age_int}**")
 
 
 # ---- Custom Role Button -> opens modal ----
-class CustomRoleButton(discord.ui.Button):
-    def __init__(self, view_ref: ProfileEditView, row: int = 3):
-        super().__init__(label="Запросить кастомную роль", style=discord.ButtonStyle.secondary, row=row)
-        self.view_ref = view_ref
+class CustomRoleButton(OwnerItem, discord.ui.DynamicItem[discord.ui.Button], template=r"profile:role:(?P<owner>[0-9]+)"):
+    def __init__(self, owner_id: int):
+        self.owner_id = owner_id
+        super().__init__(discord.ui.Button(
+            custom_id=f"profile:role:{owner_id}",
+            label="Запросить кастомную роль",
+            style=discord.ButtonStyle.secondary,
+            row=3,
+        ))
 
-    async def callback(self, interaction: discord.Interaction):
-        await interaction.response.send_modal(CustomRoleModal(view_ref=self.view_ref))
+    async def handle(self, interaction: discord.Interaction):
+        await interaction.response.send_modal(CustomRoleModal(owner_id=self.owner_id))
 
 
 class CustomRoleModal(discord.ui.Modal, title="Запрос на кастомную роль"):
-    role = discord.ui.TextInput(label="Название роли", max_length=64, placeholder="Введите название роли")
+    role = discord.ui.TextInput(label="Название роли", max_length=ROLE_NAME_MAX, placeholder="Введите название роли")
     reason = discord.ui.TextInput(label="Причина (опционально)", style=discord.TextStyle.long, required=False, max_length=500)
 
-    def __init__(self, view_ref: ProfileEditView):
-        super().__init__()
-        self.view_ref = view_ref
+    def __init__(self, owner_id: int):
+        super().__init__(timeout=MODAL_TIMEOUT)
+        self.owner_id = owner_id
 
     async def on_submit(self, interaction: discord.Interaction):
         role_name = self.role.value.strip()
         reason = self.reason.value.strip() if self.reason.value else "Не указана"
 
-        profile = self.view_ref.get_profile()
+        repo = profile_repo(interaction)
+        profile = await repo.get_or_create(self.owner_id)
         # сохраняем запрошенное имя роли в profile.custom_role_request
-        profile["custom_role_request"] = role_name
-        self.view_ref.save_and_persist()
+        profile.custom_role_request = role_name
+        repo.save(self.owner_id, profile)
 
         # отправляем в мод-канал, если указан
         if MOD_CHANNEL_ID:
             try:
-                ch = self.view_ref.bot.get_channel(MOD_CHANNEL_ID)
+                ch = interaction.client.get_channel(MOD_CHANNEL_ID)
                 if ch:
                     embed = discord.Embed(title="Запрос кастомной роли", color=discord.Color.orange())
                     embed.add_field(name="Пользователь", value=f"{interaction.user.mention} ({interaction.user.id})", inline=False)
@@ -363,84 +341,263 @@ class CustomRoleModal(discord.ui.Modal, title="Запрос на кастомн
         await update_status_followup(interaction, "Запрос кастомной роли отправлен")
 
 
+# registered with bot.add_dynamic_items in ProfileCog.cog_load
+PROFILE_ITEMS = (GenderSelect, GamesSelect, ServersSelect, ChangeAgeButton, CustomRoleButton)
+
+
+# ---------------- /find results ----------------
+class FindResultsView(discord.ui.View):
+    """
+    Pages through /find results with buttons. Each page is its own small
+    keyset query (user IDs after the last one shown), so nothing but the
+    start IDs of the visited pages is kept in memory.
+    """
+
+    def __init__(self, owner_id: int, repo: ProfileRepository, guild_id: int, filters: Dict[str, Optional[int]],
+                 summary: str):
+        super().__init__(timeout=300)
+        self.owner_id = owner_id
+        self.repo = repo
+        self.guild_id = guild_id
+        self.filters = filters
+        self.summary = summary
+        self.starts: List[int] = [0]  # `after` of every visited page
+        self.rows: List[Tuple[int, Profile]] = []
+        self.has_next = False
+
+        self.prev_button = FindPageButton(view_ref=self, step=-1)
+        self.next_button = FindPageButton(view_ref=self, step=1)
+        self.add_item(self.prev_button)
+        self.add_item(self.next_button)
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Это не ваш поиск.", ephemeral=True)
+            return False
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: Exception, item: discord.ui.Item) -> None:
+        metrics.ERRORS.inc(source="profile_find")
+        await super().on_error(interaction, error, item)
+
+    async def load(self) -> None:
+        # one extra row tells whether there is a next page
+        rows = await self.repo.search(self.guild_id, **self.filters, after=self.starts[-1], limit=FIND_PAGE_SIZE + 1)
+        self.rows = rows[:FIND_PAGE_SIZE]
+        self.has_next = len(rows) > FIND_PAGE_SIZE
+        self.prev_button.disabled = len(self.starts) == 1
+        self.next_button.disabled = not self.has_next
+
+    def make_embed(self) -> discord.Embed:
+        emb = discord.Embed(title="Поиск игроков", description=self.summary, color=discord.Color.blurple())
+        if not self.rows:
+            emb.add_field(name="Ничего не найдено",
+                          value="В поиске участвуют те, кто открывал /profile на этом сервере.", inline=False)
+            return emb
+        lines = []
+        for user_id, profile in self.rows:
+            details = [str(profile.age) if profile.age is not None else "возраст не указан"]
+            if profile.games:
+                details.append(", ".join(profile.game_names()))
+            if profile.servers:
+                details.append(", ".join(profile.server_names()))
+            lines.append(f"<@{user_id}> — {' · '.join(details)}")
+        # description holds up to 4096 chars — a field (1024) is too small for a page
+        emb.description = self.summary + "\n\n" + "\n".join(lines)
+        emb.set_footer(text=f"Страница {len(self.starts)}")
+        return emb
+
+
+class FindPageButton(discord.ui.Button):
+    def __init__(self, view_ref: FindResultsView, step: int):
+        super().__init__(label="◀ Назад" if step < 0 else "Вперёд ▶", style=discord.ButtonStyle.secondary)
+        self.view_ref = view_ref
+        self.step = step
+
+    async def callback(self, interaction: discord.Interaction):
+        view = self.view_ref
+        if self.step > 0 and view.rows:
+            view.starts.append(view.rows[-1][0])
+        elif self.step < 0 and len(view.starts) > 1:
+            view.starts.pop()
+        await view.load()
+        await interaction.response.edit_message(embed=view.make_embed(), view=view)
+
+
 # ----------------- Utility to update the status followup (single message) -----------------
-# We'll maintain mapping in the Cog of user_id -> status_message_id for ephemeral followups.
+# The cog keeps user_id -> (status message id, token of the interaction that sent it).
+# An ephemeral followup can only be edited with that token, and only while it lives.
+
+def token_ttl(interaction: discord.Interaction) -> float:
+    """Seconds the interaction token can still be used for followup edits."""
+    return (interaction.expires_at - discord.utils.utcnow()).total_seconds() - TOKEN_MARGIN
+
 
 async def update_status_followup(interaction: discord.Interaction, text: str):
     """
-    Edit the previously sent followup status message (one per invoking user).
-    Expects bot to have attribute 'profile_status_map' (a dict user_id -> message_id).
+    Edit the previously sent followup status message (one per invoking user),
+    or send a new one if it's unknown or its token has expired.
     """
-    bot: commands.Bot = interaction.client  # type: ignore
-    status_map: Dict[int, int] = getattr(bot, "profile_status_map", {}) or {}
-    msg_id = status_map.get(interaction.user.id)
-    if msg_id:
+    cache: TTLCache = profile_cog(interaction).status_messages
+    entry = cache.get(interaction.user.id)
+    if entry is not None:
+        msg_id, token = entry
         try:
-            await interaction.followup.edit_message(message_id=msg_id, content=text)
-        except Exception:
-            # fallback: send ephemeral followup
-            try:
-                await interaction.followup.send(text, ephemeral=True)
-            except Exception:
-                pass
-    else:
+            webhook = discord.Webhook.partial(interaction.application_id, token, client=interaction.client)
+            await webhook.edit_message(msg_id, content=text)
+            return
+        except discord.HTTPException:
+            # сообщение закрыто пользователем или токен уже не принимается
+            cache.pop(interaction.user.id)
+    try:
         # if mapping missing, just send a followup and store it
-        try:
-            msg = await interaction.followup.send(text, ephemeral=True)
-            status_map[interaction.user.id] = msg.id
-            setattr(bot, "profile_status_map", status_map)
-        except Exception:
-            pass
+        msg = await interaction.followup.send(text, ephemeral=True, wait=True)
+        cache.put(interaction.user.id, (msg.id, interaction.token), ttl=token_ttl(interaction))
+    except Exception:
+        metrics.ERRORS.inc(source="profile_status")
 
 
 # ---------------- Cog ----------------
 class ProfileCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        ensure_files_and_db()
-        self.profiles = load_profiles()  # dict keyed by str(user_id)
-        # map user_id -> status_message_id (ephemeral followup)
-        # stored on bot object for persistence across cogs/instances in runtime
-        if not hasattr(bot, "profile_status_map"):
-            setattr(bot, "profile_status_map", {})
+        self.repo = ProfileRepository(
+            DB_PATH,
+            legacy_json_path=JSON_PATH,
+            cache_size=CACHE_SIZE,
+            flush_interval=FLUSH_INTERVAL,
+            flush_batch=FLUSH_BATCH,
+            # shard_ids задан — остальные шарды работают в других процессах
+            sync_interval=SYNC_INTERVAL if getattr(bot, "shard_ids", None) is not None else 0,
+        )
+        # user_id -> (status message id, interaction token); entries expire with the token
+        self.status_messages = TTLCache(STATUS_CACHE_SIZE, ttl=15 * 60 - TOKEN_MARGIN, name="profile_status")
+        # готовые embed профилей: /profile и правки не собирают их заново, пока профиль не менялся
+        self.embeds = EmbedCache(EMBED_CACHE_SIZE, name="profile_embed")
+        # guild ids whose profile_guilds backfill is running in this process
+        self._backfilling: Set[int] = set()
+
+    async def cog_load(self):
+        await self.repo.start()
+        # one handler per component type for every /profile message, including
+        # the ones sent before a restart
+        self.bot.add_dynamic_items(*PROFILE_ITEMS)
+
+    async def cog_unload(self):
+        self.bot.remove_dynamic_items(*PROFILE_ITEMS)
+        # final flush on unload / bot.close()
+        await self.repo.close()
 
     @commands.Cog.listener()
     async def on_ready(self):
         # just informational
         print("[Profile] Cog loaded")
 
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild: discord.Guild):
+        await self.backfill_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        await self.backfill_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        await self.repo.remove_member(payload.guild_id, payload.user.id)
+
+    async def backfill_guild(self, guild: discord.Guild):
+        """
+        Profiles created before /find existed were never recorded per guild:
+        once per guild, the member list is fetched on demand (guild.chunk
+        without caching the members) and every member with a profile is added.
+        """
+        if not self.bot.intents.members or guild.id in self._backfilling:
+            return
+        self._backfilling.add(guild.id)
+        try:
+            if await self.repo.is_backfilled(guild.id):
+                return
+            # MEMORY_PROFILE=full already chunked the guild at startup
+            members = guild.members if guild.chunked else await guild.chunk(cache=False)
+            added = await self.repo.backfill_members(guild.id, [m.id for m in members])
+            print(f"[Profile] {guild.name}: в поиск добавлено профилей: {added} (участников: {len(members)})")
+        except Exception as e:
+            print(f"[Profile] Ошибка заполнения поиска для {guild.name}: {e}")
+        finally:
+            self._backfilling.discard(guild.id)
+
     @app_commands.command(name="profile", description="Просмотр/редактирование профиля")
     @app_commands.describe(member="Упомяните пользователя для просмотра его профиля")
     async def profile(self, interaction: discord.Interaction, member: Optional[discord.Member] = None):
         target = member or interaction.user
-        uid_str = str(target.id)
 
         # ensure profile exists
-        if uid_str not in self.profiles:
-            self.profiles[uid_str] = {"gender": None, "age": None, "games": [], "servers": []}
-            save_profiles(self.profiles)
-            upsert_profile_db(int(uid_str), self.profiles[uid_str])
-
-        profile = self.profiles[uid_str]
-        embed = make_profile_embed(target, profile)
+        profile = await self.repo.get_or_create(target.id)
+        if interaction.guild is not None and target.id == interaction.user.id:
+            # профиль становится виден в /find этого сервера
+            await self.repo.add_member(interaction.guild.id, target.id)
+        embed = render_profile_embed(interaction, target, profile).embed
 
         # If owner -> attach edit view; otherwise view is None (read-only)
         if target.id == interaction.user.id:
-            view = ProfileEditView(owner_id=interaction.user.id, profiles_ref=self.profiles, bot=self.bot)
-            # send main response (embed + view) as ephemeral
-            await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+            # send main response (embed + editor components) as ephemeral
+            await interaction.response.send_message(embed=embed, view=profile_edit_view(interaction.user.id), ephemeral=True)
             # send the status followup message and store its id
             try:
-                msg = await interaction.followup.send("Изменений пока нет", ephemeral=True)
-                status_map: Dict[int, int] = getattr(self.bot, "profile_status_map", {})
-                status_map[interaction.user.id] = msg.id
-                setattr(self.bot, "profile_status_map", status_map)
+                msg = await interaction.followup.send("Изменений пока нет", ephemeral=True, wait=True)
+                self.status_messages.put(interaction.user.id, (msg.id, interaction.token), ttl=token_ttl(interaction))
             except Exception:
                 pass
         else:
             # Viewing someone else's profile — no view, no status message
             await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    @app_commands.command(name="find", description="Поиск тиммейтов по игре, серверу и возрасту")
+    @app_commands.describe(
+        game="Игра",
+        server="Сервер",
+        min_age="Возраст от",
+        max_age="Возраст до",
+    )
+    @app_commands.choices(
+        game=[app_commands.Choice(name=name, value=bit) for bit, name in enumerate(DEFAULT_GAMES)],
+        server=[app_commands.Choice(name=name, value=bit) for bit, name in enumerate(DEFAULT_SERVERS)],
+    )
+    @app_commands.guild_only()
+    async def find(
+        self,
+        interaction: discord.Interaction,
+        game: Optional[app_commands.Choice[int]] = None,
+        server: Optional[app_commands.Choice[int]] = None,
+        min_age: Optional[app_commands.Range[int, MIN_AGE, MAX_AGE]] = None,
+        max_age: Optional[app_commands.Range[int, MIN_AGE, MAX_AGE]] = None,
+    ):
+        if min_age is not None and max_age is not None and min_age > max_age:
+            min_age, max_age = max_age, min_age
+
+        summary = []
+        if game is not None:
+            summary.append(f"Игра: **{game.name}**")
+        if server is not None:
+            summary.append(f"Сервер: **{server.name}**")
+        if min_age is not None or max_age is not None:
+            summary.append(f"Возраст: **{min_age or MIN_AGE}–{max_age or MAX_AGE}**")
+
+        view = FindResultsView(
+            owner_id=interaction.user.id,
+            repo=self.repo,
+            guild_id=interaction.guild_id,
+            filters={
+                "game": game.value if game is not None else None,
+                "server": server.value if server is not None else None,
+                "min_age": min_age,
+                "max_age": max_age,
+            },
+            summary="\n".join(summary) or "Все участники с профилем",
+        )
+        await view.load()
+        await interaction.response.send_message(embed=view.make_embed(), view=view, ephemeral=True)
+
 
 # ----------------- Setup -----------------
 async def setup(bot: commands.Bot):
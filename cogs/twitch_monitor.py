@@ -1,105 +1,268 @@
 import os
-import json
 import asyncio
-from typing import List, Any, Optional
+import importlib
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Any, Optional, Set, Tuple
 
 import discord
 from discord import app_commands
 from discord.ext import commands, tasks
 
-# twitchAPI imports
-try:
-    from twitchAPI.twitch import Twitch
-except Exception:
-    Twitch = None
+from utils import metrics, storage
+from utils.durable import DurableDict
+from utils.embed_cache import RenderedEmbed
+from utils.eventsub import EventSubClient
+from utils.helix import AUTH_URL, HELIX_URL, HelixClient
+from utils.sharding import LeaderLock
+from utils.twitch_state import PostRow, StreamRow, StreamStateStore
+from utils.twitch_users import TwitchUserCache
 
 STREAMERS_FILE = "data/streamers.json"
-os.makedirs("data", exist_ok=True)
 
-def load_streamers() -> List[str]:
-    if not os.path.exists(STREAMERS_FILE):
-        return []
-    try:
-        with open(STREAMERS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return []
+# При запуске несколькими процессами (launcher.py) опрашивает Twitch и пишет
+# в каналы только один — держатель этого лока; остальные принимают команды
+# и правят streamers.json, а лидер подхватывает изменения по mtime файла и журнала.
+LEADER_LOCK_FILE = "data/twitch.lock"
+LEADER_RETRY = int(os.getenv("TWITCH_LEADER_RETRY", 15))
 
-def save_streamers(arr: List[str]):
-    with open(STREAMERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(arr, f, indent=2, ensure_ascii=False)
+# канал уведомлений из старого одногильдийного формата
+try:
+    WELCOME_CHANNEL_ID = int(os.getenv("WELCOME_CHANNEL_ID", 0))
+except ValueError:
+    WELCOME_CHANNEL_ID = 0
+# ключ списка из старого формата, пока не известна его гильдия
+LEGACY_GUILD = 0
 
-async def fetch_twitch_users(twitch_client: Any, logins: List[str]) -> List[Any]:
-    try:
-        res = await twitch_client.get_users(logins=logins)
-        if isinstance(res, list):
-            return res
-        if hasattr(res, "data"):
-            return res.data if res.data else []
-        try:
-            return list(res)
-        except Exception:
-            return [res]
-    except TypeError:
-        results = []
-        try:
-            async for page in twitch_client.get_users(logins=logins):
-                if isinstance(page, list):
-                    results.extend(page)
-                elif isinstance(page, dict) and "data" in page:
-                    results.extend(page["data"])
-                else:
-                    results.append(page)
-        except Exception:
-            pass
-        return results
-    except Exception:
-        return []
+# poll — опрос get_streams каждые TWITCH_POLL_INTERVAL секунд;
+# eventsub — push-уведомления, опрос только для сверки раз в TWITCH_RECONCILE_INTERVAL
+TWITCH_MODE = os.getenv("TWITCH_MODE", "poll").strip().lower()
+RECONCILE_INTERVAL = int(os.getenv("TWITCH_RECONCILE_INTERVAL", 300))
+# Twitch требует перепроверять токен раз в час; чаще — только после 401
+APP_TOKEN_VALIDATE_INTERVAL = 3600
 
-async def fetch_streams_pages(twitch_client: Any, logins: List[str]):
-    try:
-        async for page in twitch_client.get_streams_generator(user_login=logins):
-            yield page
-        return
-    except Exception:
-        pass
+# streamers.json: {"<guild_id>": {"channel_id": int | null, "streamer_ids": [twitch user id, ...]}}
+# Списки хранят неизменяемые ID, поэтому переименование канала ничего не ломает.
+# Логины из старых версий ("streamers") переводятся в ID при старте.
+# Изменение гильдии дописывается строкой в streamers.json.journal (utils/durable.py),
+# файл целиком переписывается только при свёртке журнала.
+def _legacy_watchlist(raw: Any) -> Dict[str, Any]:
+    if not isinstance(raw, list):
+        raise ValueError("streamers.json is neither an object nor a list")
+    # старый формат: общий список логинов, уведомления в WELCOME_CHANNEL_ID
+    return {str(LEGACY_GUILD): {"channel_id": WELCOME_CHANNEL_ID or None, "streamers": raw}}
+
+WATCHLISTS = DurableDict(STREAMERS_FILE, legacy=_legacy_watchlist)
+
+async def load_watchlists() -> Dict[int, Dict[str, Any]]:
     try:
-        res = await twitch_client.get_streams(user_login=logins)
-        if isinstance(res, dict) and "data" in res:
-            yield res
-            return
-        if isinstance(res, list):
-            yield {"data": res}
-            return
-    except TypeError:
-        try:
-            async for page in twitch_client.get_streams(user_login=logins):
-                if isinstance(page, dict) and "data" in page:
-                    yield page
-                elif isinstance(page, list):
-                    yield {"data": page}
-                else:
-                    yield page
-        except Exception:
-            return
-    except Exception:
-        return
+        raw = await WATCHLISTS.load()
+    except ValueError as e:
+        # данные снимка остаются в копии, записи журнала — в силе
+        # (проверка и восстановление: python datatool.py validate / import streamers)
+        copy_path = await storage.run_io(storage.preserve_corrupt, STREAMERS_FILE)
+        print(f"[Twitch] {STREAMERS_FILE} повреждён ({e}), копия сохранена в {copy_path}")
+        raw = await WATCHLISTS.reset()
+    except OSError:
+        return {}
+    watchlists = {}
+    for guild_id, entry in raw.items():
+        watchlists[int(guild_id)] = {
+            "channel_id": entry.get("channel_id"),
+            "streamer_ids": [str(s) for s in entry.get("streamer_ids", [])],
+        }
+        if entry.get("streamers"):
+            watchlists[int(guild_id)]["pending_logins"] = [str(s).lower() for s in entry["streamers"]]
+    return watchlists
+
+def watchlists_version() -> Tuple[int, ...]:
+    return WATCHLISTS.version()
+
+async def save_watchlists(watchlists: Dict[int, Dict[str, Any]]):
+    # only the guilds that changed since the last load/save are written
+    data = {}
+    for guild_id, entry in watchlists.items():
+        data[str(guild_id)] = {"channel_id": entry["channel_id"], "streamer_ids": entry["streamer_ids"]}
+        if entry.get("pending_logins"):
+            data[str(guild_id)]["streamers"] = entry["pending_logins"]
+    await WATCHLISTS.save(data)
+
+def make_stream_embed(stream: Dict[str, Any], user: Optional[Dict[str, Any]] = None) -> discord.Embed:
+    login = stream.get("user_login") or (user or {}).get("login") or ""
+    name = stream.get("user_name") or (user or {}).get("display_name") or login
+    title = stream.get("title") or "Stream"
+    game = stream.get("game_name") or "Unknown"
+    viewers = stream.get("viewer_count", "?")
+    embed = discord.Embed(
+        title=title,
+        description=f"Игра: **{game}**\nЗрителей: **{viewers}**",
+        url=f"https://twitch.tv/{login}",
+        color=discord.Color.red()
+    )
+    # аватар берём из кеша пользователей — без запросов к API на каждом тике
+    avatar = (user or {}).get("profile_image_url")
+    embed.set_author(name=f"{name} в эфире!", url=f"https://twitch.tv/{login}", icon_url=avatar)
+    embed.set_footer(text="Twitch Monitor")
+    return embed
 
 class TwitchCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        if Twitch is None:
-            raise RuntimeError("twitchAPI.Twitch not available; install twitchAPI package")
-        self.twitch = Twitch(
+        # twitchAPI (только app token) тяжёлый — импортируется в cog_load в потоке
+        self.twitch = None
+        self._start_task: Optional[asyncio.Task] = None
+        # пакетные запросы каждого тика: по 100 ID, параллельно, с учётом Ratelimit-*
+        self.helix = HelixClient(
             os.getenv("TWITCH_CLIENT_ID"),
-            os.getenv("TWITCH_CLIENT_SECRET"),
-            authenticate_app=False
+            token_provider=self._app_token,
+            concurrency=int(os.getenv("TWITCH_HELIX_CONCURRENCY", 4)),
+            on_unauthorized=self._drop_app_token,
+        )
+        self._token: Optional[str] = None
+        self._token_valid_until = 0.0
+        self._token_lock = asyncio.Lock()
+        # login/имя/аватар по ID: /twitch_add и embed не ходят в API без нужды
+        self.users = TwitchUserCache(self.helix)
+        self.eventsub: Optional[EventSubClient] = None
+        if TWITCH_MODE == "eventsub":
+            # WebSocket-подписки EventSub требуют пользовательский токен, не app token
+            user_token = os.getenv("TWITCH_USER_TOKEN")
+            if user_token:
+                async def eventsub_token() -> str:
+                    return user_token
+                self.eventsub = EventSubClient(
+                    os.getenv("TWITCH_CLIENT_ID"),
+                    token_provider=eventsub_token,
+                    on_event=self.on_twitch_event,
+                )
+            else:
+                print("[Twitch] TWITCH_MODE=eventsub, но TWITCH_USER_TOKEN не задан — используем опрос")
+
+        # guild_id -> {"channel_id", "streamer_ids"}; из него строится channel_subs
+        self.watchlists: Dict[int, Dict[str, Any]] = {}
+        # user_id -> каналы, куда рассылать его стрим (один запрос к Twitch на стримера)
+        self.channel_subs: Dict[str, Set[int]] = {}
+
+        # по user_id
+        self.stream_status: Dict[str, bool] = {}
+        self.stream_ids: Dict[str, str] = {}  # ID текущей трансляции
+        self.live_streams: Dict[str, Dict[str, Any]] = {}  # последние данные стрима в эфире
+        # по (channel_id, user_id)
+        self.stream_messages: Dict[Tuple[int, str], discord.PartialMessage] = {}  # embed-сообщения без лишнего fetch
+        self.rendered: Dict[Tuple[int, str], str] = {}  # хеш последнего отправленного embed
+
+        # состояние переживает рестарт: без повторных анонсов и брошенных embed
+        self.state = StreamStateStore(
+            stream_getter=self._stream_row,
+            post_getter=self._post_row,
+            legacy_channel_id=WELCOME_CHANNEL_ID or None,
         )
-        self.streamers = load_streamers()
-        self.stream_status = {s: False for s in self.streamers}
-        self.stream_messages = {}  # ID embed-сообщений
         self.poll_interval = int(os.getenv("TWITCH_POLL_INTERVAL", 30))
-        bot.loop.create_task(self._start())
+        self.route_concurrency = int(os.getenv("TWITCH_ROUTE_CONCURRENCY", 2))
+        self._edit_semaphore = asyncio.Semaphore(int(os.getenv("TWITCH_EDIT_CONCURRENCY", 8)))
+        self._route_semaphores: Dict[Tuple[str, int], asyncio.Semaphore] = {}
+        # (channel_id, user_id) -> [lock, holders]: one send/edit/delete per message at a time
+        self._post_locks: Dict[Tuple[int, str], List[Any]] = {}
+        self.leader = LeaderLock(LEADER_LOCK_FILE)
+        self._watchlists_version: Tuple[int, ...] = ()
+        # перечитывание streamers.json и правки списков по очереди: правка команды
+        # не попадёт в список, который вот-вот заменит загрузка
+        self._watchlists_lock = asyncio.Lock()
+
+    @property
+    def streamers(self) -> List[str]:
+        """Unique user IDs watched by at least one guild with a notification channel."""
+        return list(self.channel_subs)
+
+    def _rebuild_subscriptions(self):
+        subs: Dict[str, Set[int]] = {}
+        for entry in self.watchlists.values():
+            if not entry.get("channel_id"):
+                continue
+            for user_id in entry["streamer_ids"]:
+                subs.setdefault(user_id, set()).add(entry["channel_id"])
+        self.channel_subs = subs
+
+    async def _retain_users(self):
+        # записи Twitch-пользователей — только тех, кто есть хоть в одном списке
+        await self.users.retain({user_id for entry in self.watchlists.values() for user_id in entry["streamer_ids"]})
+
+    async def cog_load(self):
+        # before the commands are registered, so /twitch_add can't race the load
+        self._watchlists_version = watchlists_version()
+        self.watchlists = await load_watchlists()
+        self._rebuild_subscriptions()
+        await self.users.load()
+        await self._retain_users()
+
+        twitch_module = await storage.run_io(importlib.import_module, "twitchAPI.twitch")
+        self.twitch = twitch_module.Twitch(
+            os.getenv("TWITCH_CLIENT_ID"),
+            os.getenv("TWITCH_CLIENT_SECRET"),
+            authenticate_app=False,
+            base_url=HELIX_URL,
+            auth_base_url=AUTH_URL,
+        )
+        self._start_task = asyncio.create_task(self._start())
+
+    async def _app_token(self) -> str:
+        # get_refreshed_app_token() validates the token on id.twitch.tv on every call,
+        # so it is called once per APP_TOKEN_VALIDATE_INTERVAL (or after a 401), not per request
+        if self._token is None or time.monotonic() >= self._token_valid_until:
+            async with self._token_lock:
+                if self._token is None or time.monotonic() >= self._token_valid_until:
+                    token = await self.twitch.get_refreshed_app_token()
+                    if not token:
+                        raise RuntimeError("no Twitch app token (authentication failed)")
+                    self._token = token
+                    self._token_valid_until = time.monotonic() + APP_TOKEN_VALIDATE_INTERVAL
+        return self._token
+
+    def _drop_app_token(self):
+        self._token = None
+
+    def _apply_state(self, streams: Dict[str, Dict[str, Any]], posts: Dict[Tuple[int, str], Dict[str, Any]]):
+        for user_id, row in streams.items():
+            if user_id not in self.channel_subs:
+                self.state.mark_stream(user_id)  # убрали из списков, пока бот был выключен
+                continue
+            self.stream_status[user_id] = row["live"]
+            if row["stream_id"]:
+                self.stream_ids[user_id] = row["stream_id"]
+        # сообщения, отправленные до рестарта: ручки без fetch_message
+        for (channel_id, user_id), row in posts.items():
+            if row["message_id"]:
+                key = (channel_id, user_id)
+                channel = self.bot.get_partial_messageable(channel_id)
+                self.stream_messages[key] = channel.get_partial_message(row["message_id"])
+                if row["payload_hash"]:
+                    self.rendered[key] = row["payload_hash"]
+
+    def _stream_row(self, user_id: str) -> Optional[StreamRow]:
+        if user_id not in self.channel_subs:
+            return None
+        return bool(self.stream_status.get(user_id)), self.stream_ids.get(user_id)
+
+    def _post_row(self, channel_id: int, user_id: str) -> Optional[PostRow]:
+        handle = self.stream_messages.get((channel_id, user_id))
+        if handle is None:
+            return None
+        return handle.id, self.rendered.get((channel_id, user_id))
+
+    async def cog_unload(self):
+        if self._start_task is not None:
+            self._start_task.cancel()  # ещё ждёт лидерства или готовности бота
+        self.check_streams.cancel()
+        self.poll_unsubscribed.cancel()
+        self.watch_watchlists.cancel()
+        if self.eventsub is not None:
+            await self.eventsub.stop()
+        await self.helix.close()
+        if self.twitch is not None:
+            await self.twitch.close()
+        await self.state.close()
+        await self.users.close()
+        self.leader.release()
 
     async def _start(self):
         try:
@@ -112,129 +275,431 @@ class TwitchCog(commands.Cog):
                     break
                 except Exception:
                     continue
-        self.check_streams.change_interval(seconds=self.poll_interval)
+
+        await self._become_leader()
+        # состояние стримов принадлежит лидеру: до этого момента его держал другой процесс
+        streams, posts = await self.state.load()
+        # строки старых версий адресованы логинами: применим после перевода в ID (_migrate_logins)
+        if not self.state.needs_rekey:
+            self._apply_state(streams, posts)
+        await self._migrate_logins()
+        await self.bot.wait_until_ready()
+        await self._adopt_legacy_watchlist()
+        await self._sweep_posts()
+
+        interval = self.poll_interval
+        if self.eventsub is not None:
+            self.eventsub.start(self.streamers)
+            # опрос остаётся медленной сверкой на случай потерянных событий
+            interval = RECONCILE_INTERVAL
+            # кого не удалось подписать, опрашиваем как в режиме poll
+            self.poll_unsubscribed.change_interval(seconds=self.poll_interval)
+            self.poll_unsubscribed.start()
+        self.check_streams.change_interval(seconds=interval)
         self.check_streams.start()
+        self.watch_watchlists.start()
+
+    async def _become_leader(self):
+        if self.leader.acquire():
+            return
+        print(f"[Twitch] Мониторинг ведёт другой процесс, ждём освобождения {LEADER_LOCK_FILE}")
+        while not self.leader.acquire():
+            await asyncio.sleep(LEADER_RETRY)
+            await self._sync_watchlists()  # чтобы /twitch_list в этом процессе был актуален
+        print("[Twitch] Этот процесс стал ведущим для мониторинга Twitch")
+        await self._sync_watchlists()
 
-    async def get_user_by_login(self, login: str) -> Optional[Any]:
-        res = await fetch_twitch_users(self.twitch, [login])
-        return res[0] if res else None
+    async def _sync_watchlists(self):
+        async with self._watchlists_lock:
+            await self._reload_watchlists()
+
+    async def _reload_watchlists(self):
+        # caller holds _watchlists_lock
+        # streamers.json правят все процессы: команда приходит в процесс шарда своей гильдии
+        version = watchlists_version()
+        if version == self._watchlists_version:
+            return
+        old = set(self.channel_subs)
+        self.watchlists = await load_watchlists()
+        # версия, прочитанная до загрузки: запись во время загрузки изменит её, и сверка повторится
+        self._watchlists_version = version
+        self._rebuild_subscriptions()
+        await self._retain_users()
+        if not self.leader.held:
+            return
+        await self._forget_streamers(old - set(self.channel_subs))
+        if self.eventsub is not None:
+            for user_id in set(self.channel_subs) - old:
+                await self.eventsub.subscribe(user_id)
+        await self._sweep_posts()
+        # новые каналы получают embed уже идущих стримов
+        await asyncio.gather(*(self._show_live(user_id, stream) for user_id, stream in list(self.live_streams.items())))
+
+    @tasks.loop(seconds=LEADER_RETRY)
+    async def watch_watchlists(self):
+        await self._sync_watchlists()
+
+    async def _migrate_logins(self):
+        # логины из старого streamers.json и старого twitch.db -> user ID
+        logins = {login for entry in self.watchlists.values() for login in entry.get("pending_logins", ())}
+        if self.state.needs_rekey:
+            streams, posts = await self.state.read()
+            logins.update(streams)
+            logins.update(user_id for _, user_id in posts)
+        if not logins:
+            return
+        try:
+            users = await self.users.get_by_logins(logins)
+        except Exception as e:
+            print(f"[Twitch] Не удалось перевести логины в ID, повторим при следующем запуске: {e}")
+            return
+        mapping = {login: user["id"] for login, user in users.items()}
+
+        async with self._watchlists_lock:
+            changed = False
+            for entry in self.watchlists.values():
+                pending = entry.pop("pending_logins", None)
+                if not pending:
+                    continue
+                changed = True
+                for login in pending:
+                    user_id = mapping.get(login)
+                    if user_id is None:
+                        print(f"[Twitch] Стример {login} не найден на Twitch, убран из списка")
+                    elif user_id not in entry["streamer_ids"]:
+                        entry["streamer_ids"].append(user_id)
+            if changed:
+                self._rebuild_subscriptions()
+                await save_watchlists(self.watchlists)
+        if self.state.needs_rekey:
+            await self.state.rekey(mapping)
+            self._apply_state(*await self.state.read())
+
+    async def _adopt_legacy_watchlist(self):
+        async with self._watchlists_lock:
+            await self._adopt_legacy()
+
+    async def _adopt_legacy(self):
+        # старый общий список переезжает в гильдию канала WELCOME_CHANNEL_ID
+        legacy = self.watchlists.get(LEGACY_GUILD)
+        if legacy is None:
+            return
+        channel = self.bot.get_channel(legacy["channel_id"] or 0)
+        guild = getattr(channel, "guild", None)
+        if guild is None:
+            print("[Twitch] Не удалось определить гильдию для старого списка стримеров (WELCOME_CHANNEL_ID)")
+            return
+        entry = self.watchlists.setdefault(guild.id, {"channel_id": channel.id, "streamer_ids": []})
+        for user_id in legacy["streamer_ids"]:
+            if user_id not in entry["streamer_ids"]:
+                entry["streamer_ids"].append(user_id)
+        if legacy.get("pending_logins"):
+            entry.setdefault("pending_logins", []).extend(legacy["pending_logins"])
+        del self.watchlists[LEGACY_GUILD]
+        self._rebuild_subscriptions()
+        await save_watchlists(self.watchlists)
+
+    async def _sweep_posts(self):
+        # embed-сообщения в каналах, которые больше не следят за стримером
+        stale = [key for key in self.stream_messages if key[0] not in self.channel_subs.get(key[1], ())]
+        await asyncio.gather(*(self._close_post(channel_id, user_id, announce=False) for channel_id, user_id in stale))
+
+    async def on_twitch_event(self, event_type: str, event: Dict[str, Any]):
+        user_id = event.get("broadcaster_user_id")
+        if user_id not in self.channel_subs:
+            return
+
+        if event_type == "stream.online":
+            # в событии нет названия/игры/зрителей — берём их из get_streams
+            streams = await self.helix.get_streams(user_ids=[user_id])
+            stream = streams[0] if streams else {
+                "id": event.get("id"),
+                "user_id": user_id,
+                "user_login": event.get("broadcaster_user_login"),
+                "user_name": event.get("broadcaster_user_name"),
+            }
+            await self._show_live(user_id, stream)
+        elif event_type == "stream.offline":
+            if self.stream_status.get(user_id):
+                await self._show_offline(user_id)
+        elif event_type == "channel.update":
+            stream = self.live_streams.get(user_id)
+            if stream is None:
+                return  # не в эфире — обновлять нечего
+            stream = dict(stream, title=event.get("title"), game_name=event.get("category_name"))
+            await self._show_live(user_id, stream)
 
     @tasks.loop(seconds=30)
     async def check_streams(self):
-        if not self.streamers:
+        with metrics.TWITCH_POLL_SECONDS.time():
+            await self._poll()
+
+    @tasks.loop(seconds=30)
+    async def poll_unsubscribed(self):
+        # лимит подписок сессии, ошибки, отзыв: без событий стример ждал бы сверки
+        user_ids = [user_id for user_id in self.eventsub.failed if user_id in self.channel_subs]
+        metrics.TWITCH_EVENTSUB_POLLED.set(len(user_ids))
+        if user_ids:
+            with metrics.TWITCH_POLL_SECONDS.time():
+                await self._poll(user_ids)
+
+    async def _poll(self, user_ids: Optional[List[str]] = None):
+        if user_ids is None:
+            user_ids = self.streamers
+        if not user_ids:
             return
-        channel_id = int(os.getenv("WELCOME_CHANNEL_ID", 0))
-        channel = self.bot.get_channel(channel_id)
-        if not channel:
+
+        try:
+            # один запрос на уникального стримера, сколько бы гильдий за ним ни следили
+            streams = await self.helix.get_streams(user_ids=user_ids)
+        except Exception as e:
+            metrics.ERRORS.inc(source="twitch_poll")
+            print(f"[Twitch] Ошибка запроса стримов: {e}")
             return
+        try:
+            # устаревшие записи (аватар, имя) обновляются пачками по 100 ID
+            await self.users.refresh(user_ids)
+        except Exception as e:
+            metrics.ERRORS.inc(source="twitch_users")
+            print(f"[Twitch] Ошибка обновления пользователей: {e}")
+
+        live_now = {stream["user_id"]: stream for stream in streams if stream.get("user_id")}
+
+        # Изменения отправляем параллельно
+        jobs = [self._show_live(user_id, stream) for user_id, stream in live_now.items()]
+        jobs += [
+            self._show_offline(user_id) for user_id in user_ids
+            if self.stream_status.get(user_id, False) and user_id not in live_now
+        ]
+        if jobs:
+            await asyncio.gather(*jobs)
+
+    async def _limited(self, route: str, channel_id: int, call):
+        # Discord считает лимиты по маршруту и каналу: отправка, правка и удаление
+        # сообщений в одном канале — разные бакеты. Держим в полёте не больше
+        # TWITCH_ROUTE_CONCURRENCY запросов на бакет и TWITCH_EDIT_CONCURRENCY всего,
+        # остальное ждёт здесь, а не в очереди HTTP-клиента.
+        key = (route, channel_id)
+        route_sem = self._route_semaphores.get(key)
+        if route_sem is None:
+            route_sem = self._route_semaphores[key] = asyncio.Semaphore(self.route_concurrency)
+        async with self._edit_semaphore, route_sem:
+            return await call()
 
-        for s in self.streamers:
-            self.stream_status.setdefault(s, False)
+    async def _show_live(self, user_id: str, stream: Dict[str, Any]):
+        stream_id = stream.get("id")
+        if stream_id and self.stream_ids.get(user_id) not in (None, stream_id) and self.stream_status.get(user_id):
+            # прошлая трансляция закончилась, пока бот был оффлайн
+            await self._show_offline(user_id)
+        if not self.stream_status.get(user_id) or (stream_id and self.stream_ids.get(user_id) != stream_id):
+            self.stream_status[user_id] = True
+            if stream_id:
+                self.stream_ids[user_id] = stream_id
+            self.state.mark_stream(user_id)
+        self.live_streams[user_id] = stream
 
-        live_now = set()
-        async for page in fetch_streams_pages(self.twitch, self.streamers):
-            data = page.get("data") if isinstance(page, dict) else (page if isinstance(page, list) else [])
-            for stream in data:
+        # embed одинаков для всех гильдий: собираем один раз на тик, рассылаем по каналам.
+        # Не кешируется: число зрителей меняется почти на каждом опросе
+        rendered = RenderedEmbed(make_stream_embed(stream, self.users.get(user_id)))
+        jobs = []
+        for channel_id in list(self.channel_subs.get(user_id, ())):
+            if (channel_id, user_id) in self.stream_messages and self.rendered.get((channel_id, user_id)) == rendered.digest:
+                metrics.EMBED_SENDS_SKIPPED.inc(embed="stream")
+                continue
+            jobs.append(self._render_live(channel_id, user_id, rendered.embed, rendered.digest))
+        if jobs:
+            await asyncio.gather(*jobs)
+
+    @asynccontextmanager
+    async def _post_lock(self, key: Tuple[int, str]) -> AsyncIterator[None]:
+        # сверка, резервный опрос, события EventSub и синхронизация списков идут параллельно:
+        # без лока двое увидят, что сообщения нет, и отправят два embed
+        entry = self._post_locks.get(key)
+        if entry is None:
+            entry = self._post_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._post_locks[key]
+
+    async def _render_live(self, channel_id: int, user_id: str, embed: discord.Embed, digest: str):
+        key = (channel_id, user_id)
+        async with self._post_lock(key):
+            if not self.stream_status.get(user_id) or channel_id not in self.channel_subs.get(user_id, ()):
+                return  # пока ждали, стрим закончился или канал отписался
+            if key in self.stream_messages and self.rendered.get(key) == digest:
+                return  # тот же embed уже отправил другой вызов
+            await self._post_live(channel_id, user_id, embed, digest)
+
+    async def _post_live(self, channel_id: int, user_id: str, embed: discord.Embed, digest: str):
+        key = (channel_id, user_id)
+        channel = self.bot.get_partial_messageable(channel_id)
+        handle = self.stream_messages.get(key)
+        try:
+            if handle is not None:
                 try:
-                    name = stream.get("user_login") or getattr(stream, "user_login", None) or getattr(stream, "user_name", None)
-                except Exception:
-                    continue
-                if not name:
-                    continue
+                    await self._limited("edit", channel_id, lambda: handle.edit(embed=embed))
+                except discord.NotFound:
+                    handle = None  # сообщение удалили руками — отправим заново
+            if handle is None:
+                msg = await self._limited("send", channel_id, lambda: channel.send(embed=embed))
+                self.stream_messages[key] = channel.get_partial_message(msg.id)
+            self.rendered[key] = digest
+            self.state.mark_post(channel_id, user_id)
+        except Exception as e:
+            metrics.ERRORS.inc(source="twitch_post")
+            print(f"[Twitch] Не удалось обновить сообщение {self.users.login_of(user_id)} в {channel_id}: {e}")
 
-                name = name.lower()
-                live_now.add(name)
+    async def _show_offline(self, user_id: str):
+        stream = self.live_streams.pop(user_id, None) or {}
+        name = stream.get("user_name") or self.users.display_name_of(user_id)
+        self.stream_status[user_id] = False
+        self.stream_ids.pop(user_id, None)
+        self.state.mark_stream(user_id)
+        channels = set(self.channel_subs.get(user_id, ()))
+        channels.update(channel_id for channel_id, uid in self.stream_messages if uid == user_id)
+        await asyncio.gather(*(self._close_post(channel_id, user_id, name) for channel_id in channels))
+
+    async def _close_post(self, channel_id: int, user_id: str, name: Optional[str] = None, announce: bool = True):
+        async with self._post_lock((channel_id, user_id)):
+            handle = self.stream_messages.pop((channel_id, user_id), None)
+            self.rendered.pop((channel_id, user_id), None)
+            if handle is not None:
+                self.state.mark_post(channel_id, user_id)
+                try:
+                    await self._limited("delete", channel_id, handle.delete)
+                except Exception:
+                    pass
+        if not announce or channel_id not in self.channel_subs.get(user_id, ()):
+            return
+        channel = self.bot.get_partial_messageable(channel_id)
+        name = name or self.users.display_name_of(user_id)
+        try:
+            await self._limited("send", channel_id, lambda: channel.send(f"⚫ **{name}** закончил стрим."))
+        except Exception as e:
+            metrics.ERRORS.inc(source="twitch_post")
+            print(f"[Twitch] Не удалось отправить сообщение {name} в {channel_id}: {e}")
 
-                title = stream.get("title") if isinstance(stream, dict) else getattr(stream, "title", "Stream")
-                game = stream.get("game_name") if isinstance(stream, dict) else getattr(stream, "game_name", "Unknown")
-                viewers = stream.get("viewer_count") if isinstance(stream, dict) else getattr(stream, "viewer_count", "?")
+    async def _watchlist_changed(self, removed: Set[str] = frozenset()):
+        # Пересобираем рассылку; стримеров, за которыми больше никто не следит,
+        # забываем целиком (и отписываемся от EventSub)
+        self._rebuild_subscriptions()
+        before = watchlists_version()
+        await save_watchlists(self.watchlists)
+        if before == self._watchlists_version:
+            # своя запись; если до неё успел записать другой процесс — перечитаем при сверке
+            self._watchlists_version = watchlists_version()
+        await self._retain_users()
+        if self.leader.held:
+            await self._forget_streamers(removed)
 
-                embed = discord.Embed(
-                    title=title,
-                    description=f"Игра: **{game}**\nЗрителей: **{viewers}**",
-                    url=f"https://twitch.tv/{name}",
-                    color=discord.Color.red()
-                )
-                embed.set_author(name=f"{name} в эфире!", url=f"https://twitch.tv/{name}")
-                embed.set_footer(text="Twitch Monitor")
-
-                if name in self.stream_messages:
-                    try:
-                        msg = await channel.fetch_message(self.stream_messages[name])
-                        await msg.edit(embed=embed)
-                    except Exception:
-                        msg = await channel.send(embed=embed)
-                        self.stream_messages[name] = msg.id
-                else:
-                    msg = await channel.send(embed=embed)
-                    self.stream_messages[name] = msg.id
-
-                self.stream_status[name] = True
-
-        for name in list(self.streamers):
-            was_live = self.stream_status.get(name, False)
-            is_live = name in live_now
-            if was_live and not is_live:
-                if name in self.stream_messages:
-                    try:
-                        old_msg = await channel.fetch_message(self.stream_messages[name])
-                        await old_msg.delete()
-                    except Exception:
-                        pass
-                    self.stream_messages.pop(name, None)
-
-                await channel.send(f"⚫ **{name}** закончил стрим.")
-                self.stream_status[name] = False
+    async def _forget_streamers(self, removed: Set[str]):
+        for user_id in removed:
+            if user_id in self.channel_subs:
+                continue
+            self.stream_status.pop(user_id, None)
+            self.stream_ids.pop(user_id, None)
+            self.live_streams.pop(user_id, None)
+            self.state.mark_stream(user_id)
+            if self.eventsub is not None:
+                await self.eventsub.unsubscribe(user_id)
 
     # -------------------
     # commands
     # -------------------
     @app_commands.command(name="twitch_add", description="Добавить стримера в список мониторинга")
+    @app_commands.guild_only()
     async def twitch_add(self, interaction: discord.Interaction, streamer: str):
         login = streamer.strip().lower()
         await interaction.response.defer(ephemeral=True)
         try:
-            user = await self.get_user_by_login(login)
+            user = await self.users.get_by_login(login)
         except Exception as e:
             return await interaction.followup.send(f"Ошибка при проверке Twitch: {e}", ephemeral=True)
 
         if not user:
             return await interaction.followup.send(f"❌ Стример `{login}` не найден.", ephemeral=True)
 
-        uname = None
-        try:
-            uname = user.get("login") if isinstance(user, dict) else getattr(user, "login", None) or getattr(user, "user_login", None) or getattr(user, "user_name", None)
-        except Exception:
-            uname = None
-        if not uname:
-            uname = getattr(user, "display_name", None) or getattr(user, "name", None) or login
+        user_id = user["id"]
+        async with self._watchlists_lock:
+            await self._reload_watchlists()  # не затереть правки других процессов
+            entry = self.watchlists.setdefault(interaction.guild_id, {"channel_id": None, "streamer_ids": []})
+            if user_id in entry["streamer_ids"]:
+                return await interaction.followup.send(f"⚠️ `{user['login']}` уже в списке.", ephemeral=True)
 
-        uname = str(uname).lower()
-        if uname in self.streamers:
-            return await interaction.followup.send(f"⚠️ `{uname}` уже в списке.", ephemeral=True)
+            note = ""
+            if not entry["channel_id"]:
+                entry["channel_id"] = interaction.channel_id
+                note = f"\nУведомления будут приходить в <#{interaction.channel_id}> (сменить: `/twitch_channel`)."
 
-        self.streamers.append(uname)
-        save_streamers(self.streamers)
-        self.stream_status[uname] = False
-        return await interaction.followup.send(f"✅ `{uname}` добавлен для мониторинга.", ephemeral=True)
+            newly_watched = user_id not in self.channel_subs
+            entry["streamer_ids"].append(user_id)
+            await self._watchlist_changed()
+        if newly_watched and self.leader.held and self.eventsub is not None:
+            await self.eventsub.subscribe(user_id)
+        return await interaction.followup.send(f"✅ `{user['login']}` добавлен для мониторинга.{note}", ephemeral=True)
 
     @app_commands.command(name="twitch_remove", description="Удалить стримера из мониторинга")
+    @app_commands.guild_only()
     async def twitch_remove(self, interaction: discord.Interaction, streamer: str):
         login = streamer.strip().lower()
-        if login not in self.streamers:
-            return await interaction.response.send_message(f"⚠️ `{login}` нет в списке.", ephemeral=True)
-        self.streamers.remove(login)
-        save_streamers(self.streamers)
-        self.stream_status.pop(login, None)
-        self.stream_messages.pop(login, None)
-        return await interaction.response.send_message(f"🗑️ `{login}` удалён.", ephemeral=True)
+        await interaction.response.defer(ephemeral=True)
+        try:
+            user = await self.users.get_by_login(login)
+        except Exception:
+            user = None
+        async with self._watchlists_lock:
+            await self._reload_watchlists()
+            entry = self.watchlists.get(interaction.guild_id)
+            if not entry or not user or user["id"] not in entry["streamer_ids"]:
+                return await interaction.followup.send(f"⚠️ `{login}` нет в списке.", ephemeral=True)
+            user_id = user["id"]
+            entry["streamer_ids"].remove(user_id)
+            channel_id = entry["channel_id"]
+            await self._watchlist_changed(removed={user_id})
+        await interaction.followup.send(f"🗑️ `{login}` удалён.", ephemeral=True)
+        if channel_id and self.leader.held:
+            await self._close_post(channel_id, user_id, announce=False)
 
     @app_commands.command(name="twitch_list", description="Показать список отслеживаемых стримеров")
+    @app_commands.guild_only()
     async def twitch_list(self, interaction: discord.Interaction):
-        if not self.streamers:
+        entry = self.watchlists.get(interaction.guild_id)
+        if not entry or not entry["streamer_ids"]:
             return await interaction.response.send_message("📭 Список пуст.", ephemeral=True)
-        text = "\n".join(f"• {s}" for s in self.streamers)
-        return await interaction.response.send_message(f"📜 **Отслеживаемые стримеры:**\n{text}", ephemeral=True)
+        text = "\n".join(
+            f"• {self.users.display_name_of(user_id)} (`{self.users.login_of(user_id)}`)"
+            for user_id in entry["streamer_ids"]
+        )
+        where = f"<#{entry['channel_id']}>" if entry["channel_id"] else "канал не задан"
+        return await interaction.response.send_message(f"📜 **Отслеживаемые стримеры** ({where}):\n{text}", ephemeral=True)
+
+    @app_commands.command(name="twitch_channel", description="Канал для уведомлений о стримах")
+    @app_commands.guild_only()
+    @app_commands.default_permissions(manage_guild=True)
+    async def twitch_channel(self, interaction: discord.Interaction, channel: discord.TextChannel):
+        # у лидера синхронизация ходит в Discord и Twitch — дольше 3 секунд на ответ
+        await interaction.response.defer(ephemeral=True)
+        async with self._watchlists_lock:
+            await self._reload_watchlists()
+            entry = self.watchlists.setdefault(interaction.guild_id, {"channel_id": None, "streamer_ids": []})
+            old_channel_id = entry["channel_id"]
+            entry["channel_id"] = channel.id
+            await self._watchlist_changed()
+        await interaction.followup.send(f"📺 Уведомления о стримах: {channel.mention}", ephemeral=True)
+        if old_channel_id and old_channel_id != channel.id and self.leader.held:
+            # embed из старого канала переезжают в новый
+            await asyncio.gather(*(
+                self._close_post(old_channel_id, user_id, announce=False) for user_id in entry["streamer_ids"]
+            ))
+            await asyncio.gather(*(
+                self._show_live(user_id, self.live_streams[user_id])
+                for user_id in entry["streamer_ids"] if user_id in self.live_streams
+            ))
 
 async def setup(bot: commands.Bot):
-    await bot.add_cog(TwitchCog(bot))
\ No newline at end of file
+    await bot.add_cog(TwitchCog(bot))
@@ -5,23 +5,51 @@ Creates a private room when connected to the parent channel.
 import os
 from discord.ext import commands
 
+from utils.sharding import format_shard_ids
+from utils.voice_rooms import VOICE_INDEX_FILE, RoomManager
+
+# конфигурация читается один раз, а не на каждое голосовое событие
+HUB_CHANNEL_ID = int(os.getenv("VOICE_CHANNEL_ID", 0))
+POOL_SIZE = int(os.getenv("VOICE_POOL_SIZE", 2))
+ROOM_GRACE = float(os.getenv("VOICE_ROOM_GRACE", 30))
+
 class VoiceManager(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        # комнаты создаёт/удаляет очередь гильдии, а не сам обработчик события:
+        # всплеск заходов не превращается во всплеск create_voice_channel
+        index_path = VOICE_INDEX_FILE
+        if getattr(bot, "shard_ids", None) is not None:
+            # у каждого процесса свои гильдии — и свой индекс, чтобы не перетирать чужой
+            index_path = index_path.replace(".json", f".shards-{format_shard_ids(sorted(bot.shard_ids))}.json")
+        self.rooms = RoomManager(get_guild=bot.get_guild, pool_size=POOL_SIZE, grace=ROOM_GRACE, index_path=index_path)
+
+    async def cog_load(self):
+        await self.rooms.load()
+        if self.bot.is_ready():
+            self.rooms.reconcile()  # перезагрузка расширения на живом боте
+
+    async def cog_unload(self):
+        await self.rooms.close()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # комнаты, удалённые или опустевшие, пока бот был оффлайн
+        self.rooms.reconcile()
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
-        if after.channel and after.channel.id == int(os.getenv("VOICE_CHANNEL_ID", 0)):
-            new_room = await member.guild.create_voice_channel(
-                name=f"{member.name}'s Personal Room",
-                category=after.channel.category
-            )
-            await new_room.set_permissions(member, connect=True, view_channel=True)
-            await member.move_to(new_room)
+        if before.channel == after.channel:
+            return  # mute/deafen/stream
+
+        if after.channel and after.channel.id == HUB_CHANNEL_ID:
+            self.rooms.request_room(member, after.channel)
+        elif after.channel and self.rooms.is_room(after.channel):
+            self.rooms.room_joined(after.channel)
 
-        if before.channel and before.channel.name.endswith("'s Personal Room") and len(before.channel.members) == 0:
-            await before.channel.delete()
+        if before.channel and self.rooms.is_room(before.channel) and len(before.channel.members) == 0:
+            self.rooms.room_left(before.channel)
 
 async def setup(bot):
-    await bot.add_cog(VoiceManager(bot))
\ No newline at end of file
+    await bot.add_cog(VoiceManager(bot))
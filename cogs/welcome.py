@@ -1,20 +1,35 @@
 """ <summary>
-Greets a new member of the server with a welcome message.
+Greets new members of the server with a welcome message; joins arriving
+together are greeted together (see utils/welcome_queue.py).
 </summary> """
 
 import os
 import discord, discord.ext.commands as commands
 
+from utils.welcome_queue import WelcomeQueue
+
+# конфигурация читается один раз, а не на каждый заход
+WELCOME_CHANNEL_ID = int(os.getenv("WELCOME_CHANNEL_ID", 0))
+WELCOME_WINDOW = float(os.getenv("WELCOME_BATCH_WINDOW", 2))
+WELCOME_MAX_PENDING = int(os.getenv("WELCOME_MAX_PENDING", 1000))
+
 class Welcome(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.queue = WelcomeQueue(get_guild=bot.get_guild, channel_id=WELCOME_CHANNEL_ID,
+                                  window=WELCOME_WINDOW, max_pending=WELCOME_MAX_PENDING)
+
+    async def cog_unload(self):
+        await self.queue.close()
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
-        channel = member.guild.get_channel(int(os.getenv("WELCOME_CHANNEL_ID", 0)))
-        if channel:
-            await channel.send(f"Добро пожаловать, {member.mention}! 🎉")
+        self.queue.add(member)
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        self.queue.discard(payload.guild_id, payload.user.id)
 
 async def setup(bot):
-    await bot.add_cog(Welcome(bot))
\ No newline at end of file
+    await bot.add_cog(Welcome(bot))
@@ -0,0 +1,484 @@
+""" <summary>
+Offline maintenance of the bot's data files; run it while the bot is stopped:
+    python datatool.py export profiles -o profiles.ndjson
+    python datatool.py import profiles profiles.ndjson [--replace] [--repair]
+    python datatool.py export streamers -o streamers.ndjson
+    python datatool.py import streamers streamers.ndjson [--replace]
+    python datatool.py validate [--repair]
+    python datatool.py vacuum
+Profiles are streamed row by row and written in batches, so memory does not
+grow with the number of profiles. Files are replaced atomically (temp file +
+rename) and every command that changes data keeps the previous version as <file>.bak.
+</summary> """
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+from urllib.request import pathname2url
+
+from utils.profile_model import DEFAULT_GAMES, DEFAULT_SERVERS, Profile
+from utils.profile_repo import SCHEMA_VERSION, ProfileRepository
+from utils.sharding import LeaderLock
+from utils.durable import Journal
+from utils.storage import atomic_open
+
+DB_PATH = "data/profiles.db"
+LEGACY_JSON_PATH = "data/profiles.json"
+STREAMERS_PATH = "data/streamers.json"
+# держит (shared) каждый процесс бота, пока он работает: bot.py BOT_LOCK_FILE
+LOCK_PATH = "data/bot.lock"
+
+BATCH = 1000  # profiles per transaction
+MAX_REPORTED = 20  # problems printed one by one, the rest are only counted
+
+SQL_EXPORT = "SELECT id, gender, age, games, servers, custom_role_request, extra FROM profiles ORDER BY id"
+
+
+class Report:
+    def __init__(self):
+        self.problems = 0
+        self.repaired = 0
+
+    def problem(self, where: str, what: str, repaired: bool = False) -> None:
+        self.problems += 1
+        self.repaired += repaired
+        if self.problems <= MAX_REPORTED:
+            print(f"  {where}: {what}{' (исправлено)' if repaired else ''}", file=sys.stderr)
+        elif self.problems == MAX_REPORTED + 1:
+            print("  ...", file=sys.stderr)
+
+    @property
+    def unresolved(self) -> int:
+        return self.problems - self.repaired
+
+
+# ---------- files ----------
+@contextmanager
+def open_output(path: Optional[str]) -> Iterator[IO[str]]:
+    if not path or path == "-":
+        yield sys.stdout
+    else:
+        with atomic_open(path, backup=True) as f:
+            yield f
+
+
+@contextmanager
+def open_input(path: str) -> Iterator[IO[str]]:
+    if path == "-":
+        yield sys.stdin
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield f
+
+
+def read_ndjson(f: IO[str], report: Report) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(line number, object) of every non-empty line; broken lines are reported and skipped."""
+    for line_no, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            report.problem(f"строка {line_no}", f"не JSON ({e})")
+            continue
+        if not isinstance(record, dict):
+            report.problem(f"строка {line_no}", "не объект")
+            continue
+        yield line_no, record
+
+
+def ensure_bot_stopped(args: argparse.Namespace) -> Optional[LeaderLock]:
+    # бот держит профили в памяти и допишет их поверх импорта;
+    # пока лок у нас, бот не запустится
+    if args.force:
+        return None
+    lock = LeaderLock(LOCK_PATH)
+    if not lock.acquire():
+        sys.exit(f"[Data] Похоже, бот запущен ({LOCK_PATH} занят). Остановите его или используйте --force.")
+    return lock
+
+
+# ---------- profiles.db ----------
+def open_repo(db_path: str) -> ProfileRepository:
+    # profiles.json belongs to the bot's own database: a scratch --db must not import
+    # (and rename) it, or the real database could no longer migrate it
+    is_default = os.path.abspath(db_path) == os.path.abspath(DB_PATH)
+    repo = ProfileRepository(db_path, legacy_json_path=LEGACY_JSON_PATH if is_default else None)
+    repo.open_sync()
+    return repo
+
+
+def open_readonly(db_path: str) -> sqlite3.Connection:
+    """Reading commands never migrate: the schema and profiles.json stay as the bot left them."""
+    return sqlite3.connect("file:" + pathname2url(os.path.abspath(db_path)) + "?mode=ro", uri=True)
+
+
+def schema_problem(conn: sqlite3.Connection, db_path: str) -> Optional[str]:
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return None
+    return (f"схема версии {version}, нужна {SCHEMA_VERSION}: её обновит запуск бота "
+            f"или python datatool.py validate --repair")
+
+
+def backup_db(db_path: str) -> bool:
+    """
+    Consistent copy through SQLite's online backup (includes the WAL). Taken
+    before open_repo, so the .bak holds the database as it was, pre-migration.
+    """
+    if not os.path.exists(db_path):
+        return False
+    tmp_path = db_path + ".bak.tmp"
+    src, dest = sqlite3.connect(db_path), sqlite3.connect(tmp_path)
+    try:
+        src.backup(dest)
+    finally:
+        dest.close()
+        src.close()
+    os.replace(tmp_path, db_path + ".bak")
+    return True
+
+
+def decode_row(row: Tuple) -> Tuple[Profile, List[str]]:
+    try:
+        profile = Profile.from_row(row[1:])
+        if profile.extra is not None and not isinstance(profile.extra, dict):
+            raise ValueError
+    except ValueError:
+        return Profile.from_row(row[1:6] + (None,)), ["extra не JSON-объект"]
+    return profile, []
+
+
+def _index_tables() -> List[Tuple[str, str, str, int]]:
+    # (table, key column, mask column of profiles, registry size)
+    return [
+        ("profile_games", "game", "games", len(DEFAULT_GAMES)),
+        ("profile_servers", "server", "servers", len(DEFAULT_SERVERS)),
+    ]
+
+
+def check_search_index(conn: sqlite3.Connection) -> int:
+    """Index rows that disagree with the masks in profiles (stale or missing); counted in SQL."""
+    mismatches = 0
+    for table, key, column, size in _index_tables():
+        mismatches += conn.execute(
+            f"SELECT COUNT(*) FROM {table} t LEFT JOIN profiles p ON p.id = t.user_id "
+            f"WHERE p.id IS NULL OR ((p.{column} >> t.{key}) & 1) = 0"
+        ).fetchone()[0]
+        for bit in range(size):
+            mismatches += conn.execute(
+                f"SELECT COUNT(*) FROM profiles p WHERE ((p.{column} >> ?) & 1) = 1 "
+                f"AND NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{key} = ? AND t.user_id = p.id)",
+                (bit, bit),
+            ).fetchone()[0]
+    return mismatches
+
+
+def rebuild_search_index(conn: sqlite3.Connection) -> None:
+    with conn:
+        for table, key, column, size in _index_tables():
+            conn.execute(f"DELETE FROM {table}")
+            for bit in range(size):
+                conn.execute(
+                    f"INSERT INTO {table} ({key}, user_id) SELECT ?, id FROM profiles WHERE (({column} >> ?) & 1) = 1",
+                    (bit, bit),
+                )
+
+
+def export_profiles(args: argparse.Namespace) -> int:
+    if not os.path.exists(args.db):
+        sys.exit(f"[Data] Нет базы {args.db}")
+    conn = open_readonly(args.db)
+    problem = schema_problem(conn, args.db)
+    if problem:
+        conn.close()
+        sys.exit(f"[Data] {args.db}: {problem}")
+    report, count = Report(), 0
+    with open_output(args.output) as out:
+        # the cursor yields rows as it goes: memory stays flat on any table size
+        for row in conn.execute(SQL_EXPORT):
+            profile, problems = decode_row(row)
+            for problem in problems + profile.check():
+                report.problem(f"профиль {row[0]}", problem)
+            out.write(json.dumps({"id": str(row[0]), **profile.to_dict()}, ensure_ascii=False) + "\n")
+            count += 1
+    conn.close()
+    print(f"[Data] Экспортировано профилей: {count}, с ошибками: {report.problems}", file=sys.stderr)
+    return 0
+
+
+def import_profiles(args: argparse.Namespace) -> int:
+    lock = ensure_bot_stopped(args)
+    backed_up = backup_db(args.db)
+    repo = open_repo(args.db)
+    if args.replace:
+        repo.delete_all_sync()
+
+    report, rows, count = Report(), [], 0
+    with open_input(args.file) as f:
+        for line_no, record in read_ndjson(f, report):
+            try:
+                user_id = int(record.pop("id"))
+            except (KeyError, TypeError, ValueError):
+                report.problem(f"строка {line_no}", "нет числового id")
+                continue
+            profile = Profile.from_dict(record)
+            problems = profile.check(repair=args.repair)
+            for problem in problems:
+                report.problem(f"строка {line_no}", problem, repaired=args.repair)
+            if problems and not args.repair:
+                continue
+            rows.append(profile.to_row(user_id))
+            if len(rows) >= BATCH:
+                repo.write_rows(rows)
+                count += len(rows)
+                rows.clear()
+    if rows:
+        repo.write_rows(rows)
+        count += len(rows)
+    repo.close_sync()
+    if lock is not None:
+        lock.release()
+    print(f"[Data] Импортировано профилей: {count}, пропущено строк: {report.unresolved}"
+          + (f" (копия базы: {args.db}.bak)" if backed_up else ""), file=sys.stderr)
+    return 1 if report.unresolved else 0
+
+
+def validate_profiles(args: argparse.Namespace, report: Report) -> None:
+    if not os.path.exists(args.db):
+        return
+    print(f"[Data] {args.db}", file=sys.stderr)
+    if args.repair:
+        backup_db(args.db)
+        repo = open_repo(args.db)
+        conn = repo.connection
+    else:
+        conn = open_readonly(args.db)
+        problem = schema_problem(conn, args.db)
+        if problem:
+            report.problem(args.db, problem)
+            conn.close()
+            return
+    result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    if result != "ok":
+        report.problem(args.db, f"integrity_check: {result}")
+
+    fixed = []
+    # a second connection reads while the first one writes the repaired rows
+    reader = open_readonly(args.db)
+    for row in reader.execute(SQL_EXPORT):
+        profile, problems = decode_row(row)
+        problems += profile.check(repair=args.repair)
+        for problem in problems:
+            report.problem(f"профиль {row[0]}", problem, repaired=args.repair)
+        if problems and args.repair:
+            fixed.append(profile.to_row(row[0]))
+            if len(fixed) >= BATCH:
+                repo.write_rows(fixed)
+                fixed.clear()
+    reader.close()
+    if fixed:
+        repo.write_rows(fixed)
+
+    mismatches = check_search_index(conn)
+    if mismatches:
+        if args.repair:
+            rebuild_search_index(conn)
+        report.problem("индекс поиска", f"{mismatches} строк не совпадают с профилями", repaired=args.repair)
+    conn.close()
+
+
+def validate_legacy_profiles(args: argparse.Namespace, report: Report) -> None:
+    # устаревший файл: только проверка, импортирует его сам бот при первом запуске
+    if not os.path.exists(LEGACY_JSON_PATH):
+        return
+    print(f"[Data] {LEGACY_JSON_PATH}", file=sys.stderr)
+    try:
+        with open(LEGACY_JSON_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except ValueError as e:
+        report.problem(LEGACY_JSON_PATH, f"не читается ({e})")
+        return
+    if not isinstance(data, dict):
+        report.problem(LEGACY_JSON_PATH, "не объект {id: профиль}")
+        return
+    for user_id, profile in data.items():
+        if not str(user_id).isdigit() or not isinstance(profile, dict):
+            report.problem(f"{LEGACY_JSON_PATH} {user_id}", "не будет импортирован")
+        else:
+            for problem in Profile.from_dict(profile).check():
+                report.problem(f"{LEGACY_JSON_PATH} {user_id}", problem)
+
+
+# ---------- streamers.json ----------
+# {"<guild_id>": {"channel_id": int | null, "streamer_ids": [...], "streamers": [legacy logins]}}
+def check_watchlist(guild_id: Any, entry: Any, repair: bool,
+                    report: Report, where: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """(guild key, entry) as the bot expects them, or None if the entry is unusable (not reported here)."""
+    if not str(guild_id).isdigit() or not isinstance(entry, dict):
+        return None
+    channel_id = entry.get("channel_id")
+    if channel_id is not None and not isinstance(channel_id, int):
+        report.problem(where, f"channel_id {channel_id!r}", repaired=repair)
+        channel_id = int(channel_id) if str(channel_id).isdigit() else None
+    ids = entry.get("streamer_ids", [])
+    if not isinstance(ids, list):
+        report.problem(where, "streamer_ids не список", repaired=repair)
+        ids = []
+    clean = list(dict.fromkeys(str(s) for s in ids if str(s).isdigit()))
+    if len(clean) != len(ids):
+        report.problem(where, f"streamer_ids: {len(ids) - len(clean)} повторов или не-ID", repaired=repair)
+    result: Dict[str, Any] = {"channel_id": channel_id, "streamer_ids": clean}
+    logins = entry.get("streamers")
+    if logins:
+        result["streamers"] = [str(login).lower() for login in logins] if isinstance(logins, list) else []
+    return str(int(str(guild_id))), result
+
+
+def _legacy_watchlist(raw: Any) -> Dict[str, Any]:
+    if not isinstance(raw, list):
+        raise ValueError("neither an object nor a list")
+    # старый формат: общий список логинов без гильдии (её определит бот)
+    return {"0": {"channel_id": None, "streamers": raw}}
+
+
+def read_watchlists(path: str, strict: bool = False) -> Dict[str, Any]:
+    # снимок + журнал изменений, как их читает бот
+    try:
+        return Journal(path, legacy=_legacy_watchlist).load()
+    except ValueError as e:
+        if strict:
+            raise
+        sys.exit(f"[Data] {path} не читается ({e}), сначала: python datatool.py validate")
+
+
+def write_watchlists(path: str, data: Dict[str, Any]) -> None:
+    Journal(path, legacy=_legacy_watchlist).replace(data, backup=True)
+
+
+def validate_streamers(args: argparse.Namespace, report: Report) -> None:
+    if not os.path.exists(args.streamers) and not os.path.exists(args.streamers + ".journal"):
+        return
+    print(f"[Data] {args.streamers}", file=sys.stderr)
+    try:
+        raw = read_watchlists(args.streamers, strict=True)
+    except ValueError as e:
+        report.problem(args.streamers, f"не читается ({e}); восстановление: import streamers из экспорта "
+                                       f"или из {args.streamers}.bak / .corrupt-*")
+        return
+    clean, repaired_before = {}, report.repaired
+    for guild_id, entry in raw.items():
+        checked = check_watchlist(guild_id, entry, args.repair, report, f"гильдия {guild_id}")
+        if checked is not None:
+            clean[checked[0]] = checked[1]
+        else:
+            report.problem(f"гильдия {guild_id}", "не запись гильдии" + (", удалена" if args.repair else ""),
+                           repaired=args.repair)
+    if args.repair and report.repaired > repaired_before:
+        write_watchlists(args.streamers, clean)
+
+
+def export_streamers(args: argparse.Namespace) -> int:
+    raw = read_watchlists(args.streamers)
+    with open_output(args.output) as out:
+        for guild_id, entry in raw.items():
+            out.write(json.dumps({"guild_id": str(guild_id), **entry}, ensure_ascii=False) + "\n")
+    print(f"[Data] Экспортировано гильдий: {len(raw)}", file=sys.stderr)
+    return 0
+
+
+def import_streamers(args: argparse.Namespace) -> int:
+    lock = ensure_bot_stopped(args)
+    data = {} if args.replace else read_watchlists(args.streamers)
+    report, count = Report(), 0
+    with open_input(args.file) as f:
+        for line_no, record in read_ndjson(f, report):
+            guild_id = record.pop("guild_id", None)
+            checked = check_watchlist(guild_id, record, True, report, f"строка {line_no}")
+            if checked is None:
+                report.problem(f"строка {line_no}", "не запись гильдии")
+                continue
+            data[checked[0]] = checked[1]
+            count += 1
+    write_watchlists(args.streamers, data)
+    if lock is not None:
+        lock.release()
+    print(f"[Data] Импортировано гильдий: {count}, пропущено строк: {report.unresolved}", file=sys.stderr)
+    return 1 if report.unresolved else 0
+
+
+# ---------- commands ----------
+def validate(args: argparse.Namespace) -> int:
+    lock = ensure_bot_stopped(args) if args.repair else None
+    report = Report()
+    validate_profiles(args, report)
+    validate_legacy_profiles(args, report)
+    validate_streamers(args, report)
+    if lock is not None:
+        lock.release()
+    print(f"[Data] Проблем: {report.problems}, исправлено: {report.repaired}", file=sys.stderr)
+    return 1 if report.unresolved else 0
+
+
+def vacuum(args: argparse.Namespace) -> int:
+    if not os.path.exists(args.db):
+        sys.exit(f"[Data] Нет базы {args.db}")
+    lock = ensure_bot_stopped(args)
+
+    def size() -> int:
+        return sum(os.path.getsize(path) for path in (args.db, args.db + "-wal") if os.path.exists(path))
+
+    before = size()
+    backup_db(args.db)
+    repo = open_repo(args.db)
+    conn = repo.connection
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA optimize")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    repo.close_sync()
+    if lock is not None:
+        lock.release()
+    print(f"[Data] {args.db}: {before / 1024:.0f} KiB -> {size() / 1024:.0f} KiB", file=sys.stderr)
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline export/import and maintenance of the bot's data")
+    parser.add_argument("--db", default=DB_PATH, help="profiles database")
+    parser.add_argument("--streamers", default=STREAMERS_PATH, help="Twitch watchlists file")
+    parser.add_argument("--force", action="store_true", help="do not check that the bot is stopped")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="write profiles or watchlists as NDJSON")
+    export.add_argument("what", choices=("profiles", "streamers"))
+    export.add_argument("-o", "--output", help="output file (default: stdout)")
+
+    load = commands.add_parser("import", help="read profiles or watchlists from NDJSON (upsert)")
+    load.add_argument("what", choices=("profiles", "streamers"))
+    load.add_argument("file", help="NDJSON file, - for stdin")
+    load.add_argument("--replace", action="store_true", help="drop existing records first")
+    load.add_argument("--repair", action="store_true", help="fix invalid profiles instead of skipping them")
+
+    check = commands.add_parser("validate", help="check profiles and watchlists")
+    check.add_argument("--repair", action="store_true", help="fix what can be fixed (backups are kept)")
+
+    commands.add_parser("vacuum", help="checkpoint the WAL and compact the profiles database")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        return export_profiles(args) if args.what == "profiles" else export_streamers(args)
+    if args.command == "import":
+        return import_profiles(args) if args.what == "profiles" else import_streamers(args)
+    if args.command == "validate":
+        return validate(args)
+    return vacuum(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+""" <summary>
+Runs the bot as several processes, each with its own contiguous range of shards:
+    python launcher.py --shard-count 8 --processes 4
+A crashed process is restarted; Ctrl+C or SIGTERM is passed on to all of them,
+and they get STOP_TIMEOUT seconds to flush their data and exit.
+</summary> """
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from dotenv import load_dotenv
+
+from utils.sharding import format_shard_ids, split_shards
+
+RESTART_DELAY = 5.0
+# время на выгрузку когов и сброс отложенных записей, потом kill
+STOP_TIMEOUT = float(os.getenv("LAUNCHER_STOP_TIMEOUT", 60))
+
+def spawn(shard_count: int, shard_ids: List[int]) -> subprocess.Popen:
+    cmd = [sys.executable, "bot.py", "--shard-count", str(shard_count), "--shards", format_shard_ids(shard_ids)]
+    print(f"[Launcher] Запуск шардов {format_shard_ids(shard_ids)}: {' '.join(cmd)}")
+    return subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run the bot as several sharded processes")
+    parser.add_argument("--shard-count", type=int, default=int(os.getenv("SHARD_COUNT", 0)) or None)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    if not args.shard_count:
+        parser.error("--shard-count (or SHARD_COUNT) is required")
+
+    ranges = split_shards(args.shard_count, args.processes)
+    procs: Dict[int, subprocess.Popen] = {i: spawn(args.shard_count, ids) for i, ids in enumerate(ranges)}
+
+    stopping = False
+
+    def stop(signum, _frame):
+        nonlocal stopping
+        stopping = True
+        # бот закрывается по SIGINT/SIGTERM сам, с cog_unload (bot.py)
+        for proc in procs.values():
+            if proc.poll() is None:
+                try:
+                    proc.send_signal(signum)
+                except (OSError, ValueError):
+                    pass  # Windows: Ctrl+C и так приходит всем процессам консоли
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while not stopping:
+        time.sleep(1)
+        for i, proc in procs.items():
+            code = proc.poll()
+            if code is None or stopping:
+                continue
+            print(f"[Launcher] Процесс шардов {format_shard_ids(ranges[i])} завершился с кодом {code}, перезапуск через {RESTART_DELAY:.0f}s")
+            time.sleep(RESTART_DELAY)
+            if stopping:
+                break
+            procs[i] = spawn(args.shard_count, ranges[i])
+
+    deadline = time.monotonic() + STOP_TIMEOUT
+    for i, proc in procs.items():
+        try:
+            proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            print(f"[Launcher] Процесс шардов {format_shard_ids(ranges[i])} не завершился за {STOP_TIMEOUT:.0f}s, kill")
+            proc.kill()
+            proc.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+""" <summary>
+Explicit list of the bot's extensions and the loader for them: per-deployment
+enable/disable, optional dependencies checked without importing them,
+concurrent loading where one broken cog does not stop the others, and the
+gateway intents / member cache the enabled cogs actually need.
+</summary> """
+
+import asyncio
+import importlib.util
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+# extension -> {
+#   "requires": third-party packages (checked with find_spec, not imported),
+#   "intents": gateway intents beyond `guilds`,
+#   "member_cache": MemberCacheFlags to keep (members are otherwise not cached),
+# }
+COGS: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "cogs.general": {},
+    # prefix-команды владельца: в ЛС или через упоминание бота, без message_content
+    "cogs.admin": {"intents": ("guild_messages", "dm_messages")},
+    "cogs.welcome": {"intents": ("members",)},  # только события захода/выхода участников
+    # участники берутся из данных interaction — кеш не нужен; members — выход
+    # участника и разовая выгрузка списка для /find (guild.chunk без кеша)
+    "cogs.profile": {"intents": ("members",)},
+    "cogs.voice_manager": {"intents": ("voice_states",), "member_cache": ("voice",)},
+    "cogs.twitch_monitor": {"requires": ("twitchAPI", "aiohttp")},
+}
+
+
+def _names(env: str) -> List[str]:
+    return [qualify(name) for name in os.getenv(env, "").split(",") if name.strip()]
+
+
+def qualify(name: str) -> str:
+    """'twitch_monitor' -> 'cogs.twitch_monitor'"""
+    name = name.strip()
+    return name if name.startswith("cogs.") else f"cogs.{name}"
+
+
+def enabled_cogs() -> List[str]:
+    """COGS_ENABLED (if set) picks the cogs of this deployment, COGS_DISABLED removes some."""
+    enabled = _names("COGS_ENABLED") or list(COGS)
+    disabled = set(_names("COGS_DISABLED"))
+    return [name for name in enabled if name in COGS and name not in disabled]
+
+
+def missing_requirements(name: str) -> List[str]:
+    requires = COGS.get(name, {}).get("requires", ())
+    return [package for package in requires if importlib.util.find_spec(package) is None]
+
+
+def gateway_config(names: List[str]) -> Tuple[discord.Intents, discord.MemberCacheFlags]:
+    """Smallest intents and member cache that serve the given cogs."""
+    intents = discord.Intents.none()
+    intents.guilds = True  # каналы, роли, app-команды
+    cache = discord.MemberCacheFlags.none()
+    for name in names:
+        spec: Dict[str, Any] = COGS.get(name, {})
+        for intent in spec.get("intents", ()):
+            setattr(intents, intent, True)
+        for flag in spec.get("member_cache", ()):
+            setattr(cache, flag, True)
+    return intents, cache
+
+
+async def load_cog(bot: commands.Bot, name: str) -> Tuple[Optional[float], Optional[str]]:
+    """(load seconds, None) on success, (None, reason) if the cog was skipped or failed."""
+    missing = missing_requirements(name)
+    if missing:
+        return None, f"нет пакетов: {', '.join(missing)}"
+    started = time.perf_counter()
+    try:
+        await bot.load_extension(name)
+    except Exception as e:
+        # load_extension откатывает модуль — остальные коги продолжают грузиться
+        cause = e.__cause__ or e
+        return None, f"{type(cause).__name__}: {cause}"
+    return time.perf_counter() - started, None
+
+
+async def load_cogs(bot: commands.Bot, names: List[str]) -> Dict[str, Tuple[Optional[float], Optional[str]]]:
+    """
+    Cogs are independent, so they load concurrently: a module's import runs
+    synchronously, but one cog's async cog_load (DB open, file reads) overlaps
+    with the others.
+    """
+    results = await asyncio.gather(*(load_cog(bot, name) for name in names))
+    for name, (_, error) in zip(names, results):
+        if error is not None:
+            print(f"[Cogs] {name} не загружен: {error}")
+    return dict(zip(names, results))
@@ -0,0 +1,199 @@
+""" <summary>
+Durable JSON state: a snapshot file ({key: value}, replaced atomically) plus
+an append-only journal of changed keys next to it (<file>.journal). A change
+costs one appended line instead of a rewrite of the whole file; the journal
+is replayed on load and folded into a new snapshot every `snapshot_every`
+records.
+</summary> """
+
+import asyncio
+import json
+import os
+from contextlib import contextmanager
+from typing import IO, Any, Callable, Dict, Iterator, Optional, Tuple
+
+from utils import storage
+
+try:
+    import fcntl
+except ImportError:  # Windows: файл пишет один процесс
+    fcntl = None
+
+Changes = Dict[str, Optional[Any]]  # key -> new value, None = key deleted
+
+
+def _not_a_dict(raw: Any) -> Dict[str, Any]:
+    raise ValueError("snapshot is not a JSON object")
+
+
+class Journal:
+    """
+    Blocking file operations; call them on the storage I/O threads. Several
+    processes may share the files: every operation holds an exclusive flock
+    on the journal, and a snapshot is built from what is on disk, not from
+    one process's memory.
+    """
+
+    def __init__(self, path: str, snapshot_every: int = 200, fsync: bool = True,
+                 legacy: Callable[[Any], Dict[str, Any]] = _not_a_dict):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        # converts a snapshot in an older, non-object format
+        self.legacy = legacy
+
+    @contextmanager
+    def _locked(self) -> Iterator[IO[bytes]]:
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.journal_path, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield f  # закрытие файла снимает лок
+
+    def _read(self, f: IO[bytes]) -> Tuple[Dict[str, Any], int]:
+        """(snapshot with the journal applied, journal records)"""
+        data: Any = {}
+        if os.path.exists(self.path) and os.stat(self.path).st_size > 0:
+            with open(self.path, "r", encoding="utf-8") as snapshot:
+                data = json.load(snapshot)
+        if not isinstance(data, dict):
+            data = self.legacy(data)
+        f.seek(0)
+        records = 0
+        for line in f:
+            try:
+                record = json.loads(line)
+                key = record["k"]
+            except (ValueError, KeyError, TypeError):
+                continue  # запись, оборванная сбоем посреди дозаписи
+            if "v" in record:
+                data[key] = record["v"]
+            else:
+                data.pop(key, None)
+            records += 1
+        return data, records
+
+    def _snapshot(self, f: IO[bytes], data: Dict[str, Any], backup: bool = False) -> None:
+        with storage.atomic_open(self.path, backup=backup, fsync=self.fsync) as out:
+            json.dump(data, out, indent=2, ensure_ascii=False)
+        # журнал очищается только после того, как снимок на диске:
+        # сбой между ними — повторное применение тех же записей, без потерь
+        f.seek(0)
+        f.truncate()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def load(self) -> Dict[str, Any]:
+        """Raises ValueError if the snapshot is not valid JSON."""
+        with self._locked() as f:
+            data, records = self._read(f)
+            if records >= self.snapshot_every:
+                self._snapshot(f, data)
+            return data
+
+    def append(self, changes: Changes) -> None:
+        lines = "".join(
+            json.dumps({"k": key} if value is None else {"k": key, "v": value}, ensure_ascii=False) + "\n"
+            for key, value in changes.items()
+        ).encode("utf-8")
+        with self._locked() as f:
+            end = f.seek(0, os.SEEK_END)
+            if end:
+                f.seek(end - 1)
+                if f.read(1) != b"\n":
+                    lines = b"\n" + lines  # не склеиваться с оборванной записью
+            f.write(lines)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+            f.seek(0)
+            if sum(1 for _ in f) >= self.snapshot_every:
+                self._snapshot(f, self._read(f)[0])
+
+    def replace(self, data: Dict[str, Any], backup: bool = False) -> None:
+        """New snapshot with exactly `data`; the journal is discarded. `backup` keeps
+        the previous state (snapshot + journal) as path.bak."""
+        with self._locked() as f:
+            copied = False
+            if backup:
+                try:
+                    current = self._read(f)[0]
+                except ValueError:
+                    pass  # снимок не читается — atomic_open скопирует файл как есть
+                else:
+                    with storage.atomic_open(self.path + ".bak", fsync=self.fsync) as out:
+                        json.dump(current, out, indent=2, ensure_ascii=False)
+                    copied = True
+            self._snapshot(f, data, backup=backup and not copied)
+
+    def reset_snapshot(self) -> None:
+        """Empty snapshot, journal kept — after a corrupt snapshot was copied aside."""
+        with self._locked():
+            with storage.atomic_open(self.path, fsync=self.fsync) as out:
+                out.write("{}")
+
+    def version(self) -> Tuple[int, ...]:
+        """Changes whenever any process writes the state (for cheap polling)."""
+        stamp = []
+        for path in (self.path, self.journal_path):
+            try:
+                st = os.stat(path)
+                stamp += [st.st_mtime_ns, st.st_size]
+            except OSError:
+                stamp += [0, 0]
+        return tuple(stamp)
+
+
+class DurableDict:
+    """
+    Async front of a Journal for the cogs. save() takes the whole state and
+    journals only the keys that differ from what this process last loaded or
+    saved, so concurrent edits of other keys by other processes are kept.
+    """
+
+    def __init__(self, path: str, snapshot_every: int = 200,
+                 legacy: Callable[[Any], Dict[str, Any]] = _not_a_dict):
+        self.journal = Journal(path, snapshot_every=snapshot_every, legacy=legacy)
+        self._saved: Dict[str, str] = {}  # key -> JSON of the value on disk
+        self._lock = asyncio.Lock()  # appends in call order, despite several I/O threads
+
+    @staticmethod
+    def _encode(value: Any) -> str:
+        return json.dumps(value, sort_keys=True, ensure_ascii=False)
+
+    async def load(self) -> Dict[str, Any]:
+        async with self._lock:
+            data = await storage.run_io(self.journal.load)
+            self._saved = {key: self._encode(value) for key, value in data.items()}
+            return data
+
+    async def save(self, data: Dict[str, Any]) -> None:
+        """`data` is read on the loop; the caller may keep mutating it afterwards."""
+        encoded = {str(key): self._encode(value) for key, value in data.items()}
+        changes: Changes = {key: json.loads(text) for key, text in encoded.items() if self._saved.get(key) != text}
+        changes.update({key: None for key in self._saved.keys() - encoded.keys()})
+        await self.update(changes)
+
+    async def update(self, changes: Changes) -> None:
+        """Writes only these keys (None deletes one)."""
+        changes = {str(key): value for key, value in changes.items()}
+        if not changes:
+            return
+        async with self._lock:
+            await storage.run_io(self.journal.append, changes)
+            for key, value in changes.items():
+                if value is None:
+                    self._saved.pop(key, None)
+                else:
+                    self._saved[key] = self._encode(value)
+
+    async def reset(self) -> Dict[str, Any]:
+        """Drops an unreadable snapshot (copy it aside first) and loads what the journal holds."""
+        await storage.run_io(self.journal.reset_snapshot)
+        return await self.load()
+
+    def version(self) -> Tuple[int, ...]:
+        return self.journal.version()
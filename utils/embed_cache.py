@@ -0,0 +1,49 @@
+""" <summary>
+Render cache for embeds: per entity, the embed and the hash of its payload
+for one content version. The version is a cheap tuple of everything the
+embed shows, so an unchanged entity costs a tuple comparison instead of a
+rebuild, and callers compare digests to skip sends that would not change
+what a message shows.
+</summary> """
+
+import hashlib
+import json
+from typing import Callable, Hashable
+
+import discord
+
+from utils.ttl_cache import TTLCache
+
+
+def embed_digest(embed: discord.Embed) -> str:
+    payload = json.dumps(embed.to_dict(), sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class RenderedEmbed:
+    """Shared between callers: send `embed` as is, never modify it."""
+
+    __slots__ = ("embed", "digest")
+
+    def __init__(self, embed: discord.Embed):
+        self.embed = embed
+        self.digest = embed_digest(embed)
+
+
+class EmbedCache:
+    """Hit/miss counts go to bot_cache_lookups_total{cache=name}; "stale" is a changed entity."""
+
+    def __init__(self, max_size: int, name: str, ttl: float = 3600.0):
+        # entity -> (version, RenderedEmbed): one entry per entity, replaced when it changes
+        self._cache = TTLCache(max_size, ttl=ttl, name=name)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def render(self, entity: Hashable, version: Hashable, build: Callable[[], discord.Embed]) -> RenderedEmbed:
+        entry = self._cache.get(entity, current=lambda cached: cached[0] == version)
+        if entry is not None:
+            return entry[1]
+        rendered = RenderedEmbed(build())
+        self._cache.put(entity, (version, rendered))
+        return rendered
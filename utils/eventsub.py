@@ -0,0 +1,258 @@
+""" <summary>
+Twitch EventSub over WebSocket: keeps one session open, (re)creates the
+subscriptions for it and hands notifications to a callback. Broadcasters
+left without subscriptions (session limits, errors, revocations) are kept
+in `failed` for the caller to poll.
+</summary> """
+
+import asyncio
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import aiohttp
+
+from utils import metrics
+from utils.helix import HELIX_URL, TokenProvider
+
+EVENTSUB_WS_URL = os.getenv("TWITCH_EVENTSUB_URL", "wss://eventsub.wss.twitch.tv/ws")
+EVENTSUB_SUBSCRIPTION_URL = os.getenv(
+    "TWITCH_EVENTSUB_SUBSCRIPTION_URL", HELIX_URL.rstrip("/") + "/eventsub/subscriptions"
+)
+
+# type -> version of the subscriptions created for every broadcaster
+STREAM_EVENTS = {
+    "stream.online": "1",
+    "stream.offline": "1",
+    "channel.update": "2",
+}
+
+EventCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class EventSubClient:
+    def __init__(self, client_id: str, token_provider: TokenProvider, on_event: EventCallback,
+                 ws_url: str = EVENTSUB_WS_URL, subscription_url: str = EVENTSUB_SUBSCRIPTION_URL,
+                 concurrency: int = 4):
+        self.client_id = client_id
+        self.token_provider = token_provider
+        self.on_event = on_event
+        self.ws_url = ws_url
+        self.subscription_url = subscription_url
+        self.session_id: Optional[str] = None
+        self.broadcasters: Set[str] = set()
+        # (type, broadcaster_id) -> subscription id, for the current session
+        self._subscriptions: Dict[Tuple[str, str], str] = {}
+        # broadcasters missing a subscription in the current session: no events for them
+        self.failed: Set[str] = set()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._subscribing: Optional[asyncio.Task] = None
+        # seconds of silence Twitch allows, from session_welcome
+        self._keepalive = 30.0
+        # Twitch may deliver a notification more than once
+        self._seen: Deque[str] = deque(maxlen=500)
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._task: Optional[asyncio.Task] = None
+        self._handlers: Set[asyncio.Task] = set()
+
+    @property
+    def connected(self) -> bool:
+        return self.session_id is not None
+
+    def start(self, broadcaster_ids: Iterable[str] = ()) -> None:
+        self.broadcasters.update(broadcaster_ids)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    # ---------- subscriptions ----------
+    async def _headers(self) -> Dict[str, str]:
+        return {
+            "Client-ID": self.client_id,
+            "Authorization": f"Bearer {await self.token_provider()}",
+        }
+
+    async def _create(self, event_type: str, broadcaster_id: str) -> None:
+        body = {
+            "type": event_type,
+            "version": STREAM_EVENTS[event_type],
+            "condition": {"broadcaster_user_id": broadcaster_id},
+            "transport": {"method": "websocket", "session_id": self.session_id},
+        }
+        async with self._semaphore:
+            async with self._http.post(self.subscription_url, json=body, headers=await self._headers()) as resp:
+                if resp.status == 409:  # уже подписаны
+                    return
+                resp.raise_for_status()
+                data = (await resp.json()).get("data") or []
+                if data:
+                    self._subscriptions[(event_type, broadcaster_id)] = data[0]["id"]
+
+    async def _subscribe(self, broadcaster_id: str) -> Optional[BaseException]:
+        """Creates the missing subscriptions; on error the broadcaster stays in `failed`."""
+        results = await asyncio.gather(
+            *(self._create(event_type, broadcaster_id) for event_type in STREAM_EVENTS
+              if (event_type, broadcaster_id) not in self._subscriptions),
+            return_exceptions=True,
+        )
+        error = next((result for result in results if isinstance(result, Exception)), None)
+        if error is None:
+            self.failed.discard(broadcaster_id)
+        elif broadcaster_id in self.broadcasters:
+            self.failed.add(broadcaster_id)
+        return error
+
+    async def subscribe(self, broadcaster_id: str) -> None:
+        self.broadcasters.add(broadcaster_id)
+        if not self.connected:
+            return  # подпишемся после session_welcome
+        error = await self._subscribe(broadcaster_id)
+        if error is not None:
+            print(f"[EventSub] Не удалось подписаться на события {broadcaster_id}, он будет опрашиваться: {error}")
+
+    async def _subscribe_all(self) -> None:
+        broadcasters = list(self.broadcasters)
+        errors: List[BaseException] = [
+            error for error in await asyncio.gather(*(self._subscribe(b) for b in broadcasters)) if error is not None
+        ]
+        if errors:
+            # на больших списках упираемся в лимит подписок сессии: одна строка, а не тысяча
+            print(f"[EventSub] Нет подписок у {len(errors)} из {len(broadcasters)} стримеров, "
+                  f"они будут опрашиваться (первая ошибка: {errors[0]})")
+
+    async def unsubscribe(self, broadcaster_id: str) -> None:
+        self.broadcasters.discard(broadcaster_id)
+        self.failed.discard(broadcaster_id)
+        for event_type in STREAM_EVENTS:
+            sub_id = self._subscriptions.pop((event_type, broadcaster_id), None)
+            if sub_id is None or self._http is None:
+                continue
+            try:
+                async with self._http.delete(self.subscription_url, params={"id": sub_id},
+                                             headers=await self._headers()):
+                    pass
+            except Exception:
+                pass
+
+    async def _dispatch(self, event_type: str, event: Dict[str, Any]) -> None:
+        try:
+            await self.on_event(event_type, event)
+        except Exception as e:
+            metrics.ERRORS.inc(source="eventsub")
+            print(f"[EventSub] Ошибка обработки {event_type}: {e}")
+
+    # ---------- websocket ----------
+    async def _run(self) -> None:
+        self._http = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=15), trace_configs=[metrics.http_trace("twitch_eventsub")]
+        )
+        backoff = 1
+        while True:
+            try:
+                await self._session()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[EventSub] Соединение потеряно: {e}")
+                self.session_id = None
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+            else:
+                backoff = 1
+
+    async def _session(self) -> None:
+        """Runs one session: its first connection and every connection it is moved to by session_reconnect."""
+        self._keepalive = 30.0
+        ws = await self._http.ws_connect(self.ws_url)
+        try:
+            reconnect_url = await self._read(ws, reconnecting=False)
+            while True:
+                ws = await self._handover(ws, reconnect_url)
+                reconnect_url = await self._read(ws, reconnecting=True)
+        finally:
+            await ws.close()
+            if self._subscribing is not None:
+                self._subscribing.cancel()  # подписки к закрытой сессии уже не привяжутся
+                self._subscribing = None
+
+    async def _handover(self, old: aiohttp.ClientWebSocketResponse, url: str) -> aiohttp.ClientWebSocketResponse:
+        """
+        session_reconnect: the old connection keeps delivering notifications
+        until the new one is welcomed, only then it is closed (as Twitch expects),
+        so nothing sent in between is lost.
+        """
+        draining = asyncio.create_task(self._read(old, reconnecting=True))
+        try:
+            new = await self._http.ws_connect(url)
+            try:
+                msg = await new.receive_json(timeout=self._keepalive + 10)
+                if msg["metadata"]["message_type"] != "session_welcome":
+                    raise RuntimeError(f"ожидался session_welcome, получено {msg['metadata']['message_type']}")
+                self._handle(msg, reconnecting=True)
+            except BaseException:
+                await new.close()
+                raise
+        finally:
+            draining.cancel()
+            # old connection may have failed meanwhile: nothing to report, it is being replaced
+            await asyncio.gather(draining, return_exceptions=True)
+            await old.close()
+        return new
+
+    async def _read(self, ws: aiohttp.ClientWebSocketResponse, reconnecting: bool) -> str:
+        """Handles messages until session_reconnect; returns its reconnect URL."""
+        while True:
+            # Twitch присылает keepalive; тишина дольше таймаута — соединение мертво
+            msg = await ws.receive_json(timeout=self._keepalive + 10)
+            reconnect_url = self._handle(msg, reconnecting)
+            if reconnect_url is not None:
+                return reconnect_url
+
+    def _handle(self, msg: Dict[str, Any], reconnecting: bool) -> Optional[str]:
+        kind = msg["metadata"]["message_type"]
+        payload = msg.get("payload") or {}
+
+        if kind == "session_welcome":
+            session = payload["session"]
+            self._keepalive = float(session.get("keepalive_timeout_seconds") or self._keepalive)
+            self.session_id = session["id"]
+            if not reconnecting:
+                # новая сессия — старые подписки к ней не привязаны
+                # (Twitch closes a session left without subscriptions for ~10s)
+                self._subscriptions.clear()
+            elif self._subscribing is not None and not self._subscribing.done():
+                return None  # сессия та же: начатые подписки переезжают вместе с ней
+            # в фоне: чтение сокета (keepalive, события) не ждёт тысяч подписок;
+            # после reconnect создаются только недостающие
+            self._subscribing = asyncio.create_task(self._subscribe_all())
+        elif kind == "session_reconnect":
+            # подписки переезжают вместе с сессией, переподписываться не нужно
+            return payload["session"]["reconnect_url"]
+        elif kind == "notification":
+            message_id = msg["metadata"].get("message_id")
+            if message_id in self._seen:
+                return None
+            self._seen.append(message_id)
+            # не держим чтение сокета, пока обработчик ходит в Discord
+            task = asyncio.create_task(self._dispatch(payload["subscription"]["type"], payload.get("event") or {}))
+            self._handlers.add(task)
+            task.add_done_callback(self._handlers.discard)
+        elif kind == "revocation":
+            sub = payload.get("subscription") or {}
+            broadcaster_id = (sub.get("condition") or {}).get("broadcaster_user_id")
+            self._subscriptions.pop((sub.get("type"), broadcaster_id), None)
+            if broadcaster_id in self.broadcasters:
+                self.failed.add(broadcaster_id)
+            print(f"[EventSub] Подписка отозвана: {sub.get('type')} ({sub.get('status')})")
+        return None
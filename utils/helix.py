@@ -0,0 +1,150 @@
+""" <summary>
+Minimal Twitch Helix client for the bulk lookups the Twitch cog makes every tick:
+splits logins/IDs into 100-item requests, runs them concurrently and
+paces itself by Twitch's Ratelimit-* headers.
+</summary> """
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+
+from utils import metrics
+
+HELIX_URL = os.getenv("TWITCH_HELIX_URL", "https://api.twitch.tv/helix/")
+AUTH_URL = os.getenv("TWITCH_AUTH_URL", "https://id.twitch.tv/oauth2/")
+
+# Helix accepts at most 100 user_login / user_id / id params per request
+MAX_PER_REQUEST = 100
+
+TokenProvider = Callable[[], Awaitable[str]]
+
+
+def chunked(items: Sequence[Any], size: int = MAX_PER_REQUEST) -> List[Sequence[Any]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class HelixRateLimiter:
+    """
+    Token bucket mirrored from the Ratelimit-Limit / -Remaining / -Reset headers.
+    Until the first response arrives it assumes the default app bucket (800 points/min).
+    `reserve` points are left untouched for other callers sharing the client ID.
+    """
+
+    def __init__(self, limit: int = 800, reserve: int = 10):
+        self.limit = limit
+        self.remaining = limit
+        self.reset_at = time.time() + 60
+        self.reserve = reserve
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.time()
+            if now >= self.reset_at:
+                self.remaining = self.limit
+                self.reset_at = now + 60
+            if self.remaining <= min(self.reserve, self.limit // 10):
+                await asyncio.sleep(max(0.0, self.reset_at - now))
+                self.remaining = self.limit
+                self.reset_at = time.time() + 60
+            self.remaining -= 1
+
+    def update(self, headers: Any) -> None:
+        try:
+            if "Ratelimit-Limit" in headers:
+                self.limit = int(headers["Ratelimit-Limit"])
+            if "Ratelimit-Remaining" in headers:
+                self.remaining = int(headers["Ratelimit-Remaining"])
+            if "Ratelimit-Reset" in headers:
+                self.reset_at = float(headers["Ratelimit-Reset"])
+        except (TypeError, ValueError):
+            pass
+
+
+class HelixClient:
+    def __init__(self, client_id: str, token_provider: TokenProvider,
+                 base_url: str = HELIX_URL, concurrency: int = 4,
+                 on_unauthorized: Optional[Callable[[], None]] = None):
+        self.client_id = client_id
+        self.token_provider = token_provider
+        # 401: the provider should hand out a fresh token on the next call
+        self.on_unauthorized = on_unauthorized
+        self.base_url = base_url.rstrip("/") + "/"
+        self.limiter = HelixRateLimiter()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=15), trace_configs=[metrics.http_trace("twitch")]
+            )
+        return self._session
+
+    async def request(self, path: str, params: List[Tuple[str, str]], attempts: int = 3) -> Dict[str, Any]:
+        session = self._get_session()
+        for attempt in range(attempts):
+            await self.limiter.acquire()
+            headers = {
+                "Client-ID": self.client_id,
+                "Authorization": f"Bearer {await self.token_provider()}",
+            }
+            async with self._semaphore:
+                async with session.get(self.base_url + path, params=params, headers=headers) as resp:
+                    self.limiter.update(resp.headers)
+                    if resp.status == 429 and attempt + 1 < attempts:
+                        # бакет пуст: ждём сброса и пробуем ещё раз
+                        self.limiter.remaining = 0
+                        continue
+                    if resp.status == 401 and self.on_unauthorized is not None and attempt + 1 < attempts:
+                        # токен истёк или отозван раньше, чем мы его перепроверили
+                        self.on_unauthorized()
+                        continue
+                    resp.raise_for_status()
+                    return await resp.json()
+        return {"data": []}
+
+    async def _get_all(self, path: str, key: str, values: Sequence[str],
+                       extra: Optional[List[Tuple[str, str]]] = None) -> List[Dict[str, Any]]:
+        async def one_chunk(chunk: Sequence[str]) -> List[Dict[str, Any]]:
+            params = [(key, v) for v in chunk] + (extra or [])
+            items: List[Dict[str, Any]] = []
+            while True:
+                page = await self.request(path, params)
+                items.extend(page.get("data") or [])
+                cursor = (page.get("pagination") or {}).get("cursor")
+                if not cursor or not page.get("data"):
+                    return items
+                params = [p for p in params if p[0] != "after"] + [("after", cursor)]
+
+        results = await asyncio.gather(*(one_chunk(c) for c in chunked(list(values))))
+        return [item for chunk in results for item in chunk]
+
+    # ---------- endpoints ----------
+    async def get_streams(self, logins: Sequence[str] = (), user_ids: Sequence[str] = ()) -> List[Dict[str, Any]]:
+        """Live streams for any number of logins/IDs, merged and de-duplicated by stream ID."""
+        streams: List[Dict[str, Any]] = []
+        if logins:
+            streams += await self._get_all("streams", "user_login", logins, [("first", str(MAX_PER_REQUEST))])
+        if user_ids:
+            streams += await self._get_all("streams", "user_id", user_ids, [("first", str(MAX_PER_REQUEST))])
+        unique: Dict[str, Dict[str, Any]] = {}
+        for stream in streams:
+            unique[stream.get("id") or stream.get("user_id")] = stream
+        return list(unique.values())
+
+    async def get_users(self, logins: Sequence[str] = (), user_ids: Sequence[str] = ()) -> List[Dict[str, Any]]:
+        users: List[Dict[str, Any]] = []
+        if logins:
+            users += await self._get_all("users", "login", logins)
+        if user_ids:
+            users += await self._get_all("users", "id", user_ids)
+        return users
@@ -0,0 +1,73 @@
+""" <summary>
+Event-loop lag monitor: measures how late a periodic sleep wakes up,
+i.e. how long the loop was blocked by synchronous work.
+</summary> """
+
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.25, report_every: float = 60.0, block_threshold: float = 0.01,
+                 on_sample: Optional[Callable[[float], None]] = None):
+        self.interval = interval
+        # 0 — no printed reports (samples still go to on_sample)
+        self.report_every = report_every
+        self.on_sample = on_sample
+        # lag above this counts as "blocked" time
+        self.block_threshold = block_threshold
+        self._samples: List[float] = []
+        self._blocked = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def record(self, lag: float) -> None:
+        self._samples.append(lag)
+        if self.on_sample is not None:
+            self.on_sample(lag)
+        if lag > self.block_threshold:
+            self._blocked += lag
+
+    def snapshot(self) -> Dict[str, float]:
+        samples = sorted(self._samples)
+        if not samples:
+            return {"samples": 0, "p50": 0.0, "p99": 0.0, "max": 0.0, "blocked": 0.0}
+        return {
+            "samples": len(samples),
+            "p50": samples[len(samples) // 2],
+            "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+            "max": samples[-1],
+            "blocked": self._blocked,
+        }
+
+    def reset(self) -> None:
+        self._samples.clear()
+        self._blocked = 0.0
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        window_start = loop.time()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, loop.time() - start - self.interval))
+
+            if self.report_every <= 0:
+                self.reset()  # не копим выборки, которые никто не напечатает
+            elif loop.time() - window_start >= self.report_every:
+                s = self.snapshot()
+                print(
+                    f"[Loop] lag p50={s['p50'] * 1000:.1f}ms p99={s['p99'] * 1000:.1f}ms "
+                    f"max={s['max'] * 1000:.1f}ms blocked={s['blocked'] * 1000:.0f}ms "
+                    f"за {loop.time() - window_start:.0f}s"
+                )
+                self.reset()
+                window_start = loop.time()
@@ -0,0 +1,42 @@
+""" <summary>
+Memory footprint helpers: resident set size of the process and a per-guild report.
+</summary> """
+
+import os
+import sys
+from typing import Optional
+
+import discord
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident memory; None where it can't be read cheaply."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # peak, not current: KiB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:  # Windows
+        return None
+
+
+def memory_report(client: discord.Client, profile: str, baseline: Optional[int] = None) -> str:
+    """`baseline` — RSS before connecting, so the growth attributable to guild state is visible."""
+    guilds = len(client.guilds)
+    members = sum(len(guild.members) for guild in client.guilds)
+    rss = rss_bytes()
+    if rss is None:
+        return f"[Memory] profile={profile} guilds={guilds} cached_members={members}"
+    grown = rss - baseline if baseline is not None else rss
+    per_guild = grown / guilds / 1024 if guilds else 0.0
+    before = f" before_connect={baseline / 2**20:.1f}MiB" if baseline is not None else ""
+    return (
+        f"[Memory] profile={profile}{before} rss={rss / 2**20:.1f}MiB guilds={guilds} "
+        f"cached_members={members} per_guild={per_guild:.1f}KiB"
+    )
+
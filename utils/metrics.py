@@ -0,0 +1,227 @@
+""" <summary>
+In-process metrics in the Prometheus text format: counters and histograms
+kept in plain dicts (cheap enough to update on every event), an aiohttp
+TraceConfig that counts HTTP calls and 429s, and a small local HTTP endpoint.
+</summary> """
+
+import re
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import aiohttp
+from aiohttp import web
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    # label values come from guild, command and route names: user-controlled
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.label_names)
+        self.values[key] = self.values.get(key, 0.0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {value:g}")
+        return lines
+
+
+class Gauge:
+    """A value that goes up and down (queue depth); rendered as its current value."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self.values[tuple(str(labels[n]) for n in self.label_names)] = value
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.label_names)
+        self.values[key] = self.values.get(key, 0.0) + value
+
+    def dec(self, value: float = 1.0, **labels: str) -> None:
+        self.inc(-value, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [counts per bucket..., +Inf], sum
+        self.values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.label_names)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = entry
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        total[0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _labels(self.label_names, key, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total[0]:g}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+_registry: List = []
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    metric = Counter(name, help, labels)
+    _registry.append(metric)
+    return metric
+
+
+def gauge(name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+    metric = Gauge(name, help, labels)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name: str, help: str, labels: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    metric = Histogram(name, help, labels, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def render() -> str:
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+# ---------- the bot's metrics ----------
+LOOP_LAG = histogram(
+    "bot_event_loop_lag_seconds", "How late the event loop woke up from a periodic sleep",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+APP_COMMAND_SECONDS = histogram("bot_app_command_seconds", "App command handling time", ("command", "status"))
+LISTENER_SECONDS = histogram("bot_listener_seconds", "Event listener run time", ("event",))
+HTTP_REQUESTS = counter("bot_http_requests_total", "Outgoing HTTP requests", ("api", "method", "status"))
+HTTP_RATE_LIMITED = counter("bot_http_rate_limited_total", "HTTP 429 responses", ("api", "route"))
+TWITCH_POLL_SECONDS = histogram("twitch_poll_seconds", "Duration of one Twitch poll tick")
+TWITCH_EVENTSUB_POLLED = gauge("twitch_eventsub_polled_streamers",
+                               "eventsub mode: streamers without subscriptions, polled every TWITCH_POLL_INTERVAL")
+STORAGE_FLUSH_SECONDS = histogram("storage_flush_seconds", "Write-behind flush latency", ("queue",))
+CACHE_LOOKUPS = counter("bot_cache_lookups_total", "In-memory cache lookups", ("cache", "result"))
+CACHE_EVICTIONS = counter("bot_cache_evictions_total", "Entries evicted from a full cache", ("cache",))
+EMBED_SENDS_SKIPPED = counter("bot_embed_sends_skipped_total", "Embed sends/edits skipped: payload unchanged", ("embed",))
+WELCOME_QUEUE_DEPTH = gauge("welcome_queue_depth", "Joined members waiting for their welcome message")
+WELCOME_MESSAGES = counter("welcome_messages_total", "Welcome messages sent", ("kind",))
+WELCOME_DROPPED = counter("welcome_dropped_total", "Joined members never welcomed", ("reason",))
+ERRORS = counter("bot_errors_total", "Exceptions caught and logged instead of raised", ("source",))
+
+
+# ---------- HTTP tracing ----------
+_ID_SEGMENT = re.compile(r"^\d+$")
+
+
+def route_of(url: "aiohttp.typedefs.StrOrURL") -> str:
+    """/channels/123/messages/456 -> /channels/{id}/messages/{id}; tokens are hidden too."""
+    path = getattr(url, "path", str(url))
+    parts = []
+    for part in path.split("/"):
+        if _ID_SEGMENT.match(part):
+            parts.append("{id}")
+        elif len(part) > 32:  # interaction/webhook tokens
+            parts.append("{token}")
+        else:
+            parts.append(part)
+    return "/".join(parts)
+
+
+def http_trace(api: str) -> aiohttp.TraceConfig:
+    """TraceConfig for an aiohttp session: counts requests by status and 429s by route."""
+    trace = aiohttp.TraceConfig()
+
+    async def on_request_end(session, ctx, params):
+        status = params.response.status
+        HTTP_REQUESTS.inc(api=api, method=params.method, status=status)
+        if status == 429:
+            HTTP_RATE_LIMITED.inc(api=api, route=route_of(params.url))
+
+    async def on_request_exception(session, ctx, params):
+        HTTP_REQUESTS.inc(api=api, method=params.method, status="error")
+
+    trace.on_request_end.append(on_request_end)
+    trace.on_request_exception.append(on_request_exception)
+    return trace
+
+
+# ---------- endpoint ----------
+class MetricsServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"[Metrics] http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
@@ -0,0 +1,190 @@
+""" <summary>
+Compact profile model: one __slots__ object per member with small ints
+instead of strings — gender as a code, games and servers as bitmasks over
+stable registries.
+</summary> """
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Registries are append-only: a name's position is its bit in the mask and is
+# stored in the database. Never reorder or remove entries, only append.
+DEFAULT_GAMES: Tuple[str, ...] = (
+    "Genshin Impact",
+    "League of Legends",
+    "Apex Legends",
+    "CS2",
+    "Valorant",
+    "Fortnite",
+    "Minecraft",
+    "GTA Online",
+    "Warframe",
+    "Overwatch 2",
+)
+
+DEFAULT_SERVERS: Tuple[str, ...] = (
+    "Europe",
+    "North America",
+    "Asia",
+    "CIS",
+    "South America",
+)
+
+# код 0 — пол не выбран
+GENDERS: Tuple[Optional[str], ...] = (None, "Мужской", "Женский", "Не указан")
+
+# пределы, которые принимает редактор профиля
+MIN_AGE, MAX_AGE = 12, 99
+ROLE_NAME_MAX = 64
+
+_GAME_BITS = {name: bit for bit, name in enumerate(DEFAULT_GAMES)}
+_SERVER_BITS = {name: bit for bit, name in enumerate(DEFAULT_SERVERS)}
+_GENDER_CODES = {name: code for code, name in enumerate(GENDERS) if name is not None}
+
+# keys of the legacy dict profile that map onto slots
+_SLOT_KEYS = ("gender", "age", "games", "servers", "custom_role_request")
+
+
+def to_mask(names: Iterable[str], bits: Dict[str, int]) -> Tuple[int, List[str]]:
+    """(mask, names that are not in the registry)"""
+    mask, unknown = 0, []
+    for name in names:
+        bit = bits.get(name)
+        if bit is None:
+            unknown.append(name)
+        else:
+            mask |= 1 << bit
+    return mask, unknown
+
+
+def from_mask(mask: int, registry: Sequence[str]) -> List[str]:
+    return [name for bit, name in enumerate(registry) if mask >> bit & 1]
+
+
+def mask_bits(mask: int) -> List[int]:
+    """0b1010 -> [1, 3]"""
+    bits, bit = [], 0
+    while mask:
+        if mask & 1:
+            bits.append(bit)
+        mask >>= 1
+        bit += 1
+    return bits
+
+
+class Profile:
+    """
+    80 bytes per profile (plus the cached small ints) instead of a dict with two lists of
+    strings. `extra` keeps rare fields without a slot and is None when empty.
+    """
+
+    __slots__ = ("gender", "age", "games", "servers", "custom_role_request", "extra")
+
+    def __init__(self, gender: int = 0, age: Optional[int] = None, games: int = 0, servers: int = 0,
+                 custom_role_request: Optional[str] = None, extra: Optional[Dict[str, Any]] = None):
+        self.gender = gender
+        self.age = age
+        self.games = games
+        self.servers = servers
+        self.custom_role_request = custom_role_request
+        self.extra = extra
+
+    # ---------- names <-> codes ----------
+    @property
+    def gender_label(self) -> Optional[str]:
+        return GENDERS[self.gender] if 0 <= self.gender < len(GENDERS) else None
+
+    def set_gender(self, label: Optional[str]) -> None:
+        self.gender = _GENDER_CODES.get(label, 0)
+
+    def game_names(self) -> List[str]:
+        return from_mask(self.games, DEFAULT_GAMES)
+
+    def set_games(self, names: Iterable[str]) -> None:
+        self.games, _ = to_mask(names, _GAME_BITS)
+
+    def server_names(self) -> List[str]:
+        return from_mask(self.servers, DEFAULT_SERVERS)
+
+    def set_servers(self, names: Iterable[str]) -> None:
+        self.servers, _ = to_mask(names, _SERVER_BITS)
+
+    # ---------- validation ----------
+    def check(self, repair: bool = False) -> List[str]:
+        """
+        Values the editor could not have produced (a code or bit outside the
+        registries, age out of range, ...). With `repair` they are reset in place.
+        """
+        problems = []
+        if not (isinstance(self.gender, int) and 0 <= self.gender < len(GENDERS)):
+            problems.append(f"gender code {self.gender}")
+            if repair:
+                self.gender = 0
+        if self.age is not None and not (isinstance(self.age, int) and MIN_AGE <= self.age <= MAX_AGE):
+            problems.append(f"age {self.age}")
+            if repair:
+                self.age = None
+        for field, registry in (("games", DEFAULT_GAMES), ("servers", DEFAULT_SERVERS)):
+            mask = getattr(self, field)
+            valid = (1 << len(registry)) - 1
+            if not isinstance(mask, int) or mask < 0 or mask & ~valid:
+                problems.append(f"{field} mask {mask!r}")
+                if repair:
+                    setattr(self, field, mask & valid if isinstance(mask, int) and mask >= 0 else 0)
+        if self.custom_role_request is not None and len(self.custom_role_request) > ROLE_NAME_MAX:
+            problems.append("custom_role_request too long")
+            if repair:
+                self.custom_role_request = self.custom_role_request[:ROLE_NAME_MAX]
+        return problems
+
+    # ---------- legacy dict format ----------
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Profile":
+        """Profile from the old dict format (profiles.json, JSON columns of schema v1)."""
+        games, unknown_games = to_mask(data.get("games") or [], _GAME_BITS)
+        servers, unknown_servers = to_mask(data.get("servers") or [], _SERVER_BITS)
+        extra = {k: v for k, v in data.items() if k not in _SLOT_KEYS}
+        # названия не из реестра не теряем
+        if unknown_games:
+            extra["games"] = unknown_games
+        if unknown_servers:
+            extra["servers"] = unknown_servers
+        age = data.get("age")
+        try:
+            age = int(age) if age is not None else None
+        except (TypeError, ValueError):
+            age = None
+        return cls(
+            gender=_GENDER_CODES.get(data.get("gender"), 0),
+            age=age,
+            games=games,
+            servers=servers,
+            custom_role_request=data.get("custom_role_request"),
+            extra=extra or None,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = dict(self.extra) if self.extra else {}
+        data.update({
+            "gender": self.gender_label,
+            "age": self.age,
+            "games": self.game_names() + (self.extra or {}).get("games", []),
+            "servers": self.server_names() + (self.extra or {}).get("servers", []),
+        })
+        if self.custom_role_request is not None:
+            data["custom_role_request"] = self.custom_role_request
+        return data
+
+    # ---------- SQLite row ----------
+    def to_row(self, user_id: int) -> Tuple:
+        extra = json.dumps(self.extra, ensure_ascii=False) if self.extra else None
+        return (user_id, self.gender, self.age, self.games, self.servers, self.custom_role_request, extra)
+
+    @classmethod
+    def from_row(cls, row: Tuple) -> "Profile":
+        gender, age, games, servers, custom_role_request, extra = row
+        return cls(gender, age, games, servers, custom_role_request, json.loads(extra) if extra else None)
+
+    def __repr__(self) -> str:
+        return (f"Profile(gender={self.gender_label!r}, age={self.age!r}, games={self.game_names()!r}, "
+                f"servers={self.server_names()!r})")
@@ -0,0 +1,460 @@
+""" <summary>
+Profile repository: SQLite is the source of truth, hot profiles live in
+a bounded LRU cache, changes are written back through WriteBehindQueue.
+</summary> """
+
+import asyncio
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.profile_model import Profile, mask_bits
+from utils.storage import run_db
+from utils.ttl_cache import TTLCache
+from utils.write_behind import WriteBehindQueue
+
+# 1 — JSON-колонки games/servers, 2 — целочисленные коды и битовые маски,
+# 3 — таблицы для поиска (/find), 4 — отметки о заполнении profile_guilds
+SCHEMA_VERSION = 4
+
+SQL_CREATE = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        gender INTEGER NOT NULL DEFAULT 0,
+        age INTEGER,
+        games INTEGER NOT NULL DEFAULT 0,
+        servers INTEGER NOT NULL DEFAULT 0,
+        custom_role_request TEXT,
+        extra TEXT
+    )
+"""
+
+# Search index: one row per (game|server, user), so "who plays X" is a range
+# scan of the primary key instead of a pass over every profile. Written
+# together with the profile row, in the same transaction.
+SQL_CREATE_SEARCH = """
+    CREATE TABLE IF NOT EXISTS profile_games (
+        game INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (game, user_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS profile_games_user ON profile_games (user_id);
+    CREATE TABLE IF NOT EXISTS profile_servers (
+        server INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (server, user_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS profile_servers_user ON profile_servers (user_id);
+    CREATE TABLE IF NOT EXISTS profile_guilds (
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (guild_id, user_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS profiles_age ON profiles (age);
+"""
+
+# guilds whose existing members were already written to profile_guilds
+# (profiles created before /find were never recorded per guild)
+SQL_CREATE_BACKFILLED = """
+    CREATE TABLE IF NOT EXISTS profile_guilds_backfilled (
+        guild_id INTEGER PRIMARY KEY
+    )
+"""
+
+# every table that holds profile data; the backfill marks go too, so the bot
+# refills profile_guilds from the member lists after the tables were emptied
+PROFILE_TABLES = ("profiles", "profile_games", "profile_servers", "profile_guilds", "profile_guilds_backfilled")
+
+# Constant SQL strings: sqlite3 caches compiled statements per connection,
+# so these are prepared once and reused.
+SQL_SELECT = "SELECT gender, age, games, servers, custom_role_request, extra FROM profiles WHERE id = ?"
+SQL_UPSERT = """
+    INSERT INTO profiles (id, gender, age, games, servers, custom_role_request, extra)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        gender=excluded.gender,
+        age=excluded.age,
+        games=excluded.games,
+        servers=excluded.servers,
+        custom_role_request=excluded.custom_role_request,
+        extra=excluded.extra
+"""
+SQL_DELETE_GAMES = "DELETE FROM profile_games WHERE user_id = ?"
+SQL_INSERT_GAME = "INSERT INTO profile_games (game, user_id) VALUES (?, ?)"
+SQL_DELETE_SERVERS = "DELETE FROM profile_servers WHERE user_id = ?"
+SQL_INSERT_SERVER = "INSERT INTO profile_servers (server, user_id) VALUES (?, ?)"
+SQL_ADD_MEMBER = "INSERT OR IGNORE INTO profile_guilds (guild_id, user_id) VALUES (?, ?)"
+SQL_REMOVE_MEMBER = "DELETE FROM profile_guilds WHERE guild_id = ? AND user_id = ?"
+# only members that have a profile get a row
+SQL_BACKFILL_MEMBERS = (
+    "INSERT OR IGNORE INTO profile_guilds (guild_id, user_id) "
+    "SELECT ?, id FROM profiles WHERE id IN (SELECT value FROM json_each(?))"
+)
+SQL_IS_BACKFILLED = "SELECT 1 FROM profile_guilds_backfilled WHERE guild_id = ?"
+SQL_MARK_BACKFILLED = "INSERT OR IGNORE INTO profile_guilds_backfilled (guild_id) VALUES (?)"
+# one statement for any number of IDs (a JSON array), instead of an IN (?, ?, ...) per size
+SQL_MEMBERS_OF = "SELECT user_id FROM profile_guilds WHERE guild_id = ? AND user_id IN (SELECT value FROM json_each(?))"
+
+
+def v1_row_to_dict(columns: List[str], row: Tuple) -> Dict[str, Any]:
+    """Row of the schema v1 table (JSON text columns) -> legacy dict profile."""
+    values = dict(zip(columns, row))
+    profile = json.loads(values["extra"]) if values.get("extra") else {}
+    profile.update({
+        "gender": values.get("gender"),
+        "age": values.get("age"),
+        "games": json.loads(values["games"]) if values.get("games") else [],
+        "servers": json.loads(values["servers"]) if values.get("servers") else [],
+    })
+    if values.get("custom_role_request") is not None:
+        profile["custom_role_request"] = values["custom_role_request"]
+    return profile
+
+
+def matches(profile: Profile, game: Optional[int], server: Optional[int],
+            min_age: Optional[int], max_age: Optional[int]) -> bool:
+    """The /find filters of ProfileRepository._search, on a profile in memory."""
+    if game is not None and not profile.games >> game & 1:
+        return False
+    if server is not None and not profile.servers >> server & 1:
+        return False
+    if min_age is not None and (profile.age is None or profile.age < min_age):
+        return False
+    if max_age is not None and (profile.age is None or profile.age > max_age):
+        return False
+    return True
+
+
+def load_legacy_profiles(json_path: str) -> Dict[str, Any]:
+    if not os.path.exists(json_path) or os.stat(json_path).st_size == 0:
+        return {}
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data if isinstance(data, dict) else {}
+
+
+class LRUCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: "OrderedDict[int, Profile]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: int) -> Optional[Profile]:
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def put(self, key: int, value: Profile) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class ProfileRepository:
+    def __init__(self, db_path: str, legacy_json_path: Optional[str] = None,
+                 cache_size: int = 5000, flush_interval: float = 5.0, flush_batch: int = 200,
+                 sync_interval: float = 0.0, member_cache_size: int = 10000):
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+        self.cache = LRUCache(cache_size)
+        # profiles changed but not yet written; never evicted before the flush
+        self._pending: Dict[int, Profile] = {}
+        # one long-lived connection, opened and used only on the storage db thread
+        self._conn: Optional[sqlite3.Connection] = None
+        self.queue = WriteBehindQueue(
+            getter=lambda uid: self._pending[uid],
+            flush=self._flush,
+            flush_interval=flush_interval,
+            max_batch=flush_batch,
+            name="profiles",
+        )
+        # several bot processes share the database: every `sync_interval` seconds
+        # check PRAGMA data_version and drop the cache if another process committed
+        self.sync_interval = sync_interval
+        self._data_version: Optional[int] = None
+        self._sync_task: Optional[asyncio.Task] = None
+        # (guild_id, user_id) recently recorded in profile_guilds: repeated /profile
+        # opens skip the write; a forgotten pair only costs an INSERT OR IGNORE
+        self._members = TTLCache(member_cache_size, ttl=24 * 3600, name="profile_members")
+
+    # ---------- lifecycle ----------
+    def _open(self) -> None:
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn = conn
+        self._migrate()
+
+    def _migrate(self) -> None:
+        conn = self._conn
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        with conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(profiles)")]
+            if not columns:
+                conn.execute(SQL_CREATE.format(table="profiles"))
+            elif version < 2:
+                # v0/v1 -> v2: JSON-колонки перекодируются в маски, таблица пересоздаётся
+                self._rebuild_v1(columns)
+
+            # one-time import of the legacy profiles.json (it was the source of truth)
+            imported = 0
+            if version < 1 and self.legacy_json_path:
+                legacy = load_legacy_profiles(self.legacy_json_path)
+                conn.executemany(SQL_UPSERT, [
+                    Profile.from_dict(profile).to_row(int(uid))
+                    for uid, profile in legacy.items()
+                    if str(uid).isdigit() and isinstance(profile, dict)
+                ])
+                imported = len(legacy)
+
+            if version < 3:
+                self._build_search_index()
+            if version < 4:
+                conn.execute(SQL_CREATE_BACKFILLED)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        if imported:
+            os.replace(self.legacy_json_path, self.legacy_json_path + ".migrated")
+            print(f"[Profile] Импортировано профилей из JSON: {imported}")
+
+    def _rebuild_v1(self, columns: List[str]) -> None:
+        # runs inside _migrate's transaction: a crash leaves the v1 table intact
+        conn = self._conn
+        conn.execute("DROP TABLE IF EXISTS profiles_v2")
+        conn.execute(SQL_CREATE.format(table="profiles_v2"))
+        rows = conn.execute(f"SELECT {', '.join(columns)} FROM profiles")
+        conn.executemany(
+            SQL_UPSERT.replace("INTO profiles ", "INTO profiles_v2 "),
+            (Profile.from_dict(v1_row_to_dict(columns, row)).to_row(row[columns.index("id")]) for row in rows.fetchall()),
+        )
+        conn.execute("DROP TABLE profiles")
+        conn.execute("ALTER TABLE profiles_v2 RENAME TO profiles")
+
+    def _build_search_index(self) -> None:
+        # executescript would commit the migration transaction halfway
+        for statement in SQL_CREATE_SEARCH.split(";"):
+            if statement.strip():
+                self._conn.execute(statement)
+        rows = self._conn.execute("SELECT id, games, servers FROM profiles").fetchall()
+        self._write_search_rows([(uid, 0, None, games, servers) for uid, games, servers in rows])
+
+    async def start(self) -> None:
+        await run_db(self._open)
+        self.queue.start()
+        if self.sync_interval > 0:
+            self._data_version = await run_db(self._read_data_version)
+            self._sync_task = asyncio.create_task(self._sync())
+
+    async def close(self) -> None:
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
+        await self.queue.close()
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await run_db(conn.close)
+
+    # ---------- synchronous access (offline tools: no event loop, no cache) ----------
+    def open_sync(self) -> None:
+        """Opens and migrates the database on the calling thread."""
+        self._open()
+
+    @property
+    def connection(self) -> Optional[sqlite3.Connection]:
+        return self._conn
+
+    def write_rows(self, rows: List[Tuple]) -> None:
+        """Profile.to_row() tuples and their search rows, in one transaction."""
+        self._write_rows(rows)
+
+    def delete_all_sync(self) -> None:
+        """Every profile with its search and guild rows, in one transaction."""
+        with self._conn:
+            for table in PROFILE_TABLES:
+                self._conn.execute(f"DELETE FROM {table}")
+
+    def close_sync(self) -> None:
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            conn.close()
+
+    def _read_data_version(self) -> int:
+        # changes only when *another* connection commits
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    async def _sync(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                version = await run_db(self._read_data_version)
+            except Exception as e:
+                print(f"[Profile] Ошибка проверки data_version: {e}")
+                continue
+            if version != self._data_version:
+                self._data_version = version
+                # unflushed local edits stay in _pending and still win
+                self.cache.clear()
+
+    # ---------- reads / writes ----------
+    def _select(self, user_id: int) -> Optional[Tuple]:
+        return self._conn.execute(SQL_SELECT, (user_id,)).fetchone()
+
+    def _write_rows(self, rows: List[Tuple]) -> None:
+        with self._conn:
+            self._conn.executemany(SQL_UPSERT, rows)
+            self._write_search_rows(rows)
+
+    def _write_search_rows(self, rows: List[Tuple]) -> None:
+        # rows are Profile.to_row() tuples: (id, gender, age, games, servers, ...)
+        conn = self._conn
+        ids = [(row[0],) for row in rows]
+        conn.executemany(SQL_DELETE_GAMES, ids)
+        conn.executemany(SQL_INSERT_GAME, [(bit, row[0]) for row in rows for bit in mask_bits(row[3])])
+        conn.executemany(SQL_DELETE_SERVERS, ids)
+        conn.executemany(SQL_INSERT_SERVER, [(bit, row[0]) for row in rows for bit in mask_bits(row[4])])
+
+    def _add_member(self, guild_id: int, user_id: int) -> None:
+        with self._conn:
+            self._conn.execute(SQL_ADD_MEMBER, (guild_id, user_id))
+
+    def _remove_member(self, guild_id: int, user_id: int) -> None:
+        with self._conn:
+            self._conn.execute(SQL_REMOVE_MEMBER, (guild_id, user_id))
+
+    def _is_backfilled(self, guild_id: int) -> bool:
+        return self._conn.execute(SQL_IS_BACKFILLED, (guild_id,)).fetchone() is not None
+
+    def _backfill(self, guild_id: int, user_ids: List[int], pending: List[int]) -> int:
+        with self._conn:
+            added = self._conn.execute(SQL_BACKFILL_MEMBERS, (guild_id, json.dumps(user_ids))).rowcount
+            # unflushed new profiles are not in the profiles table yet
+            added += self._conn.executemany(SQL_ADD_MEMBER, [(guild_id, uid) for uid in pending]).rowcount
+            self._conn.execute(SQL_MARK_BACKFILLED, (guild_id,))
+        return added
+
+    def _search(self, guild_id: int, game: Optional[int], server: Optional[int],
+                min_age: Optional[int], max_age: Optional[int], after: int, limit: int) -> List[Tuple]:
+        joins, join_params = [], []
+        if game is not None:
+            joins.append("JOIN profile_games pg ON pg.user_id = g.user_id AND pg.game = ?")
+            join_params.append(game)
+        if server is not None:
+            joins.append("JOIN profile_servers ps ON ps.user_id = g.user_id AND ps.server = ?")
+            join_params.append(server)
+        # keyset pagination: walks the (guild_id, user_id) key from `after`
+        # and stops after `limit` matches, so a page costs the same at any depth
+        where, where_params = ["g.guild_id = ?", "g.user_id > ?"], [guild_id, after]
+        if min_age is not None:
+            where.append("p.age >= ?")
+            where_params.append(min_age)
+        if max_age is not None:
+            where.append("p.age <= ?")
+            where_params.append(max_age)
+        # the statement text depends only on which filters are set: at most
+        # 16 variants, all of them stay in sqlite3's statement cache
+        sql = (
+            "SELECT p.id, p.gender, p.age, p.games, p.servers, p.custom_role_request, p.extra "
+            "FROM profile_guilds g " + " ".join(joins) + " JOIN profiles p ON p.id = g.user_id "
+            "WHERE " + " AND ".join(where) + " ORDER BY g.user_id LIMIT ?"
+        )
+        return self._conn.execute(sql, (*join_params, *where_params, limit)).fetchall()
+
+    def _members_of(self, guild_id: int, user_ids: List[int]) -> List[int]:
+        return [row[0] for row in self._conn.execute(SQL_MEMBERS_OF, (guild_id, json.dumps(user_ids)))]
+
+    def _cached(self, user_id: int) -> Optional[Profile]:
+        profile = self._pending.get(user_id)
+        if profile is None:
+            profile = self.cache.get(user_id)
+        return profile
+
+    async def get(self, user_id: int) -> Optional[Profile]:
+        profile = self._cached(user_id)
+        if profile is not None:
+            return profile
+        row = await run_db(self._select, user_id)
+        # a concurrent save() may have won the race while we were reading
+        profile = self._cached(user_id)
+        if profile is not None or row is None:
+            return profile
+        profile = Profile.from_row(row)
+        self.cache.put(user_id, profile)
+        return profile
+
+    async def get_or_create(self, user_id: int) -> Profile:
+        profile = await self.get(user_id)
+        if profile is None:
+            profile = Profile()
+            self.save(user_id, profile)
+        return profile
+
+    def save(self, user_id: int, profile: Profile) -> None:
+        self._pending[user_id] = profile
+        self.cache.put(user_id, profile)
+        self.queue.mark_dirty(user_id)
+
+    async def add_member(self, guild_id: int, user_id: int) -> None:
+        """Makes the profile visible to /find in this guild (profiles themselves are global)."""
+        key = (guild_id, user_id)
+        if self._members.get(key):
+            return
+        await run_db(self._add_member, guild_id, user_id)
+        self._members.put(key, True)
+
+    async def remove_member(self, guild_id: int, user_id: int) -> None:
+        """The member left the guild: their profile no longer shows up in its /find."""
+        self._members.pop((guild_id, user_id))
+        await run_db(self._remove_member, guild_id, user_id)
+
+    async def is_backfilled(self, guild_id: int) -> bool:
+        return await run_db(self._is_backfilled, guild_id)
+
+    async def backfill_members(self, guild_id: int, user_ids: List[int]) -> int:
+        """
+        One-time fill of profile_guilds from the guild's full member list;
+        returns how many rows were written. Later joins go through add_member.
+        """
+        pending = [uid for uid in user_ids if uid in self._pending]
+        return await run_db(self._backfill, guild_id, user_ids, pending)
+
+    async def search(self, guild_id: int, game: Optional[int] = None, server: Optional[int] = None,
+                     min_age: Optional[int] = None, max_age: Optional[int] = None,
+                     after: int = 0, limit: int = 10) -> List[Tuple[int, Profile]]:
+        """
+        Guild members whose profile matches, ordered by user ID, starting after
+        the user ID `after`. game/server are registry bits.
+        """
+        # Unflushed edits are not in the tables: the query reads them as they
+        # are and the pending profiles are re-checked in memory. Dropping a stale
+        # row can shorten the page, so one extra row is read per pending profile.
+        # (a snapshot: a flush may finish while the query runs)
+        pending = {uid: profile for uid, profile in self._pending.items() if uid > after}
+        rows = await run_db(self._search, guild_id, game, server, min_age, max_age, after, limit + len(pending))
+        found = {row[0]: self._cached(row[0]) or Profile.from_row(row[1:]) for row in rows if row[0] not in pending}
+        if pending:
+            for uid in await run_db(self._members_of, guild_id, list(pending)):
+                if matches(pending[uid], game, server, min_age, max_age):
+                    found[uid] = pending[uid]
+        return sorted(found.items())[:limit]
+
+    async def _flush(self, batch: Dict[int, Profile]) -> None:
+        # rows are built on the loop, so the thread never sees a half-edited profile
+        rows = [profile.to_row(uid) for uid, profile in batch.items()]
+        await run_db(self._write_rows, rows)
+        for uid in batch:
+            if uid not in self.queue:
+                self._pending.pop(uid, None)
@@ -0,0 +1,108 @@
+""" <summary>
+Helpers for running the bot as several processes: shard range parsing
+and a local file lock used to elect the one process that owns
+process-wide jobs (the Twitch poller) and to tell datatool.py that the
+bot is running.
+</summary> """
+
+import os
+from typing import List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# msvcrt has no shared locks: a shared holder locks one byte of its own
+# (at 1 + pid), an exclusive holder the whole span
+WINDOWS_LOCK_SPAN = 2 ** 31 - 1
+
+
+def parse_shard_ids(spec: str) -> List[int]:
+    """"0-3,6" -> [0, 1, 2, 3, 6]"""
+    ids: List[int] = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            ids.extend(range(int(first), int(last) + 1))
+        else:
+            ids.append(int(part))
+    return sorted(set(ids))
+
+
+def split_shards(shard_count: int, processes: int) -> List[List[int]]:
+    """Contiguous, as even as possible shard ranges, one per process."""
+    processes = max(1, min(processes, shard_count))
+    base, extra = divmod(shard_count, processes)
+    ranges, start = [], 0
+    for i in range(processes):
+        size = base + (1 if i < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+def format_shard_ids(ids: List[int]) -> str:
+    return f"{ids[0]}-{ids[-1]}" if ids == list(range(ids[0], ids[-1] + 1)) else ",".join(map(str, ids))
+
+
+class LeaderLock:
+    """
+    Non-blocking lock on a local file. The OS drops it when the holder exits
+    or crashes, so another process can take over by retrying. Shared holders
+    coexist with each other; an exclusive holder excludes all of them.
+    """
+
+    def __init__(self, path: str, shared: bool = False):
+        self.path = path
+        self.shared = shared
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def _windows_range(self) -> Tuple[int, int]:
+        return (1 + os.getpid(), 1) if self.shared else (0, WINDOWS_LOCK_SPAN)
+
+    def acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        lock_dir = os.path.dirname(self.path)
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            else:
+                offset, size = self._windows_range()
+                os.lseek(fd, offset, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, size)
+        except OSError:
+            os.close(fd)
+            return False
+        if not self.shared:
+            # для диагностики: кто держит лок
+            os.ftruncate(fd, 0)
+            os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                offset, size = self._windows_range()
+                os.lseek(fd, offset, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, size)
+        finally:
+            os.close(fd)
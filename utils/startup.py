@@ -0,0 +1,83 @@
+""" <summary>
+Startup helpers: sync application commands only when their payload changed
+and time the boot phases.
+</summary> """
+
+import hashlib
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+import discord
+from discord import app_commands
+
+from utils import storage
+
+COMMAND_HASH_FILE = "data/command_tree.json"
+
+
+def tree_hash(tree: app_commands.CommandTree, guild: Optional[discord.abc.Snowflake] = None) -> str:
+    """Stable hash of exactly what tree.sync(guild=...) would upload."""
+    payload = sorted(
+        (command.to_dict(tree) for command in tree.get_commands(guild=guild)),
+        key=lambda c: (c.get("type", 1), c["name"]),
+    )
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+async def sync_commands(tree: app_commands.CommandTree, application_id: int,
+                        dev_guild_id: Optional[int] = None, force: bool = False) -> bool:
+    """
+    Syncs global commands, or only `dev_guild_id` (instant, with the global commands
+    copied in) in dev mode. Skipped when the payload hash matches the last
+    successful sync for this application and scope. Returns True if it synced.
+    """
+    guild = discord.Object(id=dev_guild_id) if dev_guild_id else None
+    if guild is not None:
+        tree.copy_global_to(guild=guild)
+    scope = f"{application_id}:{dev_guild_id or 'global'}"
+    digest = tree_hash(tree, guild)
+
+    try:
+        hashes: Dict[str, str] = await storage.read_json(COMMAND_HASH_FILE, {})
+    except Exception:
+        hashes = {}
+    if not force and hashes.get(scope) == digest:
+        return False
+
+    await tree.sync(guild=guild)
+    hashes[scope] = digest
+    await storage.write_json(COMMAND_HASH_FILE, hashes)
+    return True
+
+
+class StartupTimer:
+    """Records named phase durations and prints them once as a single report."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases: List[Tuple[str, float]] = []
+        self.cogs: Dict[str, float] = {}  # extension -> load time
+        self.reported = False
+
+    def add(self, name: str, seconds: float) -> None:
+        """Phase measured by the caller, ending now."""
+        self.phases.append((name, seconds))
+        self._last = time.perf_counter()
+
+    def mark(self, name: str) -> None:
+        """Phase that ran from the previous mark (or start) until now."""
+        self.add(name, time.perf_counter() - self._last)
+
+    def report(self) -> None:
+        if self.reported:
+            return
+        self.reported = True
+        total = time.perf_counter() - self.started
+        parts = " ".join(f"{name}={seconds:.2f}s" for name, seconds in self.phases)
+        print(f"[Startup] {parts} total={total:.2f}s")
+        if self.cogs:
+            slowest = sorted(self.cogs.items(), key=lambda item: item[1], reverse=True)
+            print("[Startup] cogs: " + " ".join(f"{name}={seconds:.2f}s" for name, seconds in slowest))
@@ -0,0 +1,115 @@
+""" <summary>
+Async storage layer: blocking file and SQLite work runs on dedicated
+thread pools so the event loop (gateway heartbeats, other cogs) never waits on disk.
+</summary> """
+
+import asyncio
+import functools
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import IO, Any, Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+IO_WORKERS = int(os.getenv("STORAGE_IO_WORKERS", 4))
+
+# file I/O: small bounded pool
+_io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="storage-io")
+# SQLite: exactly one thread, so every connection is used from the thread
+# that opened it and writes are serialized without extra locks
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-db")
+
+
+async def run_io(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_executor, functools.partial(func, *args, **kwargs))
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
+
+
+# ---------- files ----------
+def fsync_dir(directory: str) -> None:
+    """Makes a rename in `directory` durable (no-op where directories can't be opened)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_open(path: str, backup: bool = False, fsync: bool = True) -> Iterator[IO[str]]:
+    """
+    Text file that replaces `path` only once it is completely written (temp
+    file in the same directory + rename): a crash or an exception mid-write
+    leaves the old file intact. With `fsync` the data reaches the disk before
+    the rename, and the rename before returning, so a power loss cannot leave
+    an empty file either. `backup` keeps the previous version as path.bak.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if backup and os.path.exists(path):
+            shutil.copy2(path, path + ".bak")
+        os.replace(tmp_path, path)
+        if fsync:
+            fsync_dir(directory)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def preserve_corrupt(path: str) -> str:
+    """Copy of a file that failed to parse, so the next save cannot destroy its data."""
+    copy_path = f"{path}.corrupt-{os.stat(path).st_mtime_ns}"
+    if not os.path.exists(copy_path):
+        shutil.copy2(path, copy_path)
+    return copy_path
+
+
+# ---------- JSON helpers ----------
+def _read_json(path: str, default: Any) -> Any:
+    if not os.path.exists(path) or os.stat(path).st_size == 0:
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path: str, data: Any) -> None:
+    with atomic_open(path) as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+async def read_json(path: str, default: Any = None) -> Any:
+    return await run_io(_read_json, path, default)
+
+
+async def write_json(path: str, data: Any) -> None:
+    # the caller passes a copy (or a value it no longer mutates)
+    await run_io(_write_json, path, data)
+
+
+def shutdown() -> None:
+    _io_executor.shutdown(wait=True)
+    _db_executor.shutdown(wait=True)
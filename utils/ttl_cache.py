@@ -0,0 +1,66 @@
+""" <summary>
+Bounded cache whose entries expire: LRU eviction by size, per-entry deadline
+by time, hit/miss counts in utils.metrics.
+</summary> """
+
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from utils import metrics
+
+
+class TTLCache:
+    """
+    Expired entries are dropped lazily on access, overflow evicts the least
+    recently used; no background task is needed.
+    """
+
+    def __init__(self, max_size: int, ttl: float, name: str = "cache"):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.name = name  # label of the lookup metric
+        # key -> (deadline on the monotonic clock, value)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, current: Optional[Callable[[Any], bool]] = None) -> Optional[Any]:
+        """`current` rejects an outdated value: counted as "stale", the entry stays until put()."""
+        entry = self._data.get(key)
+        if entry is None:
+            metrics.CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+            return None
+        deadline, value = entry
+        if deadline <= time.monotonic():
+            del self._data[key]
+            metrics.CACHE_LOOKUPS.inc(cache=self.name, result="expired")
+            return None
+        self._data.move_to_end(key)
+        if current is not None and not current(value):
+            metrics.CACHE_LOOKUPS.inc(cache=self.name, result="stale")
+            return None
+        metrics.CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+        return value
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """`ttl` overrides the default lifetime of this entry; <= 0 is not stored."""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            self._data.pop(key, None)
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        # least recently used first — usually the ones that have expired anyway
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            metrics.CACHE_EVICTIONS.inc(cache=self.name)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def clear(self) -> None:
+        self._data.clear()
+
@@ -0,0 +1,192 @@
+""" <summary>
+Durable Twitch monitor state (data/twitch.db), keyed by Twitch user ID:
+which streamers are live and their current stream ID, plus every
+notification message posted (per channel) with the hash of its last rendered embed.
+Lets a restart continue with a cheap diff.
+</summary> """
+
+import os
+import sqlite3
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from utils.storage import run_db
+from utils.write_behind import WriteBehindQueue
+
+TWITCH_DB_PATH = "./data/twitch.db"
+# 1: stream_posts per channel; 2: login -> user_id columns; 3: rows keyed by user ID
+SCHEMA_VERSION = 3
+
+# live, stream_id
+StreamRow = Tuple[bool, Optional[str]]
+# message_id, payload_hash
+PostRow = Tuple[Optional[int], Optional[str]]
+
+SQL_UPSERT_STREAM = """
+    INSERT INTO stream_state (user_id, live, stream_id) VALUES (?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET live=excluded.live, stream_id=excluded.stream_id
+"""
+SQL_DELETE_STREAM = "DELETE FROM stream_state WHERE user_id = ?"
+SQL_UPSERT_POST = """
+    INSERT INTO stream_posts (channel_id, user_id, message_id, payload_hash) VALUES (?, ?, ?, ?)
+    ON CONFLICT(channel_id, user_id) DO UPDATE SET
+        message_id=excluded.message_id,
+        payload_hash=excluded.payload_hash
+"""
+SQL_DELETE_POST = "DELETE FROM stream_posts WHERE channel_id = ? AND user_id = ?"
+
+
+class StreamStateStore:
+    """
+    Getters return the current row, or None when it should be deleted.
+    Changes go through a write-behind queue with a short interval, so a
+    tick's updates share one transaction.
+    """
+
+    def __init__(self, stream_getter: Callable[[str], Optional[StreamRow]],
+                 post_getter: Callable[[int, str], Optional[PostRow]],
+                 db_path: str = TWITCH_DB_PATH, legacy_channel_id: Optional[int] = None,
+                 flush_interval: float = 1.0):
+        self.db_path = db_path
+        # до мульти-гильдий все сообщения жили в одном канале
+        self.legacy_channel_id = legacy_channel_id
+        self._stream_getter = stream_getter
+        self._post_getter = post_getter
+        self._conn: Optional[sqlite3.Connection] = None
+        # строки из версий до 3 ещё адресованы логинами — см. rekey()
+        self.needs_rekey = False
+        self.queue = WriteBehindQueue(
+            getter=self._row, flush=self._flush, flush_interval=flush_interval, name="twitch_state"
+        )
+
+    def _row(self, key: Tuple) -> Any:
+        if key[0] == "stream":
+            return self._stream_getter(key[1])
+        return self._post_getter(key[1], key[2])
+
+    def _open(self) -> None:
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS stream_state (
+                user_id TEXT PRIMARY KEY,
+                live INTEGER NOT NULL DEFAULT 0,
+                stream_id TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS stream_posts (
+                channel_id INTEGER NOT NULL,
+                user_id TEXT NOT NULL,
+                message_id INTEGER,
+                payload_hash TEXT,
+                PRIMARY KEY (channel_id, user_id)
+            )
+        """)
+        self._conn = conn
+        self._migrate()
+
+    def _read(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[Tuple[int, str], Dict[str, Any]]]:
+        conn = self._conn
+        streams = {
+            user_id: {"live": bool(live), "stream_id": stream_id}
+            for user_id, live, stream_id in conn.execute("SELECT user_id, live, stream_id FROM stream_state")
+        }
+        posts = {
+            (channel_id, user_id): {"message_id": message_id, "payload_hash": payload_hash}
+            for channel_id, user_id, message_id, payload_hash in conn.execute(
+                "SELECT channel_id, user_id, message_id, payload_hash FROM stream_posts"
+            )
+        }
+        return streams, posts
+
+    def _migrate(self) -> None:
+        conn = self._conn
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        with conn:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(stream_state)")}
+            # v0 держал message_id/payload_hash прямо в stream_state (один канал)
+            if version < 1 and "message_id" in columns and self.legacy_channel_id:
+                conn.execute("""
+                    INSERT OR IGNORE INTO stream_posts (channel_id, user_id, message_id, payload_hash)
+                    SELECT ?, login, message_id, payload_hash FROM stream_state WHERE message_id IS NOT NULL
+                """, (self.legacy_channel_id,))
+            if "login" in columns:
+                conn.execute("ALTER TABLE stream_state RENAME COLUMN login TO user_id")
+            if "login" in {row[1] for row in conn.execute("PRAGMA table_info(stream_posts)")}:
+                conn.execute("ALTER TABLE stream_posts RENAME COLUMN login TO user_id")
+
+            has_rows = conn.execute(
+                "SELECT EXISTS(SELECT 1 FROM stream_state) OR EXISTS(SELECT 1 FROM stream_posts)"
+            ).fetchone()[0]
+            self.needs_rekey = bool(has_rows)
+            conn.execute(f"PRAGMA user_version = {2 if has_rows else SCHEMA_VERSION}")
+
+    def _rekey(self, mapping: Dict[str, str]) -> None:
+        with self._conn:
+            for login, user_id in mapping.items():
+                self._conn.execute("UPDATE OR REPLACE stream_state SET user_id = ? WHERE user_id = ?", (user_id, login))
+                self._conn.execute("UPDATE OR REPLACE stream_posts SET user_id = ? WHERE user_id = ?", (user_id, login))
+            # логины, которых больше нет на Twitch
+            legacy = [login for login in self._legacy_keys() if login not in mapping]
+            self._conn.executemany("DELETE FROM stream_state WHERE user_id = ?", [(k,) for k in legacy])
+            self._conn.executemany("DELETE FROM stream_posts WHERE user_id = ?", [(k,) for k in legacy])
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _legacy_keys(self) -> List[str]:
+        rows = self._conn.execute("SELECT user_id FROM stream_state UNION SELECT user_id FROM stream_posts")
+        return [row[0] for row in rows if not str(row[0]).isdigit()]
+
+    async def rekey(self, mapping: Dict[str, str]) -> None:
+        """One-time move of rows written before v3 from login keys to user IDs."""
+        await self.queue.flush()
+        await run_db(self._rekey, mapping)
+        self.needs_rekey = False
+
+    async def load(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[Tuple[int, str], Dict[str, Any]]]:
+        await run_db(self._open)
+        self.queue.start()
+        return await self.read()
+
+    async def read(self) -> Tuple[Dict[str, Dict[str, Any]], Dict[Tuple[int, str], Dict[str, Any]]]:
+        """(user_id -> stream row, (channel_id, user_id) -> post row)"""
+        return await run_db(self._read)
+
+    async def close(self) -> None:
+        await self.queue.close()
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await run_db(conn.close)
+
+    def mark_stream(self, user_id: str) -> None:
+        self.queue.mark_dirty(("stream", user_id))
+
+    def mark_post(self, channel_id: int, user_id: str) -> None:
+        self.queue.mark_dirty(("post", channel_id, user_id))
+
+    def _write(self, batch: Dict[Hashable, Any]) -> None:
+        upsert_streams, delete_streams, upsert_posts, delete_posts = [], [], [], []
+        for key, row in batch.items():
+            if key[0] == "stream":
+                if row is None:
+                    delete_streams.append((key[1],))
+                else:
+                    upsert_streams.append((key[1], int(row[0]), row[1]))
+            else:
+                if row is None:
+                    delete_posts.append((key[1], key[2]))
+                else:
+                    upsert_posts.append((key[1], key[2], row[0], row[1]))
+        with self._conn:
+            self._conn.executemany(SQL_UPSERT_STREAM, upsert_streams)
+            self._conn.executemany(SQL_DELETE_STREAM, delete_streams)
+            self._conn.executemany(SQL_UPSERT_POST, upsert_posts)
+            self._conn.executemany(SQL_DELETE_POST, delete_posts)
+
+    async def _flush(self, batch: Dict[Hashable, Any]) -> None:
+        await run_db(self._write, batch)
@@ -0,0 +1,169 @@
+""" <summary>
+Cache of Twitch user records (login, display name, avatar) keyed by the
+immutable user ID: kept in memory, persisted to data/twitch.db and
+refreshed in bulk once older than TWITCH_USER_TTL. Only watched streamers
+are kept: the cog drops the rest with retain().
+</summary> """
+
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from utils.helix import HelixClient
+from utils.storage import run_db
+from utils.twitch_state import TWITCH_DB_PATH
+
+USER_TTL = float(os.getenv("TWITCH_USER_TTL", 24 * 3600))
+
+SQL_UPSERT = """
+    INSERT INTO twitch_users (id, login, display_name, profile_image_url, fetched_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        login=excluded.login,
+        display_name=excluded.display_name,
+        profile_image_url=excluded.profile_image_url,
+        fetched_at=excluded.fetched_at
+"""
+SQL_DELETE = "DELETE FROM twitch_users WHERE id = ?"
+
+
+class TwitchUserCache:
+    def __init__(self, helix: HelixClient, db_path: str = TWITCH_DB_PATH, ttl: float = USER_TTL):
+        self.helix = helix
+        self.db_path = db_path
+        self.ttl = ttl
+        self.users: Dict[str, Dict[str, Any]] = {}  # id -> record
+        self._by_login: Dict[str, str] = {}  # login -> id
+        # ID, которых Twitch не вернул (удалённые/забаненные каналы): не спрашиваем до конца TTL
+        self._unknown: Dict[str, float] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _open(self) -> List[Dict[str, Any]]:
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS twitch_users (
+                id TEXT PRIMARY KEY,
+                login TEXT NOT NULL,
+                display_name TEXT,
+                profile_image_url TEXT,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+        self._conn = conn
+        keys = ("id", "login", "display_name", "profile_image_url", "fetched_at")
+        return [dict(zip(keys, row)) for row in conn.execute(f"SELECT {', '.join(keys)} FROM twitch_users")]
+
+    async def load(self) -> None:
+        for record in await run_db(self._open):
+            self._remember(record)
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await run_db(conn.close)
+
+    def _remember(self, record: Dict[str, Any]) -> None:
+        old = self.users.get(record["id"])
+        if old is not None and self._by_login.get(old["login"]) == record["id"]:
+            del self._by_login[old["login"]]  # канал переименовали
+        self.users[record["id"]] = record
+        self._by_login[record["login"]] = record["id"]
+
+    def _forget(self, user_id: str) -> None:
+        record = self.users.pop(user_id)
+        if self._by_login.get(record["login"]) == user_id:
+            del self._by_login[record["login"]]
+
+    def _delete(self, user_ids: List[str]) -> None:
+        with self._conn:
+            self._conn.executemany(SQL_DELETE, [(user_id,) for user_id in user_ids])
+
+    async def retain(self, user_ids: Set[str]) -> None:
+        """
+        Drops the records (memory and twitch.db) of everyone not in `user_ids`:
+        logins looked up by /twitch_add but never added, or removed since.
+        """
+        dropped = [user_id for user_id in self.users if user_id not in user_ids]
+        for user_id in dropped:
+            self._forget(user_id)
+        for user_id in [user_id for user_id in self._unknown if user_id not in user_ids]:
+            del self._unknown[user_id]
+        if dropped and self._conn is not None:
+            await run_db(self._delete, dropped)
+
+    def _write(self, records: List[Dict[str, Any]]) -> None:
+        with self._conn:
+            self._conn.executemany(SQL_UPSERT, [
+                (r["id"], r["login"], r["display_name"], r["profile_image_url"], r["fetched_at"]) for r in records
+            ])
+
+    async def _store(self, raw_users: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        now = time.time()
+        records = [
+            {
+                "id": str(u["id"]),
+                "login": str(u["login"]).lower(),
+                "display_name": u.get("display_name") or u["login"],
+                "profile_image_url": u.get("profile_image_url"),
+                "fetched_at": now,
+            }
+            for u in raw_users
+        ]
+        for record in records:
+            self._remember(record)
+        if records and self._conn is not None:
+            await run_db(self._write, records)
+        return records
+
+    def _fresh(self, record: Optional[Dict[str, Any]]) -> bool:
+        return record is not None and time.time() - record["fetched_at"] < self.ttl
+
+    # ---------- lookups ----------
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Cached record, possibly stale; never calls the API."""
+        return self.users.get(user_id)
+
+    def login_of(self, user_id: str) -> str:
+        record = self.users.get(user_id)
+        return record["login"] if record else user_id
+
+    def display_name_of(self, user_id: str) -> str:
+        record = self.users.get(user_id)
+        return record["display_name"] if record else user_id
+
+    async def get_by_logins(self, logins: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """login -> record; only missing or stale logins hit the API (in 100-login batches)."""
+        logins = [login.lower() for login in logins]
+        missing = [login for login in logins if not self._fresh(self.users.get(self._by_login.get(login, "")))]
+        if missing:
+            await self._store(await self.helix.get_users(logins=missing))
+        result = {}
+        for login in logins:
+            user_id = self._by_login.get(login)
+            if user_id is not None:
+                result[login] = self.users[user_id]
+        return result
+
+    async def get_by_login(self, login: str) -> Optional[Dict[str, Any]]:
+        return (await self.get_by_logins([login])).get(login.lower())
+
+    async def refresh(self, user_ids: Iterable[str]) -> None:
+        """Re-fetch records that are missing or older than the TTL, 100 IDs per request."""
+        now = time.time()
+        stale = [
+            user_id for user_id in user_ids
+            if not self._fresh(self.users.get(user_id)) and now - self._unknown.get(user_id, 0) >= self.ttl
+        ]
+        if not stale:
+            return
+        found = {record["id"] for record in await self._store(await self.helix.get_users(user_ids=stale))}
+        for user_id in stale:
+            if user_id in found:
+                self._unknown.pop(user_id, None)
+            else:
+                self._unknown[user_id] = now
@@ -0,0 +1,293 @@
+""" <summary>
+Personal voice room lifecycle: one queue and worker per guild, rooms created
+with their permissions in a single call, empty rooms released after a grace
+period and a small pool of hidden pre-created rooms handed out on join.
+Managed rooms are known by ID from an index persisted to data/voice_rooms.json
+(a journaled file: a change appends one guild's entry, see utils/durable.py).
+</summary> """
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+import discord
+
+from utils import storage
+from utils.durable import DurableDict
+from utils.write_behind import WriteBehindQueue
+
+VOICE_INDEX_FILE = "data/voice_rooms.json"
+
+ROOM_SUFFIX = "'s Personal Room"
+POOL_ROOM_NAME = "Personal Room (free)"
+
+# Discord allows 2 renames of a channel per 10 minutes
+RENAME_LIMIT = 2
+RENAME_WINDOW = 600.0
+
+
+def room_name(member: discord.Member) -> str:
+    return f"{member.name}{ROOM_SUFFIX}"
+
+
+def category_overwrites(category: Optional[discord.CategoryChannel]) -> Dict[discord.abc.Snowflake, discord.PermissionOverwrite]:
+    # явные overwrites отключают наследование: права категории лобби переносятся в комнату сами
+    return dict(category.overwrites) if category is not None else {}
+
+
+def owner_overwrites(member: discord.Member,
+                     category: Optional[discord.CategoryChannel] = None) -> Dict[discord.abc.Snowflake, discord.PermissionOverwrite]:
+    overwrites = category_overwrites(category)
+    overwrites[member] = discord.PermissionOverwrite(connect=True, view_channel=True)
+    return overwrites
+
+
+def pool_overwrites(guild: discord.Guild,
+                    category: Optional[discord.CategoryChannel] = None) -> Dict[discord.abc.Snowflake, discord.PermissionOverwrite]:
+    # свободные комнаты скрыты от всех, кроме бота — в том числе от ролей, которым категория открыта
+    overwrites = {}
+    for target, overwrite in category_overwrites(category).items():
+        hidden = discord.PermissionOverwrite.from_pair(*overwrite.pair())
+        hidden.view_channel = False
+        overwrites[target] = hidden
+    default = overwrites.get(guild.default_role) or discord.PermissionOverwrite()
+    default.view_channel = False
+    overwrites[guild.default_role] = default
+    overwrites[guild.me] = discord.PermissionOverwrite(view_channel=True, connect=True, manage_channels=True)
+    return overwrites
+
+
+class GuildRooms:
+    """Rooms and work queue of one guild; only its worker touches Discord."""
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.queue: "asyncio.Queue[Tuple]" = asyncio.Queue()
+        self.worker: Optional[asyncio.Task] = None
+        self.owners: Dict[int, int] = {}  # member_id -> room_id
+        self.rooms: Dict[int, int] = {}  # room_id -> member_id
+        self.pool: List[int] = []  # свободные room_id
+        self.warmed = False
+        self.releases: Dict[int, asyncio.TimerHandle] = {}  # room_id -> отложенное освобождение
+        self.renames: Dict[int, Deque[float]] = {}  # room_id -> времена переименований
+
+
+class RoomManager:
+    def __init__(self, get_guild: Callable[[int], Optional[discord.Guild]], pool_size: int = 2,
+                 grace: float = 30.0, index_path: str = VOICE_INDEX_FILE):
+        self.get_guild = get_guild
+        self.pool_size = pool_size
+        self.grace = grace
+        self.index_path = index_path
+        self.guilds: Dict[int, GuildRooms] = {}
+        # ключ — гильдия: частые изменения гильдии сливаются в одну запись журнала
+        self.store = DurableDict(index_path)
+        self.index = WriteBehindQueue(
+            getter=self._entry, flush=self._save, flush_interval=1.0, name="voice_rooms"
+        )
+
+    def _state(self, guild: discord.Guild) -> GuildRooms:
+        state = self.guilds.get(guild.id)
+        if state is None:
+            state = self.guilds[guild.id] = GuildRooms(guild.id)
+        if state.worker is None or state.worker.done():
+            state.worker = asyncio.create_task(self._work(guild.id, state))
+        return state
+
+    async def close(self) -> None:
+        for state in self.guilds.values():
+            for handle in state.releases.values():
+                handle.cancel()
+            state.releases.clear()
+            if state.worker is not None:
+                state.worker.cancel()
+        await self.index.close()
+
+    def is_room(self, channel: discord.abc.GuildChannel) -> bool:
+        state = self.guilds.get(channel.guild.id)
+        return state is not None and (channel.id in state.rooms or channel.id in state.pool)
+
+    # ---------- index ----------
+    # voice_rooms.json: {"<guild_id>": {"rooms": {"<room_id>": owner_id}, "pool": [room_id, ...]}}
+    async def load(self) -> None:
+        try:
+            raw = await self.store.load()
+        except ValueError as e:
+            # снимок не читается: копия в сторону, дальше — то, что есть в журнале
+            copy_path = await storage.run_io(storage.preserve_corrupt, self.index_path)
+            print(f"[Voice] {self.index_path} повреждён ({e}), копия сохранена в {copy_path}")
+            raw = await self.store.reset()
+        except Exception as e:
+            print(f"[Voice] Не удалось прочитать {self.index_path}: {e}")
+            raw = {}
+        for guild_id, entry in raw.items():
+            state = self.guilds.setdefault(int(guild_id), GuildRooms(int(guild_id)))
+            for room_id, owner_id in entry.get("rooms", {}).items():
+                state.rooms[int(room_id)] = owner_id
+                state.owners[owner_id] = int(room_id)
+            state.pool = [int(room_id) for room_id in entry.get("pool", [])]
+        self.index.start()
+
+    def _entry(self, guild_id: Hashable) -> Optional[Dict[str, Any]]:
+        state = self.guilds.get(guild_id)
+        if state is None or not (state.rooms or state.pool):
+            return None  # гильдия без комнат удаляется из индекса
+        return {"rooms": {str(r): o for r, o in state.rooms.items()}, "pool": list(state.pool)}
+
+    async def _save(self, batch: Dict[Hashable, Any]) -> None:
+        await self.store.update(batch)
+
+    def _changed(self, state: GuildRooms) -> None:
+        self.index.mark_dirty(state.guild_id)
+
+    def reconcile(self) -> None:
+        """Sync the index with the guilds after (re)connecting: drop rooms deleted while
+        the bot was offline and release the ones left empty, e.g. after a crash."""
+        for guild_id, state in list(self.guilds.items()):
+            guild = self.get_guild(guild_id)
+            if guild is None:
+                continue  # гильдия недоступна (или на другом шарде) — индекс не трогаем
+            for room_id in list(state.rooms):
+                room = guild.get_channel(room_id)
+                if room is None:
+                    self._forget(state, room_id)
+                elif not room.members:
+                    self.room_left(room)
+            state.pool = [room_id for room_id in state.pool if guild.get_channel(room_id) is not None]
+            for room_id in state.pool[self.pool_size:]:
+                # лишние свободные комнаты (уменьшили VOICE_POOL_SIZE)
+                self._state(guild).queue.put_nowait(("release", room_id))
+            self._changed(state)
+
+    # ---------- events (called from the listener, never block) ----------
+    def request_room(self, member: discord.Member, hub: discord.VoiceChannel) -> None:
+        self._state(member.guild).queue.put_nowait(("join", member.id, hub.id))
+
+    def room_joined(self, channel: discord.VoiceChannel) -> None:
+        state = self.guilds.get(channel.guild.id)
+        handle = state.releases.pop(channel.id, None) if state else None
+        if handle is not None:
+            handle.cancel()  # вернулись до истечения grace — комнату не трогаем
+
+    def room_left(self, channel: discord.VoiceChannel) -> None:
+        if channel.members:
+            return
+        state = self._state(channel.guild)
+        if channel.id in state.releases or channel.id in state.pool:
+            return
+        loop = asyncio.get_running_loop()
+        state.releases[channel.id] = loop.call_later(
+            self.grace, state.queue.put_nowait, ("release", channel.id)
+        )
+
+    # ---------- worker ----------
+    async def _work(self, guild_id: int, state: GuildRooms) -> None:
+        while True:
+            op = await state.queue.get()
+            guild = self.get_guild(guild_id)
+            if guild is None:
+                continue
+            try:
+                if op[0] == "join":
+                    await self._join(guild, state, op[1], op[2])
+                elif op[0] == "release":
+                    state.releases.pop(op[1], None)
+                    await self._release(guild, state, op[1])
+                elif op[0] == "warm":
+                    await self._warm(guild, state, op[1])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Voice] Ошибка {op[0]} в гильдии {guild_id}: {e}")
+
+    def _can_rename(self, state: GuildRooms, room_id: int) -> bool:
+        stamps = state.renames.get(room_id)
+        if not stamps:
+            return True
+        now = time.monotonic()
+        while stamps and now - stamps[0] > RENAME_WINDOW:
+            stamps.popleft()
+        return len(stamps) < RENAME_LIMIT
+
+    def _renamed(self, state: GuildRooms, room_id: int) -> None:
+        state.renames.setdefault(room_id, deque(maxlen=RENAME_LIMIT)).append(time.monotonic())
+
+    def _forget(self, state: GuildRooms, room_id: int) -> None:
+        owner_id = state.rooms.pop(room_id, None)
+        if owner_id is not None and state.owners.get(owner_id) == room_id:
+            del state.owners[owner_id]
+        if room_id in state.pool:
+            state.pool.remove(room_id)
+        self._changed(state)
+
+    async def _join(self, guild: discord.Guild, state: GuildRooms, member_id: int, hub_id: int) -> None:
+        member = guild.get_member(member_id)
+        hub = guild.get_channel(hub_id)
+        # заявки копятся в очереди: пользователь мог уже уйти из лобби
+        if member is None or hub is None or member.voice is None or member.voice.channel != hub:
+            return
+
+        room = guild.get_channel(state.owners.get(member_id, 0))
+        if room is None:
+            room = await self._take_pooled(guild, state, member, hub)
+        if room is None:
+            room = await guild.create_voice_channel(
+                name=room_name(member), category=hub.category, overwrites=owner_overwrites(member, hub.category)
+            )
+        state.rooms[room.id] = member_id
+        state.owners[member_id] = room.id
+        self._changed(state)
+        self.room_joined(room)
+        await member.move_to(room)
+
+        if not state.warmed or len(state.pool) < self.pool_size:
+            state.queue.put_nowait(("warm", hub_id))
+
+    async def _take_pooled(self, guild: discord.Guild, state: GuildRooms, member: discord.Member,
+                           hub: discord.VoiceChannel) -> Optional[discord.VoiceChannel]:
+        for room_id in list(state.pool):
+            room = guild.get_channel(room_id)
+            if room is None:
+                state.pool.remove(room_id)
+                continue
+            if not self._can_rename(state, room_id):
+                continue
+            state.pool.remove(room_id)
+            self._changed(state)
+            # имя и права — одним запросом
+            await room.edit(name=room_name(member), overwrites=owner_overwrites(member, hub.category), category=hub.category)
+            self._renamed(state, room_id)
+            return room
+        return None
+
+    async def _release(self, guild: discord.Guild, state: GuildRooms, room_id: int) -> None:
+        room = guild.get_channel(room_id)
+        if room is None:
+            self._forget(state, room_id)
+            state.renames.pop(room_id, None)
+            return
+        if room.members:
+            return  # пока ждали grace, в комнату вернулись
+        known = room_id in state.rooms
+        self._forget(state, room_id)
+        if known and len(state.pool) < self.pool_size and self._can_rename(state, room_id):
+            await room.edit(name=POOL_ROOM_NAME, overwrites=pool_overwrites(guild, room.category))
+            self._renamed(state, room_id)
+            state.pool.append(room_id)
+            self._changed(state)
+        else:
+            state.renames.pop(room_id, None)
+            await room.delete()
+
+    async def _warm(self, guild: discord.Guild, state: GuildRooms, hub_id: int) -> None:
+        hub = guild.get_channel(hub_id)
+        if hub is None:
+            return
+        state.warmed = True
+        while len(state.pool) < self.pool_size:
+            room = await guild.create_voice_channel(
+                name=POOL_ROOM_NAME, category=hub.category, overwrites=pool_overwrites(guild, hub.category)
+            )
+            state.pool.append(room.id)
+            self._changed(state)
@@ -0,0 +1,111 @@
+""" <summary>
+Welcome queue: joins are greeted by one worker per guild that sends at most
+one message per window. A lone join is greeted at once; a burst of joins is
+folded into a few messages that mention many members each.
+</summary> """
+
+import asyncio
+import itertools
+from typing import Callable, Dict, List, Optional
+
+import discord
+
+from utils import metrics
+
+# сообщение — до 2000 символов, упоминание — до 22
+MAX_MENTIONS = 50
+
+WELCOME_MENTIONS = discord.AllowedMentions(everyone=False, roles=False, users=True)
+
+
+def welcome_text(user_ids: List[int]) -> str:
+    return f"Добро пожаловать, {', '.join(f'<@{user_id}>' for user_id in user_ids)}! 🎉"
+
+
+class GuildJoins:
+    def __init__(self):
+        self.pending: Dict[int, None] = {}  # user_id, in join order (dict: O(1) removal on leave)
+        self.wakeup = asyncio.Event()
+        self.worker: Optional[asyncio.Task] = None
+
+
+class WelcomeQueue:
+    """
+    After each message the worker waits `window` seconds, so joins arriving
+    meanwhile go out together in the next one: during a raid the channel gets
+    one message per window instead of one per member. Each guild holds at most
+    `max_pending` members; later joins are dropped and counted.
+    """
+
+    def __init__(self, get_guild: Callable[[int], Optional[discord.Guild]], channel_id: int,
+                 window: float = 2.0, max_pending: int = 1000, max_mentions: int = MAX_MENTIONS):
+        self.get_guild = get_guild
+        self.channel_id = channel_id
+        self.window = window
+        self.max_pending = max_pending
+        self.max_mentions = max_mentions
+        self.guilds: Dict[int, GuildJoins] = {}
+
+    @property
+    def depth(self) -> int:
+        return sum(len(state.pending) for state in self.guilds.values())
+
+    def add(self, member: discord.Member) -> None:
+        if member.guild.get_channel(self.channel_id) is None:
+            return  # в этой гильдии нет канала приветствий
+        state = self.guilds.get(member.guild.id)
+        if state is None:
+            state = self.guilds[member.guild.id] = GuildJoins()
+        if member.id in state.pending:
+            return
+        if len(state.pending) >= self.max_pending:
+            metrics.WELCOME_DROPPED.inc(reason="overflow")
+            return
+        state.pending[member.id] = None
+        metrics.WELCOME_QUEUE_DEPTH.inc()
+        if state.worker is None or state.worker.done():
+            state.worker = asyncio.create_task(self._work(member.guild.id, state))
+        state.wakeup.set()
+
+    def discard(self, guild_id: int, user_id: int) -> None:
+        """The member left before being greeted."""
+        state = self.guilds.get(guild_id)
+        if state is not None and state.pending.pop(user_id, 0) is None:
+            metrics.WELCOME_QUEUE_DEPTH.dec()
+            metrics.WELCOME_DROPPED.inc(reason="left")
+
+    async def close(self) -> None:
+        for state in self.guilds.values():
+            if state.worker is not None:
+                state.worker.cancel()
+            if state.pending:
+                metrics.WELCOME_QUEUE_DEPTH.dec(len(state.pending))
+                metrics.WELCOME_DROPPED.inc(len(state.pending), reason="shutdown")
+        self.guilds.clear()
+
+    async def _work(self, guild_id: int, state: GuildJoins) -> None:
+        while True:
+            await state.wakeup.wait()
+            state.wakeup.clear()
+            while state.pending:
+                batch = list(itertools.islice(state.pending, self.max_mentions))
+                for user_id in batch:
+                    del state.pending[user_id]
+                metrics.WELCOME_QUEUE_DEPTH.dec(len(batch))
+                await self._send(guild_id, batch)
+                # не чаще одного сообщения за окно: новые заходы копятся в следующую пачку
+                await asyncio.sleep(self.window)
+
+    async def _send(self, guild_id: int, user_ids: List[int]) -> None:
+        guild = self.get_guild(guild_id)
+        channel = guild.get_channel(self.channel_id) if guild is not None else None
+        if channel is None:
+            metrics.WELCOME_DROPPED.inc(len(user_ids), reason="no_channel")
+            return
+        try:
+            await channel.send(welcome_text(user_ids), allowed_mentions=WELCOME_MENTIONS)
+            metrics.WELCOME_MESSAGES.inc(kind="single" if len(user_ids) == 1 else "batch")
+        except Exception as e:
+            metrics.WELCOME_DROPPED.inc(len(user_ids), reason="error")
+            metrics.ERRORS.inc(source="welcome")
+            print(f"[Welcome] Не удалось отправить приветствие: {e}")
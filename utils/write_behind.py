@@ -0,0 +1,90 @@
+""" <summary>
+Write-behind queue: collects dirty keys and flushes them in batches
+from a background task, so callers never wait for disk I/O.
+</summary> """
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from utils import metrics
+
+FlushCallback = Callable[[Dict[Hashable, Any]], Awaitable[None]]
+
+
+class WriteBehindQueue:
+    """
+    mark_dirty() only records the key; repeated changes of one key between
+    flushes are coalesced into a single write. A flush happens every
+    `flush_interval` seconds, as soon as `max_batch` keys are pending,
+    and once more on close().
+    """
+
+    def __init__(self, getter: Callable[[Hashable], Any], flush: FlushCallback,
+                 flush_interval: float = 5.0, max_batch: int = 200, name: str = "queue"):
+        self.name = name  # label of the flush latency metric
+        self._getter = getter
+        self._flush = flush
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._dirty: Dict[Hashable, None] = {}  # dict keeps insertion order
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._dirty
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def mark_dirty(self, key: Hashable) -> None:
+        self._dirty[key] = None
+        if len(self._dirty) >= self.max_batch:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # ключи остаются грязными и уйдут со следующим флашем
+                metrics.ERRORS.inc(source=f"flush_{self.name}")
+                print(f"[WriteBehind] Ошибка записи ({self.name}): {e}")
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            keys = list(self._dirty)
+            self._dirty.clear()
+            batch = {key: self._getter(key) for key in keys}
+            try:
+                with metrics.STORAGE_FLUSH_SECONDS.time(queue=self.name):
+                    await self._flush(batch)
+            except BaseException:
+                # вернуть ключи, не перетирая более свежие отметки
+                for key in keys:
+                    self._dirty.setdefault(key, None)
+                raise
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()